@@ -92,13 +92,8 @@ def main(final_time=1, write_output=False):
                 bc_inflow=sinewave, bc_outflow=sinewave, bc_noslip=sinewave,
                 inflow_tag=TAG_ALL, source=None)
 
-        euler_ex = op.bind(discr)
-
-        max_eigval = [0]
-        def rhs(t, q):
-            ode_rhs, speed = euler_ex(t, q)
-            max_eigval[0] = speed
-            return ode_rhs
+        from hedge.timestep import SideOutputRecorder
+        rhs = SideOutputRecorder(op.bind(discr, elementwise_speed=True))
         rhs(0, fields)
 
         if rcon.is_head_rank:
@@ -134,7 +129,7 @@ def main(final_time=1, write_output=False):
             step_it = times_and_steps(
                     final_time=final_time, logmgr=logmgr,
                     max_dt_getter=lambda t: op.estimate_timestep(discr,
-                        stepper=stepper, t=t, max_eigenvalue=max_eigval[0]))
+                        stepper=stepper, t=t, speed=rhs.side_output))
 
             for step, t, dt in step_it:
                 #if step % 10 == 0:
@@ -0,0 +1,104 @@
+# Hedge - the Hybrid'n'Easy DG Environment
+# Copyright (C) 2007 Andreas Kloeckner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+
+from __future__ import division
+import numpy
+import numpy.linalg as la
+
+
+
+
+def main(orders=[5, 3, 1], tol=1e-8):
+    """Compare iteration counts and time to solution of CG on the
+    Poisson problem without preconditioning, with block Jacobi and
+    with a p-multigrid V-cycle.
+    """
+    from hedge.data import ConstantGivenFunction
+
+    from hedge.backends import guess_run_context
+    rcon = guess_run_context()
+
+    if rcon.is_head_rank:
+        from hedge.mesh.generator import make_disk_mesh
+        mesh = make_disk_mesh(r=0.5, max_area=1e-2)
+        print "%d elements" % len(mesh.elements)
+        mesh_data = rcon.distribute_mesh(mesh)
+    else:
+        mesh_data = rcon.receive_mesh()
+
+    discrs = [rcon.make_discretization(mesh_data, order=order)
+            for order in orders]
+    discr = discrs[0]
+
+    def rhs_c(x, el):
+        if la.norm(x) < 0.1:
+            return 1000
+        else:
+            return 0
+
+    try:
+        from hedge.models.poisson import PoissonOperator
+        from hedge.mesh import TAG_NONE, TAG_ALL
+        op = PoissonOperator(discr.dimensions,
+                dirichlet_tag=TAG_ALL,
+                neumann_tag=TAG_NONE,
+                dirichlet_bc=ConstantGivenFunction(0))
+
+        neg_ops = [-op.bind(d) for d in discrs]
+        rhs = neg_ops[0].sub_op.prepare_rhs(
+                discr.interpolate_volume_function(rhs_c))
+
+        from time import time
+        from hedge.iterative import (CGStateContainer,
+                BlockJacobiPreconditioner, PMultigridPreconditioner)
+
+        def make_block_jacobi():
+            return BlockJacobiPreconditioner(discr, neg_ops[0])
+
+        def make_p_multigrid():
+            return PMultigridPreconditioner(discrs, neg_ops)
+
+        for name, make_precon in [
+                ("none", lambda: None),
+                ("block jacobi", make_block_jacobi),
+                ("p-multigrid %s" % orders, make_p_multigrid),
+                ]:
+            setup_start = time()
+            precon = make_precon()
+            setup_time = time() - setup_start
+
+            solve_start = time()
+            cg = CGStateContainer(neg_ops[0], precon,
+                    dot=discr.nodewise_dot_product)
+            cg.reset(rhs, discr.volume_zeros())
+            cg.run(tol=tol)
+            solve_time = time() - solve_start
+
+            if rcon.is_head_rank:
+                print "%-25s %6d iterations  setup %8.3f s  solve %8.3f s" % (
+                        name, cg.iterations, setup_time, solve_time)
+    finally:
+        for d in discrs:
+            d.close()
+
+
+
+
+if __name__ == "__main__":
+    main()
@@ -473,6 +473,8 @@ class Discretization(hedge.discretization.Discretization):
         self.stream_pool = []
 
     def close(self):
+        hedge.discretization.Discretization.close(self)
+
         del self.stream_pool
 
         self.pool.stop_holding()
@@ -772,7 +774,10 @@ class Discretization(hedge.discretization.Discretization):
     # }}}
 
     # {{{ instrumentation -----------------------------------------------------
-    def add_instrumentation(self, mgr):
+    def add_instrumentation(self, mgr, calibrate_bandwidth=False):
+        # The host-side bandwidth calibration says nothing about the GPU,
+        # so it is off by default here.
+
         mgr.set_constant("flux_plan", str(self.flux_plan))
         mgr.set_constant("diff_plan", str(self.diff_plan))
         # FIXME?
@@ -797,7 +802,8 @@ class Discretization(hedge.discretization.Discretization):
         mgr.add_quantity(self.gmem_bytes_vector_math)
         mgr.add_quantity(self.gmem_bytes_rk4)
 
-        hedge.discretization.Discretization.add_instrumentation(self, mgr)
+        hedge.discretization.Discretization.add_instrumentation(self, mgr,
+                calibrate_bandwidth=calibrate_bandwidth)
 
     def create_op_timers(self):
         self.flux_gather_timer = self.run_context.make_timer(
@@ -580,6 +580,7 @@ class Executor(object):
     def __init__(self, discr, optemplate, post_bind_mapper, type_hints={}):
         self.discr = discr
         self.elwise_linear_cache = {}
+        self.profile = None
 
         from hedge.tools import diff_rst_flops, diff_rescale_one_flops, \
                 mass_flops, lift_flops
@@ -622,6 +623,9 @@ class Executor(object):
             open_unique_debug_file("op-code", ".txt").write(
                     str(self.code))
 
+        if "dump_compile_timings" in discr.debug:
+            print self.code.get_compile_timing_report()
+
     @staticmethod
     def prepare_optemplate_stage2(mesh, optemplate, debug_flags=set(),
             type_hints={}):
@@ -683,7 +687,7 @@ class Executor(object):
         return self.code.execute(
                 self.discr.exec_mapper_class(vars, self),
                 #pre_assign_check=pre_assign_check
-                )
+                profile=self.profile)
 
     # data caches for execution -----------------------------------------------
     @memoize_method
@@ -30,6 +30,7 @@ THE SOFTWARE.
 import hedge.discretization
 import hedge.optemplate
 from hedge.backends.exec_common import ExecutionMapperBase
+from pytools import memoize_method
 import numpy
 
 
@@ -45,7 +46,14 @@ class ExecutionMapper(ExecutionMapperBase):
     def exec_vector_expr_assign(self, insn):
         if self.discr.instrumented:
             def stats_callback(n, vec_expr):
+                from hedge.tools.flops import vector_expr_bytes
                 self.discr.vector_math_flop_counter.add(n*insn.flop_count())
+
+                byte_counts.append(vector_expr_bytes(
+                    len(vec_expr.vector_deps) + len(vec_expr.result_names()),
+                    n, self.discr.default_scalar_type))
+                self.discr.vector_math_byte_counter.add(byte_counts[-1])
+
                 return self.discr.vector_math_timer
         else:
             stats_callback = None
@@ -55,25 +63,41 @@ class ExecutionMapper(ExecutionMapperBase):
                 for name, expr in zip(insn.names, insn.exprs)], []
         else:
             compiled = insn.compiled(self.executor)
-            return zip(compiled.result_names(),
-                    compiled(self, stats_callback)), []
 
-    def exec_flux_batch_assign(self, insn):
+            if stats_callback is not None:
+                from time import time
+                byte_counts = []
+                start = time()
+                results = compiled(self, stats_callback)
+                self.discr.vector_math_bandwidth.add(
+                        sum(byte_counts), time()-start)
+            else:
+                results = compiled(self, stats_callback)
+
+            return zip(compiled.result_names(), results), []
+
+    def get_flux_batch_args(self, insn):
+        """Evaluate the arguments of the flux batch *insn*.
+
+        :returns: a tuple *(args, dtype)*, where *args* have been cast
+          to *dtype*.
+        """
         from pymbolic.primitives import is_zero
 
         class ZeroSpec:
             pass
         class BoundaryZeros(ZeroSpec):
-            pass
+            def __init__(self, tag):
+                self.tag = tag
         class VolumeZeros(ZeroSpec):
             pass
 
         def eval_arg(arg_spec):
-            arg_expr, is_int = arg_spec
+            arg_expr, bdry_tag = arg_spec
             arg = self.rec(arg_expr)
             if is_zero(arg):
-                if insn.is_boundary and not is_int:
-                    return BoundaryZeros()
+                if bdry_tag is not None:
+                    return BoundaryZeros(bdry_tag)
                 else:
                     return VolumeZeros()
             else:
@@ -90,7 +114,7 @@ class ExecutionMapper(ExecutionMapperBase):
         def cast_arg(arg):
             if isinstance(arg, BoundaryZeros):
                 return self.discr.boundary_zeros(
-                        insn.repr_op.boundary_tag, dtype=max_dtype)
+                        arg.tag, dtype=max_dtype)
             elif isinstance(arg, VolumeZeros):
                 return self.discr.volume_zeros(
                         dtype=max_dtype)
@@ -99,67 +123,120 @@ class ExecutionMapper(ExecutionMapperBase):
             else:
                 return arg
 
-        args = [cast_arg(arg) for arg in args]
+        return [cast_arg(arg) for arg in args], max_dtype
 
+    def get_flux_batch_face_groups(self, insn):
         if insn.quadrature_tag is None:
             if insn.is_boundary:
-                face_groups = self.discr.get_boundary(insn.repr_op.boundary_tag)\
+                return self.discr.get_boundary(insn.repr_op.boundary_tag)\
                         .face_groups
             else:
-                face_groups = self.discr.face_groups
+                return self.discr.face_groups
         else:
             if insn.is_boundary:
-                face_groups = self.discr.get_boundary(insn.repr_op.boundary_tag)\
+                return self.discr.get_boundary(insn.repr_op.boundary_tag)\
                         .get_quadrature_info(insn.quadrature_tag).face_groups
             else:
-                face_groups = self.discr.get_quadrature_info(insn.quadrature_tag) \
+                return self.discr.get_quadrature_info(insn.quadrature_tag) \
                         .face_groups
 
-        result = []
+    def gather_fluxes(self, insn, fg, args, dtype):
+        """Evaluate the fluxes of *insn* on the faces of the face group
+        *fg*, given *args* from :meth:`get_flux_batch_args`.
 
-        for fg in face_groups:
-            # grab module
-            module = insn.get_module(self.discr, max_dtype)
-            func = module.gather_flux
-
-            # set up argument structure
-            arg_struct = module.ArgStruct()
-            for arg_name, arg in zip(insn.flux_var_info.arg_names, args):
-                setattr(arg_struct, arg_name, arg)
-            for arg_num, scalar_arg_expr in enumerate(insn.flux_var_info.scalar_parameters):
-                setattr(arg_struct,
-                        "_scalar_arg_%d" % arg_num,
-                        self.rec(scalar_arg_expr))
+        :returns: a list of face vectors, one for each flux in *insn*.
+        """
+        # grab module
+        module = insn.get_module(self.discr, dtype)
+        func = module.gather_flux
+
+        # set up argument structure
+        arg_struct = module.ArgStruct()
+        for arg_name, arg in zip(insn.flux_var_info.arg_names, args):
+            setattr(arg_struct, arg_name, arg)
+        for arg_num, scalar_arg_expr in enumerate(insn.flux_var_info.scalar_parameters):
+            setattr(arg_struct,
+                    "_scalar_arg_%d" % arg_num,
+                    self.rec(scalar_arg_expr))
+
+        fof_shape = (fg.face_count*fg.face_length()*fg.element_count(),)
+        all_fluxes_on_faces = [
+                numpy.zeros(fof_shape, dtype=dtype)
+                for f in insn.expressions]
+        for i, fof in enumerate(all_fluxes_on_faces):
+            setattr(arg_struct, "flux%d_on_faces" % i, fof)
+
+        # make sure everything ended up in Boost.Python attributes
+        # (i.e. empty __dict__)
+        assert not arg_struct.__dict__, arg_struct.__dict__.keys()
+
+        # perform gather
+        func(fg, arg_struct)
+
+        return all_fluxes_on_faces
+
+    def get_flux_lift_data(self, insn, fg, flux_bdg):
+        """:returns: a tuple *(matrix, scaling)* to be passed to
+        :meth:`Executor.lift_flux`.
+        """
+        from hedge.backends.jit.lift import get_flux_lift_data
+        return get_flux_lift_data(fg, flux_bdg.op.is_lift, insn.quadrature_tag)
 
-            fof_shape = (fg.face_count*fg.face_length()*fg.element_count(),)
-            all_fluxes_on_faces = [
-                    numpy.zeros(fof_shape, dtype=max_dtype)
-                    for f in insn.expressions]
-            for i, fof in enumerate(all_fluxes_on_faces):
-                setattr(arg_struct, "flux%d_on_faces" % i, fof)
+    def gather_and_lift_fluxes(self, insn, fg, args, dtype, outs):
+        """Evaluate the fluxes of *insn* on the faces of the face group
+        *fg* and add their lifts to the volume vectors *outs*, one for
+        each flux in *insn*, without storing the fluxes on the faces.
+        """
+        module = insn.get_module(self.discr, dtype, True)
+
+        arg_struct = module.ArgStruct()
+        for arg_name, arg in zip(insn.flux_var_info.arg_names, args):
+            setattr(arg_struct, arg_name, arg)
+        for arg_num, scalar_arg_expr in enumerate(insn.flux_var_info.scalar_parameters):
+            setattr(arg_struct,
+                    "_scalar_arg_%d" % arg_num,
+                    self.rec(scalar_arg_expr))
+
+        # the lift data only depends on the batch's repr_op, so it is the
+        # same for all fluxes in it
+        mat, scaling = self.get_flux_lift_data(insn, fg, insn.expressions[0])
+
+        from pytools import to_uncomplex_dtype
+        arg_struct.lift_matrix = numpy.ascontiguousarray(
+                mat, dtype=to_uncomplex_dtype(dtype)).reshape(-1)
+        if insn.is_lift_scaled():
+            arg_struct.elwise_post_scaling = numpy.asarray(
+                    scaling, dtype=numpy.float64)
+
+        for i, out in enumerate(outs):
+            setattr(arg_struct, "flux%d_result" % i, out)
 
-            # make sure everything ended up in Boost.Python attributes
-            # (i.e. empty __dict__)
-            assert not arg_struct.__dict__, arg_struct.__dict__.keys()
+        assert not arg_struct.__dict__, arg_struct.__dict__.keys()
 
-            # perform gather
-            func(fg, arg_struct)
+        module.gather_and_lift_flux(fg, arg_struct)
+
+    def exec_flux_batch_assign(self, insn):
+        args, max_dtype = self.get_flux_batch_args(insn)
+        face_groups = self.get_flux_batch_face_groups(insn)
+
+        if "jit_no_fused_flux_lift" not in self.discr.debug:
+            outs = [self.discr.volume_zeros(dtype=max_dtype)
+                    for name in insn.names]
+            for fg in face_groups:
+                self.gather_and_lift_fluxes(insn, fg, args, max_dtype, outs)
+
+            return zip(insn.names, outs), []
+
+        result = []
+
+        for fg in face_groups:
+            all_fluxes_on_faces = self.gather_fluxes(
+                    insn, fg, args, max_dtype)
 
             # do lift, produce output
             for name, flux_bdg, fluxes_on_faces in zip(insn.names, insn.expressions,
                     all_fluxes_on_faces):
-
-                if insn.quadrature_tag is None:
-                    if flux_bdg.op.is_lift:
-                        mat = fg.ldis_loc.lifting_matrix()
-                        scaling = fg.local_el_inverse_jacobians
-                    else:
-                        mat = fg.ldis_loc.multi_face_mass_matrix()
-                        scaling = None
-                else:
-                    assert not flux_bdg.op.is_lift
-                    mat = fg.ldis_loc_quad_info.multi_face_mass_matrix()
-                    scaling = None
+                mat, scaling = self.get_flux_lift_data(insn, fg, flux_bdg)
 
                 out = self.discr.volume_zeros(dtype=fluxes_on_faces.dtype)
                 self.executor.lift_flux(fg, mat, scaling, fluxes_on_faces, out)
@@ -179,6 +256,30 @@ class ExecutionMapper(ExecutionMapperBase):
 
         return result, []
 
+    def exec_whole_domain_flux_batch_assign(self, insn):
+        args, max_dtype = self.get_flux_batch_args(insn)
+        module = insn.get_module(self.discr, max_dtype)
+
+        arg_struct = module.ArgStruct()
+        for arg_name, arg in zip(insn.flux_var_info.arg_names, args):
+            setattr(arg_struct, arg_name, arg)
+        for arg_num, scalar_arg_expr in enumerate(insn.flux_var_info.scalar_parameters):
+            setattr(arg_struct,
+                    "_scalar_arg_%d" % arg_num,
+                    self.rec(scalar_arg_expr))
+
+        outs = [self.discr.volume_zeros(dtype=max_dtype)
+                for name in insn.names]
+        for i, out in enumerate(outs):
+            setattr(arg_struct, "flux%d_result" % i, out)
+
+        assert not arg_struct.__dict__, arg_struct.__dict__.keys()
+
+        segments = insn.get_face_group_segments(self.discr, max_dtype)
+        module.gather_and_lift_flux(segments, arg_struct)
+
+        return zip(insn.names, outs), []
+
     def exec_diff_batch_assign(self, insn):
         rst_diff = self.executor.diff(insn.operators, self.rec(insn.field))
 
@@ -327,10 +428,351 @@ class ExecutionMapper(ExecutionMapperBase):
 
 # }}}
 
+# {{{ ensemble execution ------------------------------------------------------
+class EnsembleArray(numpy.ndarray):
+    """A two-dimensional :class:`numpy.ndarray` whose leading index numbers
+    the members of an ensemble of independent states that share one
+    discretization. Only arguments of this type are evaluated as
+    ensembles by a compiled operator, and ensemble results are returned
+    as this type. Use :func:`make_ensemble` to create one.
+
+    Indexing out a single member yields a plain :class:`numpy.ndarray`.
+    """
+
+    def __getitem__(self, index):
+        result = numpy.ndarray.__getitem__(self, index)
+        if isinstance(result, numpy.ndarray) and len(result.shape) != 2:
+            result = result.view(numpy.ndarray)
+        return result
+
+
+
+
+def make_ensemble(members):
+    """Return the ensemble of the states in the list *members*, each a
+    volume vector or an object array of them, as an :class:`EnsembleArray`
+    or an object array of them.
+    """
+    from hedge.tools import is_obj_array, make_obj_array
+    if is_obj_array(members[0]):
+        return make_obj_array([
+            make_ensemble([m[i] for m in members])
+            for i in range(len(members[0]))])
+
+    return numpy.array(members).view(EnsembleArray)
+
+
+
+
+def _is_ensemble_value(value):
+    # Only used during ensemble execution, after the arguments have been
+    # checked by get_ensemble_member_count.
+    return (isinstance(value, numpy.ndarray)
+            and value.dtype != object and len(value.shape) == 2)
+
+
+
+
+def get_ensemble_member_count(context):
+    """Return the number of ensemble members among the values in *context*,
+    or *None* if there are none. Ensemble values are
+    :class:`EnsembleArray` instances, or object arrays of them.
+    """
+    from hedge.tools import is_obj_array
+
+    result = None
+    for name, value in context.iteritems():
+        if is_obj_array(value):
+            values = value.flat
+        else:
+            values = [value]
+
+        for v in values:
+            if isinstance(v, EnsembleArray) and len(v.shape) == 2:
+                if result is not None and len(v) != result:
+                    raise ValueError("ensemble member count of '%s' (%d) "
+                            "does not match that of other arguments (%d)"
+                            % (name, len(v), result))
+                result = len(v)
+
+    return result
+
+
+
+
+def _strip_ensemble_marker(value):
+    from hedge.tools import with_object_array_or_scalar
+
+    def strip(v):
+        if isinstance(v, EnsembleArray):
+            return v.view(numpy.ndarray)
+        else:
+            return v
+
+    return with_object_array_or_scalar(strip, value)
+
+
+
+
+def _mark_ensemble(value):
+    from hedge.tools import with_object_array_or_scalar
+
+    def mark(v):
+        if _is_ensemble_value(v):
+            return v.view(EnsembleArray)
+        else:
+            return v
+
+    return with_object_array_or_scalar(mark, value)
+
+
+
+
+def _get_ensemble_member(value, member):
+    from hedge.tools import is_obj_array, with_object_array_or_scalar
+    if is_obj_array(value):
+        return with_object_array_or_scalar(
+                lambda v: _get_ensemble_member(v, member), value)
+    elif _is_ensemble_value(value):
+        return value[member]
+    else:
+        return value
+
+
+
+
+def _stack_ensemble_members(values):
+    from hedge.tools import is_obj_array, make_obj_array
+    if is_obj_array(values[0]):
+        return make_obj_array([
+            _stack_ensemble_members([v[i] for v in values])
+            for i in range(len(values[0]))])
+
+    arrays = [v for v in values if isinstance(v, numpy.ndarray)]
+    if not arrays:
+        if all(v == values[0] for v in values[1:]):
+            return values[0]
+        else:
+            return numpy.array(values)
+
+    from pytools import common_dtype
+    result = numpy.empty((len(values),) + arrays[0].shape,
+            dtype=common_dtype([numpy.asarray(v).dtype for v in values]))
+    for i, v in enumerate(values):
+        result[i] = v
+    return result
+
+
+
+
+def perform_ensemble_elwise_operator(in_ranges, out_ranges, matrix,
+        field, out, coefficients=None):
+    """Apply *matrix* to each element of each ensemble member in *field*,
+    scaled by the per-element *coefficients*, if given. All members and
+    elements are handled in a single matrix-matrix product.
+    """
+    member_count = len(field)
+    el_count = len(in_ranges)
+    assert len(out_ranges) == el_count
+
+    in_size = el_count*in_ranges.el_size
+    out_size = el_count*out_ranges.el_size
+
+    result = numpy.dot(
+            field[:, in_ranges.start:in_ranges.start+in_size]
+            .reshape(member_count*el_count, in_ranges.el_size),
+            matrix.T).reshape(member_count, el_count, out_ranges.el_size)
+
+    if coefficients is not None:
+        result *= numpy.asarray(coefficients)[:, numpy.newaxis]
+
+    out[:, out_ranges.start:out_ranges.start+out_size] = \
+            result.reshape(member_count, out_size)
+
+
+
+
+class EnsembleExecutionMapper(ExecutionMapper):
+    """Evaluates an operator for all members of an ensemble of
+    independent states at once, see :class:`EnsembleArray`.
+
+    Element-local operators (differentiation, mass matrices, lifting) are
+    applied to all members in one pass, so that their matrices are only
+    read once. The flux gather loops over the members inside the loop
+    over face nodes, so that face pair data and index lists are read once
+    for all members. Compiled vector expressions sweep all members in one
+    kernel call. Other operators, such as boundary restriction, are
+    evaluated member by member.
+
+    Operators must be compiled without whole-domain flux batches for
+    this mapper, see :meth:`Executor.get_ensemble_code`.
+    """
+
+    def __init__(self, context, executor, member_count):
+        ExecutionMapper.__init__(self, context, executor)
+        self.member_count = member_count
+
+    def get_member_mappers(self):
+        return [ExecutionMapper(
+            dict((name, _get_ensemble_member(value, i))
+                for name, value in self.context.iteritems()),
+            self.executor)
+            for i in range(self.member_count)]
+
+    def map_member_by_member(self, expr):
+        return _stack_ensemble_members(
+                [mapper(expr) for mapper in self.get_member_mappers()])
+
+    def ensemble_zeros(self, dtype=None):
+        return self.discr.volume_zeros(
+                shape=(self.member_count,), dtype=dtype)
+
+    # {{{ code execution functions --------------------------------------------
+    def exec_vector_expr_assign(self, insn):
+        if insn.flop_count() == 0:
+            return ExecutionMapper.exec_vector_expr_assign(self, insn)
+
+        compiled = insn.compiled(self.executor)
+        vector_deps = set(compiled.vector_deps)
+
+        def evaluate_subexpr(expr):
+            value = self.rec(expr)
+
+            # the compiled kernel sweeps all members as one long vector
+            if expr in vector_deps:
+                if _is_ensemble_value(value):
+                    value = numpy.ascontiguousarray(value).reshape(-1)
+                else:
+                    value = numpy.tile(value, self.member_count)
+
+            return value
+
+        results = compiled(evaluate_subexpr)
+
+        return [(name, result.reshape(self.member_count, -1))
+                for name, result in zip(compiled.result_names(), results)], []
+
+    def gather_ensemble_fluxes(self, insn, module, fg, args, dtype):
+        """Like :meth:`ExecutionMapper.gather_fluxes`, but for all ensemble
+        members at once, using *module* from
+        :meth:`hedge.backends.jit.compiler.CompiledFluxBatchAssign.get_module`
+        with *ensemble* set.
+
+        :returns: a list of arrays with a leading ensemble dimension, one
+          for each flux in *insn*.
+        """
+        arg_struct = module.ArgStruct()
+        arg_struct.member_count = self.member_count
+
+        for arg_name, arg in zip(insn.flux_var_info.arg_names, args):
+            if _is_ensemble_value(arg):
+                stride = arg.shape[1]
+                arg = numpy.ascontiguousarray(arg).reshape(-1)
+            else:
+                # shared by all members
+                stride = 0
+
+            setattr(arg_struct, arg_name, arg)
+            setattr(arg_struct, "%s_stride" % arg_name, stride)
+
+        for arg_num, scalar_arg_expr in enumerate(insn.flux_var_info.scalar_parameters):
+            setattr(arg_struct,
+                    "_scalar_arg_%d" % arg_num,
+                    self.rec(scalar_arg_expr))
+
+        fof_shape = (self.member_count,
+                fg.face_count*fg.face_length()*fg.element_count())
+        all_fluxes_on_faces = [
+                numpy.zeros(fof_shape, dtype=dtype)
+                for f in insn.expressions]
+        for i, fof in enumerate(all_fluxes_on_faces):
+            setattr(arg_struct, "flux%d_on_faces" % i, fof.reshape(-1))
+
+        assert not arg_struct.__dict__, arg_struct.__dict__.keys()
+
+        module.gather_flux(fg, arg_struct)
+
+        return all_fluxes_on_faces
+
+    def exec_flux_batch_assign(self, insn):
+        args, max_dtype = self.get_flux_batch_args(insn)
+        face_groups = self.get_flux_batch_face_groups(insn)
+        module = insn.get_module(self.discr, max_dtype, ensemble=True)
+
+        result = []
+
+        for fg in face_groups:
+            all_fluxes_on_faces = self.gather_ensemble_fluxes(
+                    insn, module, fg, args, max_dtype)
+
+            for name, flux_bdg, fluxes_on_faces in zip(
+                    insn.names, insn.expressions, all_fluxes_on_faces):
+                mat, scaling = self.get_flux_lift_data(insn, fg, flux_bdg)
+
+                out = self.ensemble_zeros(dtype=max_dtype)
+                self.executor.lift_flux_ensemble(
+                        fg, mat, scaling, fluxes_on_faces, out)
+
+                result.append((name, out))
+
+        if not face_groups:
+            for name in insn.names:
+                result.append((name, self.ensemble_zeros(dtype=max_dtype)))
+
+        return result, []
+
+    def exec_diff_batch_assign(self, insn):
+        field = self.rec(insn.field)
+
+        if _is_ensemble_value(field):
+            rst_diff = self.executor.diff_ensemble(insn.operators, field)
+        else:
+            rst_diff = self.executor.diff(insn.operators, field)
+
+        return [(name, diff) for name, diff in zip(insn.names, rst_diff)], []
+
+    exec_quad_diff_batch_assign = exec_diff_batch_assign
+
+    # }}}
+
+    # {{{ expression mappings -------------------------------------------------
+    def map_operator_binding(self, expr):
+        from hedge.optemplate.operators import ElementwiseLinearOperator
+        if isinstance(expr.op, ElementwiseLinearOperator):
+            return ExecutionMapper.map_operator_binding(self, expr)
+        else:
+            return self.map_member_by_member(expr)
+
+    map_if_positive = map_member_by_member
+
+    def map_elementwise_linear(self, op, field_expr):
+        field = self.rec(field_expr)
+
+        from hedge.tools import is_zero
+        if is_zero(field):
+            return 0
+
+        if _is_ensemble_value(field):
+            out = self.ensemble_zeros(dtype=field.dtype)
+            self.executor.do_elementwise_linear_ensemble(op, field, out)
+        else:
+            out = self.discr.volume_zeros()
+            self.executor.do_elementwise_linear(op, field, out)
+
+        return out
+
+    # }}}
+
+# }}}
+
 # {{{ executor ----------------------------------------------------------------
 class Executor(object):
     def __init__(self, discr, optemplate, post_bind_mapper, type_hints):
         self.discr = discr
+        self.profile = None
+        self.optemplate = optemplate
+        self.post_bind_mapper = post_bind_mapper
+        self.type_hints = type_hints
         self.code = self.compile_optemplate(discr, optemplate, 
                 post_bind_mapper, type_hints)
         self.elwise_linear_cache = {}
@@ -340,6 +782,9 @@ class Executor(object):
             open_unique_debug_file("op-code", ".txt").write(
                     str(self.code))
 
+        if "dump_compile_timings" in discr.debug:
+            print self.code.get_compile_timing_report()
+
         def bench_diff(f):
             test_field = discr.volume_zeros()
             from hedge.optemplate import ReferenceDifferentiationOperator
@@ -367,6 +812,16 @@ class Executor(object):
             f(fg, fg.ldis_loc.lifting_matrix(), fg.local_el_inverse_jacobians, fof, out)
             return time() - start
 
+        def bench_elwise(f):
+            test_field = discr.volume_zeros()
+            out = discr.volume_zeros()
+            from hedge.optemplate import MassOperator
+            from time import time
+
+            start = time()
+            f(MassOperator(), test_field, out)
+            return time() - start
+
         def pick_faster_func(benchmark, choices, attempts=3):
             from pytools import argmin2
             return argmin2(
@@ -375,13 +830,18 @@ class Executor(object):
 
         from hedge.backends.jit.diff import JitDifferentiator
         self.diff = pick_faster_func(bench_diff,
-                [self.diff_builtin, JitDifferentiator(discr)])
+                [self.diff_builtin, JitDifferentiator(discr),
+                    JitDifferentiator(discr, specialize=True)])
         from hedge.backends.jit.lift import JitLifter
         self.lift_flux = pick_faster_func(bench_lift,
-                [self.lift_flux, JitLifter(discr)])
+                [self.lift_flux, JitLifter(discr),
+                    JitLifter(discr, specialize=True)])
+        from hedge.backends.jit.elwise import JitElementwiseLinear
+        self.do_elementwise_linear = pick_faster_func(bench_elwise,
+                [self.do_elementwise_linear, JitElementwiseLinear(discr)])
 
     def compile_optemplate(self, discr, optemplate, post_bind_mapper,
-            type_hints):
+            type_hints, combine_boundaries=True):
         from hedge.optemplate import process_optemplate
 
         stage = [0]
@@ -400,9 +860,29 @@ class Executor(object):
                 mesh=discr.mesh,
                 type_hints=type_hints)
 
+        if combine_boundaries and not (
+                set(["jit_no_fused_flux_lift", "jit_no_whole_domain_flux"])
+                & discr.debug):
+            # Rank boundary fluxes stay separate, so that everything else
+            # can be computed while their data is being exchanged.
+            from hedge.optemplate.mappers import BoundaryCombiner
+            optemplate = BoundaryCombiner(discr.mesh,
+                    combine_rank_boundaries=False)(optemplate)
+            dump_optemplate("boundary-combined", optemplate)
+
         from hedge.backends.jit.compiler import OperatorCompiler
         return OperatorCompiler(discr)(optemplate, type_hints)
 
+    @memoize_method
+    def get_ensemble_code(self):
+        """Return the operator compiled for evaluation by
+        :class:`EnsembleExecutionMapper`, i.e. without whole-domain flux
+        batches, whose fused gather and lift does not handle ensembles.
+        """
+        return self.compile_optemplate(self.discr, self.optemplate,
+                self.post_bind_mapper, self.type_hints,
+                combine_boundaries=False)
+
     def instrument(self):
         discr = self.discr
         assert discr.instrumented
@@ -412,6 +892,8 @@ class Executor(object):
 
         from hedge.tools import \
                 diff_rst_flops, diff_rescale_one_flops, mass_flops
+        from hedge.tools.flops import \
+                diff_rst_bytes, mass_bytes, lift_bytes
 
         if discr.quad_min_degrees:
             from warnings import warn
@@ -423,7 +905,11 @@ class Executor(object):
                         discr.diff_timer,
                         discr.diff_counter,
                         discr.diff_flop_counter,
-                        diff_rst_flops(discr))
+                        diff_rst_flops(discr),
+                        byte_counter=discr.diff_byte_counter,
+                        byte_count=diff_rst_bytes(
+                            discr, discr.default_scalar_type),
+                        bandwidth=discr.diff_bandwidth)
 
         self.do_elementwise_linear = \
                 time_count_flop(
@@ -431,11 +917,26 @@ class Executor(object):
                         discr.el_local_timer,
                         discr.el_local_counter,
                         discr.el_local_flop_counter,
-                        mass_flops(discr))
+                        mass_flops(discr),
+                        byte_counter=discr.el_local_byte_counter,
+                        byte_count=mass_bytes(
+                            discr, discr.default_scalar_type),
+                        bandwidth=discr.el_local_bandwidth)
+
+        uninstrumented_lift_flux = self.lift_flux
+
+        def lift_flux_with_bytes(fgroup, matrix, scaling, field, out):
+            from time import time
+            byte_count = lift_bytes(fgroup, field.dtype)
+            discr.lift_byte_counter.add(byte_count)
+
+            start = time()
+            uninstrumented_lift_flux(fgroup, matrix, scaling, field, out)
+            discr.lift_bandwidth.add(byte_count, time()-start)
 
         self.lift_flux = \
                 time_and_count_function(
-                        self.lift_flux,
+                        lift_flux_with_bytes,
                         discr.lift_timer,
                         discr.lift_counter)
 
@@ -465,6 +966,56 @@ class Executor(object):
 
         return [self.diff_rst(op, field) for op in operators]
 
+    def diff_ensemble(self, operators, field):
+        """Like :meth:`diff`, but for a *field* with a leading ensemble
+        dimension.
+        """
+        result = []
+        for op in operators:
+            op_result = self.discr.volume_zeros(
+                    shape=field.shape[:1], dtype=field.dtype)
+            for eg in self.discr.element_groups:
+                perform_ensemble_elwise_operator(
+                        op.preimage_ranges(eg), eg.ranges,
+                        op.matrices(eg)[op.rst_axis].astype(field.dtype),
+                        field, op_result)
+            result.append(op_result)
+
+        return result
+
+    def lift_flux_ensemble(self, fgroup, matrix, scaling, field, out):
+        """Like :meth:`lift_flux`, but for *field* and *out* with a
+        leading ensemble dimension.
+        """
+        el_count = fgroup.element_count()
+        member_count = len(field)
+
+        lifted = numpy.dot(
+                field.reshape(member_count*el_count, -1),
+                matrix.T.astype(field.dtype)).reshape(
+                        member_count, el_count, -1)
+
+        if scaling is not None:
+            lifted *= numpy.asarray(scaling)[:, numpy.newaxis]
+
+        out[:, numpy.asarray(fgroup.local_el_write_base)[:, numpy.newaxis]
+                + numpy.arange(lifted.shape[-1])] = lifted
+
+    def do_elementwise_linear_ensemble(self, op, field, out):
+        """Like :meth:`do_elementwise_linear`, but for *field* and *out*
+        with a leading ensemble dimension.
+        """
+        for eg in self.discr.element_groups:
+            try:
+                matrix, coeffs = self.elwise_linear_cache[eg, op, field.dtype]
+            except KeyError:
+                matrix = numpy.asarray(op.matrix(eg), dtype=field.dtype)
+                coeffs = op.coefficients(eg)
+                self.elwise_linear_cache[eg, op, field.dtype] = matrix, coeffs
+
+            perform_ensemble_elwise_operator(eg.ranges, eg.ranges,
+                    matrix, field, out, coeffs)
+
     def do_elementwise_linear(self, op, field, out):
         for eg in self.discr.element_groups:
             try:
@@ -486,8 +1037,29 @@ class Executor(object):
                         coeffs, matrix, field, out)
 
     def __call__(self, **context):
+        """Evaluate the operator with the variable values in *context*.
+
+        Any of the values may be ensembles of independent states that
+        share the discretization, see :class:`EnsembleArray`. The result
+        is then an ensemble, too.
+        """
+        member_count = get_ensemble_member_count(context)
+        if member_count is not None:
+            if self.discr.exec_mapper_class is not ExecutionMapper:
+                raise NotImplementedError(
+                        "ensemble execution with a custom execution mapper")
+
+            context = dict(
+                    (name, _strip_ensemble_marker(value))
+                    for name, value in context.iteritems())
+
+            return _mark_ensemble(self.get_ensemble_code().execute(
+                    EnsembleExecutionMapper(context, self, member_count),
+                    profile=self.profile))
+
         return self.code.execute(
-                self.discr.exec_mapper_class(context, self))
+                self.discr.exec_mapper_class(context, self),
+                profile=self.profile)
 
 # }}}
 
@@ -500,6 +1072,8 @@ class Discretization(hedge.discretization.Discretization):
     def all_debug_flags(cls):
         return hedge.discretization.Discretization.all_debug_flags() | set([
             "jit_dont_optimize_large_exprs",
+            "jit_no_fused_flux_lift",
+            "jit_no_whole_domain_flux",
             ])
 
     @classmethod
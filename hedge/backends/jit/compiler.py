@@ -94,12 +94,76 @@ class CompiledFluxBatchAssign(FluxBatchAssign):
         from pytools import flatten
         return set(flatten(dep_mapper(dep) for dep in deps))
 
+    def is_lift_scaled(self):
+        """Return whether the lifted fluxes need to be scaled by the
+        elementwise inverse Jacobians, i.e. whether this batch consists of
+        lifts rather than face mass matrix applications.
+        """
+        # is_lift is part of repr_op, so it is the same for the whole batch
+        return self.repr_op.is_lift and self.quadrature_tag is None
+
     @memoize_method
-    def get_module(self, discr, dtype):
+    def get_module(self, discr, dtype, fused_lift=False, ensemble=False):
+        """:param fused_lift: if *True*, return a module whose
+          *gather_and_lift_flux* function adds the lifted fluxes to
+          volume vectors directly. Otherwise, its *gather_flux*
+          function only evaluates the fluxes on the faces. If *discr*
+          is instrumented, the fused function is logged as described
+          for :func:`hedge.tools.flops.time_count_flux_lift`.
+        :param ensemble: if *True*, return a module whose *gather_flux*
+          function evaluates the fluxes of all members of an ensemble,
+          see :func:`hedge.backends.jit.flux.get_interior_flux_mod`.
+        """
         from hedge.backends.jit.flux import \
                 get_interior_flux_mod, \
                 get_boundary_flux_mod
 
+        if ensemble:
+            assert not fused_lift
+
+            if self.is_boundary:
+                get_mod = get_boundary_flux_mod
+            else:
+                get_mod = get_interior_flux_mod
+
+            mod = get_mod(self.expressions, self.flux_var_info,
+                    discr, dtype, ensemble=True)
+
+            if discr.instrumented:
+                from pytools.log import time_and_count_function
+                mod.gather_flux = time_and_count_function(
+                        mod.gather_flux, discr.gather_timer)
+
+            return mod
+
+        if fused_lift:
+            from hedge.backends.jit.flux import get_flux_lift_mod
+            mod = get_flux_lift_mod(self.expressions, self.flux_var_info,
+                    discr, dtype, with_scale=self.is_lift_scaled(),
+                    is_boundary=self.is_boundary)
+
+            if discr.instrumented:
+                from hedge.tools.flops import time_count_flux_lift, \
+                        face_group_gather_flops, face_group_gather_bytes, \
+                        fused_lift_bytes
+                from hedge.tools import lift_flops
+
+                arg_count = len(self.flux_var_info.arg_names)
+                flux_count = len(self.expressions)
+
+                def get_counts(fg, arg_struct):
+                    return (
+                            face_group_gather_flops(fg, arg_count, flux_count),
+                            face_group_gather_bytes(fg, arg_count, dtype),
+                            flux_count,
+                            flux_count*lift_flops(fg),
+                            fused_lift_bytes(fg, flux_count, dtype))
+
+                mod.gather_and_lift_flux = time_count_flux_lift(
+                        mod.gather_and_lift_flux, discr, get_counts)
+
+            return mod
+
         if not self.is_boundary:
             mod = get_interior_flux_mod(
                     self.expressions, self.flux_var_info, 
@@ -107,6 +171,7 @@ class CompiledFluxBatchAssign(FluxBatchAssign):
 
             if discr.instrumented:
                 from hedge.tools import time_count_flop, gather_flops
+                from hedge.tools.flops import gather_bytes
                 mod.gather_flux = \
                         time_count_flop(
                                 mod.gather_flux,
@@ -115,7 +180,13 @@ class CompiledFluxBatchAssign(FluxBatchAssign):
                                 discr.gather_flop_counter,
                                 len(self.expressions)
                                 * gather_flops(discr, self.quadrature_tag)
-                                * len(self.flux_var_info.arg_names))
+                                * len(self.flux_var_info.arg_names),
+                                byte_counter=discr.gather_byte_counter,
+                                byte_count=gather_bytes(discr,
+                                    len(self.flux_var_info.arg_names),
+                                    len(self.expressions),
+                                    dtype, self.quadrature_tag),
+                                bandwidth=discr.gather_bandwidth)
 
         else:
             mod = get_boundary_flux_mod(
@@ -131,6 +202,141 @@ class CompiledFluxBatchAssign(FluxBatchAssign):
 
 
 
+class CompiledWholeDomainFluxBatchAssign(FluxBatchAssign):
+    """Evaluates a batch of
+    :class:`hedge.optemplate.operators.WholeDomainFluxOperator` instances,
+    i.e. lifted interior and boundary fluxes summed into one result each,
+    with a single call to a generated function that sweeps the interior
+    face groups and those of all boundaries involved.
+    """
+    # members: is_lift, quadrature_tag, boundary_tags, fluxes,
+    # flux_result_indices, flux_segment_kinds, flux_var_info
+
+    @memoize_method
+    def get_dependencies(self):
+        deps = set()
+
+        from hedge.tools import setify_field as setify
+        for wdflux in self.expressions:
+            for ii in wdflux.interiors:
+                deps |= setify(ii.field_expr)
+            for bi in wdflux.boundaries:
+                deps |= setify(bi.bpair.field) | setify(bi.bpair.bfield)
+
+        dep_mapper = self.dep_mapper_factory()
+
+        from pytools import flatten
+        return set(flatten(dep_mapper(dep) for dep in deps))
+
+    def get_executor_method(self, executor):
+        return executor.exec_whole_domain_flux_batch_assign
+
+    def is_lift_scaled(self):
+        return self.is_lift and self.quadrature_tag is None
+
+    @memoize_method
+    def get_result_count(self, kind):
+        """Return the number of results that receive fluxes from face
+        groups of segment kind *kind*, see :meth:`get_face_group_segments`.
+        """
+        return len(set(
+            result_idx
+            for result_idx, flux_kind in zip(
+                self.flux_result_indices, self.flux_segment_kinds)
+            if flux_kind == kind))
+
+    @memoize_method
+    def get_flux_count(self, kind):
+        """Return the number of fluxes evaluated on face groups of
+        segment kind *kind*, see :meth:`get_face_group_segments`.
+        """
+        return len([flux_kind for flux_kind in self.flux_segment_kinds
+            if flux_kind == kind])
+
+    @memoize_method
+    def get_face_group_segments(self, discr, dtype):
+        """Return a list of tuples *(kind, fg, lift_matrix,
+        elwise_post_scaling)* to be passed to the function generated by
+        :func:`hedge.backends.jit.flux.get_whole_domain_flux_lift_mod`.
+        *kind* is 0 for interior face groups and *n+1* for face groups
+        on the boundary *self.boundary_tags[n]*.
+        """
+        import numpy
+        from pytools import to_uncomplex_dtype
+        from hedge.backends.jit.lift import get_flux_lift_data
+
+        used_kinds = set(self.flux_segment_kinds)
+
+        result = []
+        for kind, tag in enumerate([None] + self.boundary_tags):
+            if kind not in used_kinds:
+                continue
+
+            if tag is None:
+                fg_source = discr
+            else:
+                fg_source = discr.get_boundary(tag)
+
+            if self.quadrature_tag is not None:
+                fg_source = fg_source.get_quadrature_info(self.quadrature_tag)
+
+            for fg in fg_source.face_groups:
+                mat, scaling = get_flux_lift_data(
+                        fg, self.is_lift, self.quadrature_tag)
+                if scaling is not None:
+                    scaling = numpy.asarray(scaling, dtype=numpy.float64)
+
+                result.append((kind, fg,
+                    numpy.ascontiguousarray(
+                        mat, dtype=to_uncomplex_dtype(dtype)).reshape(-1),
+                    scaling))
+
+        return result
+
+    @memoize_method
+    def get_module(self, discr, dtype):
+        from hedge.backends.jit.flux import get_whole_domain_flux_lift_mod
+        mod = get_whole_domain_flux_lift_mod(
+                self.fluxes, self.flux_result_indices,
+                self.flux_segment_kinds, len(self.expressions),
+                self.flux_var_info, discr, dtype,
+                with_scale=self.is_lift_scaled())
+
+        if discr.instrumented:
+            from hedge.tools.flops import time_count_flux_lift, \
+                    face_group_gather_flops, face_group_gather_bytes, \
+                    fused_lift_bytes
+            from hedge.tools import lift_flops
+
+            arg_count = len(self.flux_var_info.arg_names)
+
+            def get_counts(segments, arg_struct):
+                gather_flops = gather_bytes = 0
+                lift_count = lift_flops_total = lift_bytes = 0
+
+                for kind, fg, mat, scaling in segments:
+                    flux_count = self.get_flux_count(kind)
+                    result_count = self.get_result_count(kind)
+
+                    gather_flops += face_group_gather_flops(
+                            fg, arg_count, flux_count)
+                    gather_bytes += face_group_gather_bytes(
+                            fg, arg_count, dtype)
+                    lift_count += result_count
+                    lift_flops_total += result_count*lift_flops(fg)
+                    lift_bytes += fused_lift_bytes(fg, result_count, dtype)
+
+                return (gather_flops, gather_bytes,
+                        lift_count, lift_flops_total, lift_bytes)
+
+            mod.gather_and_lift_flux = time_count_flux_lift(
+                    mod.gather_and_lift_flux, discr, get_counts)
+
+        return mod
+
+
+
+
 
 # }}}
 
@@ -159,15 +365,46 @@ class OperatorCompiler(OperatorCompilerBase):
             else:
                 return get_deps(op_binding.field)
 
-        return [self.FluxRecord(
-            flux_expr=flux_binding,
-            repr_op=flux_binding.op.repr_op(),
-            dependencies=get_flux_deps(flux_binding))
-            for flux_binding in FluxCollector()(expr)]
+        def get_wdflux_deps(wdflux):
+            return set(wdflux.interior_deps) | set(wdflux.boundary_deps)
+
+        from hedge.optemplate.operators import WholeDomainFluxOperator
+
+        result = []
+        for flux in FluxCollector()(expr):
+            if isinstance(flux, WholeDomainFluxOperator):
+                result.append(self.FluxRecord(
+                    flux_expr=flux,
+                    repr_op=flux.repr_op(),
+                    dependencies=get_wdflux_deps(flux)))
+            else:
+                result.append(self.FluxRecord(
+                    flux_expr=flux,
+                    repr_op=flux.op.repr_op(),
+                    dependencies=get_flux_deps(flux)))
+
+        return result
+
+    def internal_map_flux(self, flux):
+        from hedge.optemplate.operators import WholeDomainFluxOperator
+        if isinstance(flux, WholeDomainFluxOperator):
+            return WholeDomainFluxOperator(
+                flux.is_lift,
+                [flux.InteriorInfo(
+                    flux_expr=ii.flux_expr,
+                    field_expr=self.rec(ii.field_expr))
+                    for ii in flux.interiors],
+                [flux.BoundaryInfo(
+                    flux_expr=bi.flux_expr,
+                    bpair=self.rec(bi.bpair))
+                    for bi in flux.boundaries],
+                flux.quadrature_tag)
+        else:
+            from hedge.optemplate import IdentityMapper
+            return IdentityMapper.map_operator_binding(self, flux)
 
-    def internal_map_flux(self, flux_bind):
-        from hedge.optemplate import IdentityMapper
-        return IdentityMapper.map_operator_binding(self, flux_bind)
+    def map_whole_domain_flux(self, wdflux):
+        return self.map_planned_flux(wdflux)
 
     def map_operator_binding(self, expr, name_hint=None):
         from hedge.optemplate import FluxOperatorBase
@@ -178,10 +415,70 @@ class OperatorCompiler(OperatorCompilerBase):
                     self, expr, name_hint=name_hint)
 
     # {{{ flux compilation
+    def make_whole_domain_flux_batch_assign(self, names, expressions,
+            repr_op):
+        from hedge.optemplate.operators import (
+                FluxOperator, BoundaryFluxOperator,
+                QuadratureFluxOperator, QuadratureBoundaryFluxOperator)
+
+        is_lift = repr_op.is_lift
+        quad_tag = repr_op.quadrature_tag
+
+        # Flatten the whole-domain fluxes into ordinary flux bindings,
+        # remembering which result each is summed into and on which
+        # face groups it is evaluated.
+        boundary_tags = []
+        fluxes = []
+        flux_result_indices = []
+        flux_segment_kinds = []
+
+        for result_idx, wdflux in enumerate(expressions):
+            for ii in wdflux.interiors:
+                if quad_tag is None:
+                    op = FluxOperator(ii.flux_expr, is_lift)
+                else:
+                    op = QuadratureFluxOperator(ii.flux_expr, quad_tag)
+
+                fluxes.append(op(ii.field_expr))
+                flux_result_indices.append(result_idx)
+                flux_segment_kinds.append(0)
+
+            for bi in wdflux.boundaries:
+                tag = bi.bpair.tag
+                if tag not in boundary_tags:
+                    boundary_tags.append(tag)
+
+                if quad_tag is None:
+                    op = BoundaryFluxOperator(bi.flux_expr, tag, is_lift)
+                else:
+                    op = QuadratureBoundaryFluxOperator(
+                            bi.flux_expr, quad_tag, tag)
+
+                fluxes.append(op(bi.bpair))
+                flux_result_indices.append(result_idx)
+                flux_segment_kinds.append(1+boundary_tags.index(tag))
+
+        from hedge.backends.jit.flux import get_flux_var_info
+        return CompiledWholeDomainFluxBatchAssign(
+                is_lift=is_lift,
+                quadrature_tag=quad_tag,
+                boundary_tags=boundary_tags,
+                fluxes=fluxes,
+                flux_result_indices=flux_result_indices,
+                flux_segment_kinds=flux_segment_kinds,
+                names=names, expressions=expressions, repr_op=repr_op,
+                flux_var_info=get_flux_var_info(fluxes),
+                dep_mapper_factory=self.dep_mapper_factory)
+
     def make_flux_batch_assign(self, names, expressions, repr_op):
         from hedge.optemplate.operators import (
                 QuadratureFluxOperatorBase,
-                BoundaryFluxOperatorBase)
+                BoundaryFluxOperatorBase,
+                WholeDomainFluxOperator)
+
+        if isinstance(repr_op, WholeDomainFluxOperator):
+            return self.make_whole_domain_flux_batch_assign(
+                    names, expressions, repr_op)
 
         if isinstance(repr_op, QuadratureFluxOperatorBase):
             quad_tag = repr_op.quadrature_tag
@@ -34,8 +34,16 @@ from pytools import memoize_method
 
 
 class JitDifferentiator:
-    def __init__(self, discr):
+    """
+    :param specialize: if *True*, use kernels from
+      :mod:`hedge.backends.jit.elwise`, which are specialized for the
+      element size.
+    """
+
+    def __init__(self, discr, specialize=False):
         self.discr = discr
+        self.specialize = specialize
+        self.matrix_cache = {}
 
     # {{{ code generation
     @memoize_method
@@ -183,7 +191,103 @@ class JitDifferentiator:
         #print mod.generate()
         #raw_input()
 
-        compiled_func = mod.compile(self.discr.toolchain).diff
+        return self._instrument(
+                mod.compile(self.discr.toolchain).diff, elgroup, dtype)
+        # }}}
+
+    @memoize_method
+    def make_specialized_diff(self, elgroup, dtype, shape):
+        """Like :meth:`make_diff`, but the matrices are passed as
+        flattened ``numpy`` arrays, and the element-local products are
+        generated by :func:`hedge.backends.jit.elwise.get_element_matvec_code`.
+        """
+        from hedge._internal import UniformElementRanges
+        assert isinstance(elgroup.ranges, UniformElementRanges)
+
+        discr = self.discr
+        from cgen import (
+                FunctionDeclaration, FunctionBody,
+                Const, Reference, Value,
+                Statement, Line, Block, Initializer,
+                For, If)
+
+        from hedge.backends.jit.elwise import (
+                get_specialized_module, get_matrix_copy_code,
+                get_element_matvec_code)
+
+        row_count, col_count = shape
+        mod = get_specialized_module(dtype)
+
+        S = Statement
+        fdecl = FunctionDeclaration(
+                    Value("void", "diff"),
+                    [
+                    Const(Reference(Value("uniform_element_ranges", "from_ers"))),
+                    Const(Reference(Value("uniform_element_ranges", "to_ers"))),
+                    Value("numpy_array<value_type>", "field")
+                    ]+[
+                    Value("numpy_array<uncomplex_type>", "diffmat_rst%d" % rst)
+                    for rst in range(discr.dimensions)
+                    ]+[
+                    Value("numpy_array<value_type>", "result%d" % i)
+                    for i in range(discr.dimensions)
+                    ]
+                    )
+
+        fbody = Block([
+            If("%d != to_ers.el_size()" % row_count,
+                S('throw(std::runtime_error("unsupported image element size"))')),
+            If("%d != from_ers.el_size()" % col_count,
+                S('throw(std::runtime_error("unsupported preimage element size"))')),
+            If("from_ers.size() != to_ers.size()",
+                S('throw(std::runtime_error("image and preimage element groups '
+                    'do not have the same element count"))')),
+            Line(),
+            ]+get_matrix_copy_code(
+                ["diffmat_rst%d" % rst for rst in range(discr.dimensions)],
+                row_count, col_count)+[
+            Line(),
+            Initializer(
+                Value("numpy_array<value_type>::const_iterator", "field_it"),
+                "field.begin()"),
+            ]+[
+            Initializer(
+                Value("numpy_array<value_type>::iterator", "result%d_it" % i),
+                "result%d.begin()" % i)
+            for i in range(discr.dimensions)
+            ]+[
+            Line(),
+            For("element_number_t eg_el_nr = 0",
+                "eg_el_nr < to_ers.size()",
+                "++eg_el_nr",
+                Block([
+                    Initializer(
+                        Value("node_number_t", "from_el_base"),
+                        "from_ers.start() + eg_el_nr*%d" % col_count),
+                    Initializer(
+                        Value("node_number_t", "to_el_base"),
+                        "to_ers.start() + eg_el_nr*%d" % row_count),
+                    Line(),
+                    ]+get_element_matvec_code(discr.dimensions,
+                        row_count, col_count, "&field_it[from_el_base]")+[
+                    Line(),
+                    For("unsigned i = 0", "i < %d" % row_count, "++i",
+                        Block([
+                            S("result%d_it[to_el_base+i] = acc[%d][i]"
+                                % (rst, rst))
+                            for rst in range(discr.dimensions)
+                            ]))
+                    ]))
+            ])
+
+        mod.add_function(FunctionBody(fdecl, fbody))
+
+        return self._instrument(
+                mod.compile(self.discr.toolchain).diff, elgroup, dtype)
+
+    def _instrument(self, compiled_func, elgroup, dtype):
+        discr = self.discr
+        ldis = elgroup.local_discretization
 
         if self.discr.instrumented:
             from hedge.tools import time_count_flop
@@ -198,10 +302,16 @@ class JitDifferentiator:
                         +
                         2 * discr.dimensions
                         * len(elgroup.members) * ldis.node_count()),
-                    increment=discr.dimensions)
+                    increment=discr.dimensions,
+                    byte_counter=discr.diff_byte_counter,
+                    byte_count=dtype.itemsize*(
+                        (1 + discr.dimensions) # read field, write results
+                        * ldis.node_count() * len(elgroup.members)
+                        + discr.dimensions # matrices
+                        * ldis.node_count()**2),
+                    bandwidth=discr.diff_bandwidth)
 
         return compiled_func
-        # }}}
     # }}}
 
     # {{{ invocation
@@ -217,12 +327,29 @@ class JitDifferentiator:
                 from pytools import to_uncomplex_dtype
                 uncomplex_dtype = to_uncomplex_dtype(field.dtype)
                 matrices = rep_op.matrices(eg)
-                args = ([rep_op.preimage_ranges(eg), eg.ranges, field]
-                        + [m.astype(uncomplex_dtype) for m in matrices]
-                        + result)
 
-                diff_routine = self.make_diff(eg, field.dtype,
-                        matrices[0].shape)
+                if self.specialize:
+                    try:
+                        flat_matrices = self.matrix_cache[
+                                eg, rep_op, uncomplex_dtype]
+                    except KeyError:
+                        flat_matrices = self.matrix_cache[
+                                eg, rep_op, uncomplex_dtype] = [
+                                numpy.ascontiguousarray(m,
+                                    dtype=uncomplex_dtype).reshape(-1)
+                                for m in matrices]
+
+                    args = ([rep_op.preimage_ranges(eg), eg.ranges, field]
+                            + flat_matrices + result)
+                    diff_routine = self.make_specialized_diff(
+                            eg, field.dtype, matrices[0].shape)
+                else:
+                    args = ([rep_op.preimage_ranges(eg), eg.ranges, field]
+                            + [m.astype(uncomplex_dtype) for m in matrices]
+                            + result)
+                    diff_routine = self.make_diff(eg, field.dtype,
+                            matrices[0].shape)
+
                 diff_routine(*args)
 
         return [result[op.rst_axis] for op in operators]
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""Just-in-time compiling backend: element-local kernels specialized
+for fixed element sizes."""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2008 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+
+import numpy
+from pytools import memoize_method
+
+
+
+
+# The code generated below applies a fixed number of small matrices of
+# compile-time size to one element at a time. The matrices are copied,
+# transposed, into static storage aligned for vector loads, and applied
+# in "axpy" order, so that the innermost loop runs over contiguous rows
+# with a constant trip count and vectorizes without reassociating sums.
+
+ALIGNMENT = 32
+
+# Column loops up to this length are unrolled completely.
+UNROLL_LIMIT = 32
+
+
+
+
+def get_specialized_preamble():
+    from cgen import Line
+
+    return [
+        Line("#if defined(__GNUC__) && !defined(__clang__) \\"),
+        Line("  && (__GNUC__ > 4 || (__GNUC__ == 4 && __GNUC_MINOR__ >= 9))"),
+        Line("#define HEDGE_IVDEP _Pragma(\"GCC ivdep\")"),
+        Line("#else"),
+        Line("#define HEDGE_IVDEP"),
+        Line("#endif"),
+        Line(),
+        ]
+
+
+
+
+def get_matrix_copy_code(matrix_names, row_count, col_count):
+    """Generate code that copies the matrices in the
+    ``numpy_array<uncomplex_type>`` variables *matrix_names*, flattened in
+    C order, into the aligned array ``mat_t[m][j][i]``.
+    """
+    from cgen import Statement, If, For, Block, Line
+
+    S = Statement
+    return [
+        S("static uncomplex_type mat_t[%d][%d][%d] "
+            "__attribute__ ((aligned (%d)))"
+            % (len(matrix_names), col_count, row_count, ALIGNMENT)),
+        Line(),
+        ]+[
+        If("%s.size() != %d" % (mat_name, row_count*col_count),
+            S('throw(std::runtime_error("unexpected matrix size"))'))
+        for mat_name in matrix_names
+        ]+[
+        Line(),
+        ]+[
+        For("unsigned i = 0", "i < %d" % row_count, "++i",
+            For("unsigned j = 0", "j < %d" % col_count, "++j",
+                Block([
+                    S("mat_t[%d][j][i] = %s.begin()[i*%d+j]"
+                        % (mat_nr, mat_name, col_count))
+                    for mat_nr, mat_name in enumerate(matrix_names)
+                    ])))
+        ]
+
+
+
+
+def get_element_matvec_code(mat_count, row_count, col_count, src_expr):
+    """Generate code that computes ``acc[m][i]``, the product of matrix
+    *m* stored by :func:`get_matrix_copy_code` with the *col_count*
+    values starting at the C++ expression *src_expr*.
+    """
+    from cgen import Statement, Initializer, Value, Const, Pointer, \
+            Block, For, Line
+
+    S = Statement
+
+    def axpy(j):
+        result = []
+        for m in range(mat_count):
+            result.extend([
+                Line("HEDGE_IVDEP"),
+                For("unsigned i = 0", "i < %d" % row_count, "++i",
+                    S("acc[%d][i] += mat_t[%d][%s][i]*src_j" % (m, m, j)))
+                ])
+        return result
+
+    if col_count <= UNROLL_LIMIT:
+        col_loop = [
+            Block([
+                Initializer(Const(Value("value_type", "src_j")),
+                    "src[%d]" % j),
+                ]+axpy(j))
+            for j in range(col_count)]
+    else:
+        col_loop = [
+            For("unsigned j = 0", "j < %d" % col_count, "++j",
+                Block([
+                    Initializer(Const(Value("value_type", "src_j")),
+                        "src[j]"),
+                    ]+axpy("j")))
+            ]
+
+    return [
+        S("value_type acc[%d][%d] __attribute__ ((aligned (%d)))"
+            % (mat_count, row_count, ALIGNMENT)),
+        ]+[
+        For("unsigned i = 0", "i < %d" % row_count, "++i",
+            Block([S("acc[%d][i] = 0" % m) for m in range(mat_count)])),
+        Line(),
+        Initializer(
+            Pointer(Value("const value_type", "__restrict__ src")),
+            src_expr),
+        Line(),
+        ]+col_loop
+
+
+
+
+def get_specialized_module(dtype):
+    """Return a :class:`codepy.bpl.BoostPythonModule` set up for
+    element-local kernels operating on data of type *dtype*.
+    """
+    from cgen import Statement, Include, Line, Typedef, POD
+    from pytools import to_uncomplex_dtype
+
+    from codepy.bpl import BoostPythonModule
+    mod = BoostPythonModule()
+
+    S = Statement
+    mod.add_to_preamble([
+        Include("stdexcept"),
+        Include("hedge/face_operators.hpp"),
+        Include("hedge/volume_operators.hpp"),
+        Include("boost/foreach.hpp"),
+        Line(),
+        ]+get_specialized_preamble())
+
+    mod.add_to_module([
+        S("using namespace hedge"),
+        S("using namespace pyublas"),
+        Line(),
+        Typedef(POD(dtype, "value_type")),
+        Typedef(POD(to_uncomplex_dtype(dtype), "uncomplex_type")),
+        Line(),
+        ])
+
+    return mod
+
+
+
+
+class JitElementwiseLinear:
+    """Applies element-local linear operators (such as mass matrices and
+    filters) with kernels specialized for the element size. Can be used
+    in place of :meth:`hedge.backends.jit.Executor.do_elementwise_linear`.
+    """
+
+    def __init__(self, discr):
+        self.discr = discr
+        self.matrix_cache = {}
+
+    @memoize_method
+    def make_elwise(self, elgroup, dtype, shape, with_scale):
+        from hedge._internal import UniformElementRanges
+        assert isinstance(elgroup.ranges, UniformElementRanges)
+
+        from cgen import (
+                FunctionDeclaration, FunctionBody,
+                Const, Reference, Value,
+                Statement, Line, Block, Initializer, Assign,
+                For, If)
+
+        row_count, col_count = shape
+        mod = get_specialized_module(dtype)
+
+        S = Statement
+        fdecl = FunctionDeclaration(
+                    Value("void", "elwise"),
+                    [
+                    Const(Reference(Value("uniform_element_ranges", "from_ers"))),
+                    Const(Reference(Value("uniform_element_ranges", "to_ers"))),
+                    Value("numpy_array<uncomplex_type>", "matrix"),
+                    Value("numpy_array<value_type>", "field"),
+                    Value("numpy_array<value_type>", "result"),
+                    ]+[
+                    Const(Reference(Value("numpy_array<double>", "coefficients")))
+                    for i in range(int(with_scale))
+                    ])
+
+        if with_scale:
+            scale = "uncomplex_type(coefficients.begin()[eg_el_nr]) * "
+        else:
+            scale = ""
+
+        fbody = Block([
+            If("%d != to_ers.el_size()" % row_count,
+                S('throw(std::runtime_error("unsupported image element size"))')),
+            If("%d != from_ers.el_size()" % col_count,
+                S('throw(std::runtime_error("unsupported preimage element size"))')),
+            If("from_ers.size() != to_ers.size()",
+                S('throw(std::runtime_error("image and preimage element groups '
+                    'do not have the same element count"))')),
+            Line(),
+            ]+get_matrix_copy_code(["matrix"], row_count, col_count)+[
+            Line(),
+            Initializer(
+                Value("numpy_array<value_type>::const_iterator", "field_it"),
+                "field.begin()"),
+            Initializer(
+                Value("numpy_array<value_type>::iterator", "result_it"),
+                "result.begin()"),
+            Line(),
+            For("element_number_t eg_el_nr = 0",
+                "eg_el_nr < to_ers.size()",
+                "++eg_el_nr",
+                Block([
+                    Initializer(
+                        Value("node_number_t", "from_el_base"),
+                        "from_ers.start() + eg_el_nr*%d" % col_count),
+                    Initializer(
+                        Value("node_number_t", "to_el_base"),
+                        "to_ers.start() + eg_el_nr*%d" % row_count),
+                    Line(),
+                    ]+get_element_matvec_code(1, row_count, col_count,
+                        "&field_it[from_el_base]")+[
+                    Line(),
+                    For("unsigned i = 0", "i < %d" % row_count, "++i",
+                        S("result_it[to_el_base+i] += %sacc[0][i]" % scale))
+                    ]))
+            ])
+
+        mod.add_function(FunctionBody(fdecl, fbody))
+
+        return mod.compile(self.discr.toolchain).elwise
+
+    def __call__(self, op, field, out):
+        from pytools import to_uncomplex_dtype
+        uncomplex_dtype = to_uncomplex_dtype(field.dtype)
+
+        for eg in self.discr.element_groups:
+            try:
+                shape, matrix, coeffs = \
+                        self.matrix_cache[eg, op, uncomplex_dtype]
+            except KeyError:
+                matrix = numpy.asarray(op.matrix(eg), dtype=uncomplex_dtype)
+                shape = matrix.shape
+                matrix = numpy.ascontiguousarray(matrix).reshape(-1)
+
+                coeffs = op.coefficients(eg)
+                if coeffs is not None:
+                    coeffs = numpy.asarray(coeffs, dtype=numpy.float64)
+
+                self.matrix_cache[eg, op, uncomplex_dtype] = \
+                        shape, matrix, coeffs
+
+            args = [eg.ranges, eg.ranges, matrix, field, out]
+            if coeffs is not None:
+                args.append(coeffs)
+
+            self.make_elwise(eg, field.dtype, shape,
+                    coeffs is not None)(*args)
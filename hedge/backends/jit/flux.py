@@ -36,9 +36,10 @@ from hedge.flux import FluxIdentityMapper
 
 # flux to code mapper ---------------------------------------------------------
 class FluxConcretizer(FluxIdentityMapper):
-    def __init__(self, flux_idx, fvi):
+    def __init__(self, flux_idx, fvi, ensemble=False):
         self.flux_idx = flux_idx
         self.flux_var_info = fvi
+        self.ensemble = ensemble
 
     def map_field_component(self, expr):
         if expr.is_interior:
@@ -53,7 +54,11 @@ class FluxConcretizer(FluxIdentityMapper):
             return 0
         else:
             from pymbolic import var
-            return var(arg_name+"_it")[var(where+"_idx")]
+            idx = var(where+"_idx")
+            if self.ensemble:
+                # member m of an ensemble argument, see _get_member_loop
+                idx = idx + var("m")*var(arg_name+"_stride")
+            return var(arg_name+"_it")[idx]
 
     def map_scalar_parameter(self, expr):
         from pymbolic import var
@@ -111,7 +116,8 @@ class FluxToCodeMapper(CCodeMapper):
 
 
 
-def flux_to_code(f2c, is_flipped, flux_idx, fvi, flux, prec):
+def flux_to_code(f2c, is_flipped, flux_idx, fvi, flux, prec,
+        ensemble=False):
     # If you are intending to modify how flux flipping is done,
     # consider this: Fluxes may contain CSEs. If you do something
     # just to the result of this function, you will miss the CSEs,
@@ -123,7 +129,7 @@ def flux_to_code(f2c, is_flipped, flux_idx, fvi, flux, prec):
         from hedge.flux import FluxFlipper
         flux = FluxFlipper()(flux)
 
-    return f2c(FluxConcretizer(flux_idx, fvi)(flux), prec)
+    return f2c(FluxConcretizer(flux_idx, fvi, ensemble)(flux), prec)
 
 
 
@@ -138,7 +144,7 @@ def get_flux_var_info(fluxes):
 
     fvi = FluxVariableInfo(
             scalar_parameters=None,
-            arg_specs=[],
+            arg_specs=[], # (field_expr, boundary tag or None if volume)
             arg_names=[],
             flux_idx_and_dep_to_arg_name={}, # or 0 if zero
             )
@@ -157,11 +163,13 @@ def get_flux_var_info(fluxes):
                 scalar_parameters.add(dep)
             elif isinstance(dep, FieldComponent):
                 is_bdry = isinstance(flux_binding.field, BoundaryPair)
+                bdry_tag = None
                 if is_bdry:
                     if dep.is_interior:
                         this_field_expr = flux_binding.field.field
                     else:
                         this_field_expr = flux_binding.field.bfield
+                        bdry_tag = flux_binding.field.tag
                 else:
                     this_field_expr = flux_binding.field
 
@@ -184,14 +192,17 @@ def get_flux_var_info(fluxes):
                 if is_zero(fc_field_expr):
                     fvi.flux_idx_and_dep_to_arg_name[flux_idx, dep] = 0
                 else:
-                    if fc_field_expr not in field_expr_to_arg_name:
+                    # boundary data of different tags lives in
+                    # different vectors, even if the expressions agree
+                    arg_key = fc_field_expr, bdry_tag
+                    if arg_key not in field_expr_to_arg_name:
                         arg_name = "arg%d" % len(fvi.arg_specs)
-                        field_expr_to_arg_name[fc_field_expr] = arg_name
+                        field_expr_to_arg_name[arg_key] = arg_name
 
                         fvi.arg_names.append(arg_name)
-                        fvi.arg_specs.append((fc_field_expr, dep.is_interior))
+                        fvi.arg_specs.append(arg_key)
                     else:
-                        arg_name = field_expr_to_arg_name[fc_field_expr]
+                        arg_name = field_expr_to_arg_name[arg_key]
 
                     set_or_check(
                             fvi.flux_idx_and_dep_to_arg_name,
@@ -233,7 +244,55 @@ def get_flux_toolchain(discr, fluxes):
 
 
 
-def get_interior_flux_mod(fluxes, fvi, discr, dtype):
+def _get_ensemble_arg_struct_fields(fvi):
+    """Return the argument structure fields that describe an ensemble:
+    the member count and, for each argument, the distance between the
+    data of consecutive members, which is zero for arguments shared by
+    all members.
+    """
+    from cgen import Value
+    return [Value("unsigned", "member_count")] + [
+            Value("unsigned", "%s_stride" % arg_name)
+            for arg_name in fvi.arg_names]
+
+
+
+
+def _get_ensemble_init_code(fvi):
+    from cgen import Const, Value, Initializer
+    return [
+        Initializer(Const(Value("unsigned", "member_count")),
+            "args.member_count"),
+        Initializer(Const(Value("unsigned", "fof_stride")),
+            "args.flux0_on_faces.size() / member_count"),
+        ]+[
+        Initializer(Const(Value("unsigned", "%s_stride" % arg_name)),
+            "args.%s_stride" % arg_name)
+        for arg_name in fvi.arg_names
+        ]
+
+
+
+
+def _get_member_loop(code):
+    """Wrap *code*, which evaluates the fluxes at one face node, in a loop
+    over the ensemble members, so that the face pair data and index lists
+    are read once for all members.
+    """
+    from cgen import For, Block
+    return [For("unsigned m = 0", "m < member_count", "++m", Block(code))]
+
+
+
+
+def get_interior_flux_mod(fluxes, fvi, discr, dtype,
+        ensemble=False):
+    """
+    :param ensemble: if *True*, the arguments and face vectors hold the
+      data of ``args.member_count`` ensemble members one after the other,
+      and the generated *gather_flux* function evaluates the fluxes of
+      all members in a loop inside the loop over face nodes.
+    """
     from cgen import \
             FunctionDeclaration, FunctionBody, \
             Const, Reference, Value, MaybeUnused, Typedef, POD, \
@@ -274,7 +333,7 @@ def get_interior_flux_mod(fluxes, fvi, discr, dtype):
         Value("value_type" if scalar_par.is_complex else "uncomplex_type",
             "_scalar_arg_%d" % i)
         for i, scalar_par in enumerate(fvi.scalar_parameters)
-        ])
+        ]+(_get_ensemble_arg_struct_fields(fvi) if ensemble else []))
 
     mod.add_struct(arg_struct, "ArgStruct")
     mod.add_to_module([Line()])
@@ -291,20 +350,32 @@ def get_interior_flux_mod(fluxes, fvi, discr, dtype):
     def gen_flux_code():
         f2cm = FluxToCodeMapper()
 
+        if ensemble:
+            fof_base = "m*fof_stride+"
+        else:
+            fof_base = ""
+
         result = [
-                Assign("fof%d_it[%s_fof_base+%s]" % (flux_idx, where, tgt_idx),
+                Assign("fof%d_it[%s%s_fof_base+%s]"
+                    % (flux_idx, fof_base, where, tgt_idx),
                     "uncomplex_type(fp.int_side.face_jacobian) * " +
-                    flux_to_code(f2cm, is_flipped, flux_idx, fvi, flux.op.flux, PREC_PRODUCT))
+                    flux_to_code(f2cm, is_flipped, flux_idx, fvi, flux.op.flux,
+                        PREC_PRODUCT, ensemble))
                 for flux_idx, flux in enumerate(fluxes)
                 for where, is_flipped, tgt_idx in [
                     ("int_side", False, "i"),
                     ("ext_side", True, "ext_native_write_map[i]")
                     ]]
 
-        return [
+        code = [
             Initializer(Value("value_type", cse_name), cse_str)
             for cse_name, cse_str in f2cm.cse_name_list] + result
 
+        if ensemble:
+            return _get_member_loop(code)
+        else:
+            return code
+
     fbody = Block([
         Initializer(
             Const(Value("numpy_array<value_type>::iterator", "fof%d_it" % i)),
@@ -315,7 +386,7 @@ def get_interior_flux_mod(fluxes, fvi, discr, dtype):
             Const(Value("numpy_array<value_type>::const_iterator", "%s_it" % arg_name)),
             "args.%s.begin()" % arg_name)
         for arg_name in fvi.arg_names
-        ]+[
+        ]+(_get_ensemble_init_code(fvi) if ensemble else [])+[
         Line(),
         CustomLoop("BOOST_FOREACH(const face_pair<straight_face> &fp, fg.face_pairs)", Block(
             list(flatten([
@@ -359,7 +430,8 @@ def get_interior_flux_mod(fluxes, fvi, discr, dtype):
 
 
 
-def get_boundary_flux_mod(fluxes, fvi, discr, dtype):
+def get_boundary_flux_mod(fluxes, fvi, discr, dtype, ensemble=False):
+    """Like :func:`get_interior_flux_mod`, but for boundary fluxes."""
     from cgen import \
             FunctionDeclaration, FunctionBody, Typedef, Struct, \
             Const, Reference, Value, POD, MaybeUnused, \
@@ -395,7 +467,7 @@ def get_boundary_flux_mod(fluxes, fvi, discr, dtype):
         ]+[
         Value("numpy_array<value_type>", arg_name)
         for arg_name in fvi.arg_names
-        ])
+        ]+(_get_ensemble_arg_struct_fields(fvi) if ensemble else []))
 
     mod.add_struct(arg_struct, "ArgStruct")
     mod.add_to_module([Line()])
@@ -412,17 +484,28 @@ def get_boundary_flux_mod(fluxes, fvi, discr, dtype):
     def gen_flux_code():
         f2cm = FluxToCodeMapper()
 
+        if ensemble:
+            fof_base = "m*fof_stride+"
+        else:
+            fof_base = ""
+
         result = [
-                Assign("fof%d_it[loc_fof_base+i]" % flux_idx,
+                Assign("fof%d_it[%sloc_fof_base+i]" % (flux_idx, fof_base),
                     "uncomplex_type(fp.int_side.face_jacobian) * " +
-                    flux_to_code(f2cm, False, flux_idx, fvi, flux.op.flux, PREC_PRODUCT))
+                    flux_to_code(f2cm, False, flux_idx, fvi, flux.op.flux,
+                        PREC_PRODUCT, ensemble))
                 for flux_idx, flux in enumerate(fluxes)
                 ]
 
-        return [
+        code = [
             Initializer(Value("value_type", cse_name), cse_str)
             for cse_name, cse_str in f2cm.cse_name_list] + result
 
+        if ensemble:
+            return _get_member_loop(code)
+        else:
+            return code
+
     fbody = Block([
         Initializer(
             Const(Value("numpy_array<value_type>::iterator", "fof%d_it" % i)),
@@ -434,7 +517,7 @@ def get_boundary_flux_mod(fluxes, fvi, discr, dtype):
                 "%s_it" % arg_name)),
             "args.%s.begin()" % arg_name)
         for arg_name in fvi.arg_names
-        ]+[
+        ]+(_get_ensemble_init_code(fvi) if ensemble else [])+[
         Line(),
         CustomLoop("BOOST_FOREACH(const face_pair<straight_face> &fp, fg.face_pairs)", Block(
             list(flatten([
@@ -475,3 +558,410 @@ def get_boundary_flux_mod(fluxes, fvi, discr, dtype):
     #raw_input("[Enter]")
 
     return mod.compile(get_flux_toolchain(discr, fluxes))
+
+
+
+
+# fused flux gather and lift --------------------------------------------------
+def _get_flux_lift_arg_struct(result_count, fvi, extra_fields=[]):
+    from cgen import Struct, Value
+
+    return Struct("arg_struct", [
+        Value("numpy_array<value_type>", "flux%d_result" % i)
+        for i in range(result_count)
+        ]+extra_fields+[
+        Value("numpy_array<value_type>", arg_name)
+        for arg_name in fvi.arg_names
+        ]+[
+        Value("value_type" if scalar_par.is_complex else "uncomplex_type",
+            "_scalar_arg_%d" % i)
+        for i, scalar_par in enumerate(fvi.scalar_parameters)
+        ])
+
+
+
+
+def _get_flux_lift_iterator_code(result_count, fvi):
+    from cgen import Const, Value, Initializer
+
+    return [
+        Initializer(
+            Const(Value("numpy_array<value_type>::iterator", "result%d_it" % i)),
+            "args.flux%d_result.begin()" % i)
+        for i in range(result_count)
+        ]+[
+        Initializer(
+            Const(Value("numpy_array<value_type>::const_iterator",
+                "%s_it" % arg_name)),
+            "args.%s.begin()" % arg_name)
+        for arg_name in fvi.arg_names
+        ]
+
+
+
+
+def _get_lift_matrix_code(lift_matrix, elwise_post_scaling=None):
+    """Generate declarations of the lift matrix data for the face group
+    *fg*, taken from the C++ expressions *lift_matrix* and (if lifted
+    fluxes are to be scaled) *elwise_post_scaling*.
+    """
+    from cgen import Const, Value, Initializer
+
+    result = [
+        Initializer(Const(Value("unsigned", "face_length")),
+            "fg.face_length()"),
+        Initializer(Const(Value("unsigned", "el_face_dofs")),
+            "fg.face_count*face_length"),
+        Initializer(Const(Value("unsigned", "lift_row_count")),
+            "%s.size() / el_face_dofs" % lift_matrix),
+        Initializer(
+            Const(Value("numpy_array<uncomplex_type>::const_iterator",
+                "lift_matrix_it")),
+            "%s.begin()" % lift_matrix),
+        ]
+
+    if elwise_post_scaling is not None:
+        result.append(Initializer(
+            Const(Value("numpy_array<double>::const_iterator",
+                "elwise_post_scaling_it")),
+            "%s.begin()" % elwise_post_scaling))
+
+    return result
+
+
+
+
+def _get_flux_lift_code(result_indices, with_scale, where):
+    """Generate code that lifts the fluxes on the *where* side of the
+    current face pair and adds them to the results. Slot *j* of the face
+    flux buffer goes to the result numbered *result_indices[j]*.
+    """
+    from cgen import Value, Initializer, Block, For, Statement, Line
+
+    if with_scale:
+        scale = ("uncomplex_type(elwise_post_scaling_it[fp.%s.local_el_number]) * "
+                % where)
+    else:
+        scale = ""
+
+    return Block([
+        Initializer(Value("node_number_t", "write_base"),
+            "fg.local_el_write_base[fp.%s.local_el_number]" % where),
+        Initializer(Value("unsigned", "col_base"),
+            "fp.%s.face_id*face_length" % where),
+        Line(),
+        For("unsigned row = 0",
+            "row < lift_row_count",
+            "++row",
+            Block([
+                Initializer(Value("unsigned", "mat_base"),
+                    "row*el_face_dofs + col_base"),
+                ]+[
+                Initializer(Value("value_type", "tmp%d" % slot), 0)
+                for slot in range(len(result_indices))
+                ]+[
+                Line(),
+                For("unsigned j = 0",
+                    "j < face_length",
+                    "++j",
+                    Block([
+                        Initializer(Value("uncomplex_type", "mat_entry"),
+                            "lift_matrix_it[mat_base+j]"),
+                        ]+[
+                        Statement("tmp%d += mat_entry*%s_face_fluxes[%d*face_length+j]"
+                            % (slot, where, slot))
+                        for slot in range(len(result_indices))
+                        ])),
+                Line(),
+                ]+[
+                Statement("result%d_it[write_base+row] += %stmp%d"
+                    % (result_idx, scale, slot))
+                for slot, result_idx in enumerate(result_indices)
+                ]))
+        ])
+
+
+
+
+def _get_face_pair_loop_code(slot_fluxes, result_indices, fvi, with_scale,
+        is_boundary):
+    """Generate code that evaluates fluxes on all face pairs of the face
+    group *fg* and lifts them right away.
+
+    :param slot_fluxes: a list with one entry per face flux buffer slot,
+      each a list of tuples *(flux_idx, flux_binding)* whose fluxes are
+      summed into that slot. *flux_idx* refers to *fvi*.
+    :param result_indices: the number of the result each slot is lifted
+      into.
+    """
+    from cgen import (Value, MaybeUnused, Initializer, Assign, Line, Block,
+            CustomLoop, For, Statement)
+    from pytools import flatten
+    from pymbolic.mapper.stringifier import PREC_PRODUCT, PREC_SUM
+
+    if is_boundary:
+        sides = ["int_side"]
+        flux_targets = [("int_side", False, "i")]
+    else:
+        sides = ["int_side", "ext_side"]
+        flux_targets = [
+                ("int_side", False, "i"),
+                ("ext_side", True, "ext_native_write_map[i]")
+                ]
+
+    def gen_flux_code():
+        f2cm = FluxToCodeMapper()
+
+        def get_slot_code(is_flipped, fluxes):
+            if len(fluxes) == 1:
+                (flux_idx, flux), = fluxes
+                return flux_to_code(f2cm, is_flipped, flux_idx, fvi,
+                        flux.op.flux, PREC_PRODUCT)
+            else:
+                return "(%s)" % " + ".join(
+                        flux_to_code(f2cm, is_flipped, flux_idx, fvi,
+                            flux.op.flux, PREC_SUM)
+                        for flux_idx, flux in fluxes)
+
+        result = [
+                Assign("%s_face_fluxes[%d*face_length+%s]"
+                    % (where, slot, tgt_idx),
+                    "uncomplex_type(fp.int_side.face_jacobian) * "
+                    + get_slot_code(is_flipped, fluxes))
+                for slot, fluxes in enumerate(slot_fluxes)
+                for where, is_flipped, tgt_idx in flux_targets]
+
+        return [
+            Initializer(Value("value_type", cse_name), cse_str)
+            for cse_name, cse_str in f2cm.cse_name_list] + result
+
+    if is_boundary:
+        ext_write_map_code = []
+    else:
+        ext_write_map_code = [
+            Initializer(Value("index_lists_t::const_iterator", "ext_native_write_map"),
+                "fg.index_list(fp.ext_native_write_map)"),
+            Line(),
+            ]
+
+    return [
+        # face flux values of one face pair, per side and buffer slot
+        Statement("std::vector<value_type> %s_face_fluxes(%d*face_length)"
+            % (where, len(slot_fluxes)))
+        for where in sides
+        ]+[
+        Line(),
+        CustomLoop("BOOST_FOREACH(const face_pair<straight_face> &fp, fg.face_pairs)", Block(
+            list(flatten([
+            Initializer(Value("node_number_t", "%s_ebi" % where),
+                "fp.%s.el_base_index" % where),
+            Initializer(Value("index_lists_t::const_iterator", "%s_idx_list" % where),
+                "fg.index_list(fp.%s.face_index_list_number)" % where),
+            Line(),
+            ]
+            for where in ["int_side", "ext_side"]
+            ))+ext_write_map_code+[
+            For(
+                "unsigned i = 0",
+                "i < face_length",
+                "++i",
+                Block(
+                    [
+                    Initializer(MaybeUnused(Value("node_number_t", "%s_idx" % where)),
+                        "%(where)s_ebi + %(where)s_idx_list[i]"
+                        % {"where": where})
+                    for where in ["int_side", "ext_side"]
+                    ]+gen_flux_code()
+                    )
+                ),
+            Line(),
+            ]+[
+            _get_flux_lift_code(result_indices, with_scale, where)
+            for where in sides
+            ]))
+        ]
+
+
+
+
+def _make_flux_lift_module(dtype, arg_struct, fdecl, fbody):
+    from cgen import (FunctionBody, Typedef, POD, Statement, Include, Line)
+
+    from codepy.bpl import BoostPythonModule
+    mod = BoostPythonModule()
+
+    from pytools import to_uncomplex_dtype
+
+    S = Statement
+    mod.add_to_preamble([
+        Include("cstdlib"),
+        Include("stdexcept"),
+        Include("vector"),
+        Include("algorithm"),
+        Line(),
+        Include("boost/foreach.hpp"),
+        Line(),
+        Include("hedge/face_operators.hpp"),
+        ])
+
+    mod.add_to_module([
+        S("using namespace hedge"),
+        S("using namespace pyublas"),
+        Line(),
+        Typedef(POD(dtype, "value_type")),
+        Typedef(POD(to_uncomplex_dtype(dtype), "uncomplex_type")),
+        Line(),
+        ])
+
+    mod.add_struct(arg_struct, "ArgStruct")
+    mod.add_to_module([Line()])
+
+    mod.add_function(FunctionBody(fdecl, fbody))
+    return mod
+
+
+
+
+def get_flux_lift_mod(fluxes, fvi, discr, dtype, with_scale, is_boundary):
+    """Like :func:`get_interior_flux_mod` and :func:`get_boundary_flux_mod`,
+    but the generated *gather_and_lift_flux* function immediately lifts the
+    fluxes on each face pair and adds them to the per-flux volume results,
+    instead of storing them in face vectors.
+    """
+    from cgen import (FunctionDeclaration, Const, Reference, Value, Block,
+            Line)
+
+    extra_fields = [Value("numpy_array<uncomplex_type>", "lift_matrix")]
+    if with_scale:
+        extra_fields.append(
+                Value("numpy_array<double>", "elwise_post_scaling"))
+        scaling_expr = "args.elwise_post_scaling"
+    else:
+        scaling_expr = None
+
+    fdecl = FunctionDeclaration(
+            Value("void", "gather_and_lift_flux"),
+            [
+                Const(Reference(Value("face_group<face_pair<straight_face> >", "fg"))),
+                Reference(Value("arg_struct", "args"))
+                ])
+
+    result_indices = range(len(fluxes))
+    fbody = Block(
+            _get_flux_lift_iterator_code(len(fluxes), fvi)
+            + [Line()]
+            + _get_lift_matrix_code("args.lift_matrix", scaling_expr)
+            + [Line()]
+            + _get_face_pair_loop_code(
+                [[(i, flux)] for i, flux in enumerate(fluxes)],
+                result_indices, fvi, with_scale, is_boundary))
+
+    mod = _make_flux_lift_module(dtype,
+            _get_flux_lift_arg_struct(len(fluxes), fvi, extra_fields),
+            fdecl, fbody)
+
+    return mod.compile(get_flux_toolchain(discr, fluxes))
+
+
+
+
+def get_whole_domain_flux_lift_mod(fluxes, flux_result_indices,
+        flux_segment_kinds, result_count, fvi, discr, dtype, with_scale):
+    """Generate a module whose *gather_and_lift_flux(segments, args)*
+    function evaluates and lifts interior and boundary fluxes in a single
+    call.
+
+    *segments* is a sequence of tuples *(kind, fg, lift_matrix,
+    elwise_post_scaling)*, where *fg* is a face group and *kind* is 0 for
+    interior face groups and *n+1* for face groups of the *n*-th boundary.
+    *lift_matrix* must be flattened in C order and *elwise_post_scaling*
+    is only read if *with_scale* is true.
+
+    :param fluxes: a flat list of flux operator bindings.
+    :param flux_result_indices: the number of the result each entry of
+      *fluxes* is added to.
+    :param flux_segment_kinds: the segment kind on which each entry of
+      *fluxes* is evaluated.
+    """
+    from cgen import (FunctionDeclaration, Value, Block, Line, Const,
+            Reference, Initializer, For, If, Statement)
+
+    # {{{ per-kind face pair loops
+
+    kind_codes = []
+    for kind in sorted(set(flux_segment_kinds)):
+        slot_fluxes = []
+        result_indices = []
+        for flux_idx, (flux, result_idx, flux_kind) in enumerate(zip(
+                fluxes, flux_result_indices, flux_segment_kinds)):
+            if flux_kind != kind:
+                continue
+
+            try:
+                slot = result_indices.index(result_idx)
+            except ValueError:
+                result_indices.append(result_idx)
+                slot_fluxes.append([])
+                slot = len(slot_fluxes) - 1
+
+            slot_fluxes[slot].append((flux_idx, flux))
+
+        kind_codes.append((kind, Block(_get_face_pair_loop_code(
+            slot_fluxes, result_indices, fvi, with_scale,
+            is_boundary=kind != 0))))
+
+    kind_dispatch = Statement(
+            "throw std::runtime_error(\"invalid face group segment kind\")")
+    for kind, code in reversed(kind_codes):
+        kind_dispatch = If("kind == %d" % kind, code, kind_dispatch)
+
+    # }}}
+
+    fg_type = "face_group<face_pair<straight_face> >"
+    segment_code = [
+        Initializer(Const(Value("boost::python::object", "segment")),
+            "segments[seg_nr]"),
+        Initializer(Const(Value("int", "kind")),
+            "boost::python::extract<int>(segment[0])"),
+        Initializer(Const(Reference(Value(fg_type, "fg"))),
+            "boost::python::extract<const %s &>(segment[1])" % fg_type),
+        Initializer(Const(Value("numpy_array<uncomplex_type>", "lift_matrix")),
+            "boost::python::extract<numpy_array<uncomplex_type> >(segment[2])"),
+        ]
+
+    if with_scale:
+        segment_code.append(Initializer(
+            Const(Value("numpy_array<double>", "elwise_post_scaling")),
+            "boost::python::extract<numpy_array<double> >(segment[3])"))
+        scaling_expr = "elwise_post_scaling"
+    else:
+        scaling_expr = None
+
+    fdecl = FunctionDeclaration(
+            Value("void", "gather_and_lift_flux"),
+            [
+                Value("boost::python::object", "segments"),
+                Reference(Value("arg_struct", "args"))
+                ])
+
+    fbody = Block(
+            _get_flux_lift_iterator_code(result_count, fvi)
+            + [
+                Line(),
+                Initializer(Const(Value("unsigned", "segment_count")),
+                    "boost::python::len(segments)"),
+                Line(),
+                For("unsigned seg_nr = 0",
+                    "seg_nr < segment_count",
+                    "++seg_nr",
+                    Block(segment_code
+                        + [Line()]
+                        + _get_lift_matrix_code("lift_matrix", scaling_expr)
+                        + [Line(), kind_dispatch]))
+                ])
+
+    mod = _make_flux_lift_module(dtype,
+            _get_flux_lift_arg_struct(result_count, fvi),
+            fdecl, fbody)
+
+    return mod.compile(get_flux_toolchain(discr, fluxes))
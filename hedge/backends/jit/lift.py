@@ -33,8 +33,16 @@ from pytools import memoize_method
 
 
 class JitLifter:
-    def __init__(self, discr):
+    """
+    :param specialize: if *True*, use kernels from
+      :mod:`hedge.backends.jit.elwise`, which are specialized for the
+      element size.
+    """
+
+    def __init__(self, discr, specialize=False):
         self.discr = discr
+        self.specialize = specialize
+        self.matrix_cache = {}
 
     @memoize_method
     def make_lift(self, fgroup, with_scale, dtype):
@@ -149,16 +157,127 @@ class JitLifter:
 
         return mod.compile(self.discr.toolchain).lift
 
-    def __call__(self, fgroup, matrix, scaling, field, out):
-        result = self.discr.volume_zeros(dtype=field.dtype)
+    @memoize_method
+    def make_specialized_lift(self, fgroup, with_scale, dtype, shape):
+        """Like :meth:`make_lift`, but the matrix is passed as a flattened
+        ``numpy`` array, and the element-local products are generated by
+        :func:`hedge.backends.jit.elwise.get_element_matvec_code`.
+        """
+        from cgen import (
+                FunctionDeclaration, FunctionBody,
+                Const, Reference, Value,
+                Statement, Line, Block, Initializer,
+                For, If)
+
+        from hedge.backends.jit.elwise import (
+                get_specialized_module, get_matrix_copy_code,
+                get_element_matvec_code)
+
+        row_count, col_count = shape
+        mod = get_specialized_module(dtype)
 
+        S = Statement
+        fdecl = FunctionDeclaration(
+                    Value("void", "lift"),
+                    [
+                    Const(Reference(Value("face_group<face_pair<straight_face> >", "fg"))),
+                    Value("numpy_array<uncomplex_type>", "matrix"),
+                    Value("numpy_array<value_type>", "field"),
+                    Value("numpy_array<value_type>", "result")
+                    ]+[
+                    Const(Reference(Value("numpy_array<double>",
+                        "elwise_post_scaling")))
+                    for i in range(int(with_scale))
+                    ])
+
+        if with_scale:
+            scale = "value_type(elwise_post_scaling_it[fg_el_nr]) * "
+        else:
+            scale = ""
+
+        fbody = Block([
+            If("%d != fg.face_count*fg.face_length()" % col_count,
+                S('throw(std::runtime_error("unexpected face group size"))')),
+            Line(),
+            ]+get_matrix_copy_code(["matrix"], row_count, col_count)+[
+            Line(),
+            Initializer(
+                Value("numpy_array<value_type>::const_iterator", "field_it"),
+                "field.begin()"),
+            Initializer(
+                Value("numpy_array<value_type>::iterator", "result_it"),
+                "result.begin()"),
+            ]+[
+            Initializer(
+                Value("numpy_array<double>::const_iterator",
+                    "elwise_post_scaling_it"),
+                "elwise_post_scaling.begin()")
+            for i in range(int(with_scale))
+            ]+[
+            Line(),
+            For("unsigned fg_el_nr = 0",
+                "fg_el_nr < fg.element_count()",
+                "++fg_el_nr",
+                Block([
+                    Initializer(
+                        Value("node_number_t", "dest_el_base"),
+                        "fg.local_el_write_base[fg_el_nr]"),
+                    Line(),
+                    ]+get_element_matvec_code(1, row_count, col_count,
+                        "&field_it[%d*fg_el_nr]" % col_count)+[
+                    Line(),
+                    For("unsigned i = 0", "i < %d" % row_count, "++i",
+                        S("result_it[dest_el_base+i] = %sacc[0][i]" % scale))
+                    ]))
+            ])
+
+        mod.add_function(FunctionBody(fdecl, fbody))
+
+        return mod.compile(self.discr.toolchain).lift
+
+    def __call__(self, fgroup, matrix, scaling, field, out):
         from pytools import to_uncomplex_dtype
         uncomplex_dtype = to_uncomplex_dtype(field.dtype)
-        args = [fgroup, matrix.astype(uncomplex_dtype), field, out]
+
+        if self.specialize:
+            # The cache holds on to *matrix*, so that its id stays unique.
+            try:
+                _, flat_matrix = self.matrix_cache[id(matrix), uncomplex_dtype]
+            except KeyError:
+                import numpy
+                flat_matrix = numpy.ascontiguousarray(matrix,
+                        dtype=uncomplex_dtype).reshape(-1)
+                self.matrix_cache[id(matrix), uncomplex_dtype] = \
+                        matrix, flat_matrix
+
+            args = [fgroup, flat_matrix, field, out]
+            lift = self.make_specialized_lift(fgroup,
+                    scaling is not None, field.dtype, matrix.shape)
+        else:
+            args = [fgroup, matrix.astype(uncomplex_dtype), field, out]
+            lift = self.make_lift(fgroup, 
+                    with_scale=scaling is not None, 
+                    dtype=field.dtype)
 
         if scaling is not None:
             args.append(scaling)
 
-        self.make_lift(fgroup, 
-                with_scale=scaling is not None, 
-                dtype=field.dtype)(*args)
+        lift(*args)
+
+
+
+
+def get_flux_lift_data(fg, is_lift, quadrature_tag):
+    """:returns: a tuple *(matrix, scaling)* with which fluxes on the faces
+    of the face group *fg* are lifted, see :meth:`JitLifter.__call__`.
+    *scaling* is *None* unless *is_lift* is true.
+    """
+    if quadrature_tag is None:
+        if is_lift:
+            return (fg.ldis_loc.lifting_matrix(),
+                    fg.local_el_inverse_jacobians)
+        else:
+            return fg.ldis_loc.multi_face_mass_matrix(), None
+    else:
+        assert not is_lift
+        return fg.ldis_loc_quad_info.multi_face_mass_matrix(), None
@@ -37,6 +37,7 @@ from hedge.optemplate import \
         IdentityMapper, \
         FluxOpReducerMixin
 from hedge.tools.futures import Future
+from pytools.log import PostLogQuantity
 from hedge.backends import RunContext
 import pytools.mpiwrap as mpi
 from pymbolic.mapper import CSECachingMapperMixin
@@ -57,8 +58,14 @@ class RankData(pytools.Record):
         pytools.Record.__init__(self, locals())
 
     def reordered_by(self, *args, **kwargs):
-        old_el_numbers = self.mesh.get_reorder_oldnumbers(*args, **kwargs)
-        mesh = self.mesh.reordered(old_el_numbers)
+        new_to_old = self.mesh.get_reorder_oldnumbers(*args, **kwargs)
+        mesh = self.mesh.reordered(new_to_old)
+
+        if self.old_el_numbers is not None:
+            old_el_numbers = [self.old_el_numbers[i] for i in new_to_old]
+        else:
+            old_el_numbers = new_to_old
+
         return self.copy(
                 mesh=mesh,
                 old_el_numbers=old_el_numbers
@@ -168,14 +175,26 @@ class BoundarizeSendFuture(Future):
 
 
 class MPICompletionFuture(Future):
-    def __init__(self, request):
+    def __init__(self, request, pdiscr=None):
         self.request = request
         self.result = None
 
+        if pdiscr is not None and pdiscr.instrumented:
+            from time import time
+            self.overlap = pdiscr.comm_overlap
+            self.wait_timer = pdiscr.comm_wait_timer
+            self.post_time = time()
+        else:
+            self.overlap = None
+
     def is_ready(self):
         if self.request is not None:
             status = mpi.Status()
             if self.request.Test(status):
+                if self.overlap is not None:
+                    from time import time
+                    self.overlap.add(time()-self.post_time, 0)
+
                 self.result = self.finish(status)
                 self.request = None
                 return True
@@ -185,7 +204,18 @@ class MPICompletionFuture(Future):
     def __call__(self):
         if self.request is not None:
             status = mpi.Status()
-            self.request.Wait(status)
+
+            if self.overlap is not None:
+                from time import time
+                wait_start = time()
+                sub_timer = self.wait_timer.start_sub_timer()
+                self.request.Wait(status)
+                sub_timer.stop().submit()
+                wait_end = time()
+                self.overlap.add(wait_end-self.post_time, wait_end-wait_start)
+            else:
+                self.request.Wait(status)
+
             return self.finish(status)
         else:
             return self.result
@@ -193,6 +223,35 @@ class MPICompletionFuture(Future):
 
 
 
+class CommunicationOverlap(PostLogQuantity):
+    """Log the fraction of the time messages spent in flight during
+    which computation proceeded, i.e. one minus the ratio of time
+    blocked in MPI waits to total message time.
+    """
+
+    def __init__(self, name="comm_overlap"):
+        PostLogQuantity.__init__(self, name, "1",
+                "Fraction of message transit time overlapped with computation")
+        self.in_flight = 0
+        self.waited = 0
+
+    def add(self, in_flight, waited):
+        self.in_flight += in_flight
+        self.waited += waited
+
+    def prepare_for_tick(self):
+        self.in_flight = 0
+        self.waited = 0
+
+    def __call__(self):
+        if self.in_flight:
+            return 1 - self.waited/self.in_flight
+        else:
+            return 1
+
+
+
+
 class SendCompletionFuture(MPICompletionFuture):
     def __init__(self, comm, rank, send_vec, pdiscr):
         self.send_vec = send_vec
@@ -200,7 +259,8 @@ class SendCompletionFuture(MPICompletionFuture):
         assert send_vec.dtype == pdiscr.default_scalar_type
 
         MPICompletionFuture.__init__(self,
-                comm.Isend([send_vec, pdiscr.mpi_scalar_type], rank, tag=1))
+                comm.Isend([send_vec, pdiscr.mpi_scalar_type], rank, tag=1),
+                pdiscr)
 
     def finish(self, status):
         return [], []
@@ -222,7 +282,8 @@ class ReceiveCompletionFuture(MPICompletionFuture):
         MPICompletionFuture.__init__(self,
                 pdiscr.context.communicator.Irecv(
                     [self.recv_vec, pdiscr.mpi_scalar_type],
-                    source=rank, tag=1))
+                    source=rank, tag=1),
+                pdiscr)
 
     def finish(self, status):
         return [], [BoundaryConvertFuture(
@@ -257,6 +318,84 @@ class BoundaryConvertFuture(Future):
 
 
 
+class PersistentExchange(object):
+    """Preallocated buffers and persistent MPI requests for exchanging the
+    boundary data of one :class:`hedge.compiler.FluxExchangeBatchAssign`
+    with one neighbor rank.
+
+    Buffers are reused from one operator evaluation to the next. This is
+    safe because operator execution does not finish before all of its
+    communication futures have completed.
+    """
+
+    def __init__(self, pdiscr, shape, rank):
+        self.pdiscr = pdiscr
+        self.rank = rank
+
+        comm = pdiscr.context.communicator
+        bdry_tag = hedge.mesh.TAG_RANK_BOUNDARY(rank)
+
+        self.send_vec = pdiscr.boundary_empty(bdry_tag, shape=shape,
+                kind="numpy-mpi-recv", dtype=pdiscr.default_scalar_type)
+        self.recv_vec = pdiscr.boundary_empty(bdry_tag, shape=shape,
+                kind="numpy-mpi-recv", dtype=pdiscr.default_scalar_type)
+
+        self.send_request = comm.Send_init(
+                [self.send_vec, pdiscr.mpi_scalar_type], rank, tag=1)
+        self.recv_request = comm.Recv_init(
+                [self.recv_vec, pdiscr.mpi_scalar_type], source=rank, tag=1)
+
+
+
+
+class PersistentSendFuture(Future):
+    def __init__(self, exchange, field):
+        self.exchange = exchange
+
+        from hedge.mesh import TAG_RANK_BOUNDARY
+        self.bdry_future = exchange.pdiscr.boundarize_volume_field_async(
+                    field, TAG_RANK_BOUNDARY(exchange.rank), kind="numpy")
+
+        self.is_ready = self.bdry_future.is_ready
+
+    def __call__(self):
+        exchange = self.exchange
+        exchange.send_vec[...] = self.bdry_future()
+        exchange.send_request.Start()
+        return [], [PersistentSendCompletionFuture(exchange)]
+
+
+
+
+class PersistentSendCompletionFuture(MPICompletionFuture):
+    def __init__(self, exchange):
+        MPICompletionFuture.__init__(self, exchange.send_request,
+                exchange.pdiscr)
+
+    def finish(self, status):
+        return [], []
+
+
+
+
+class PersistentReceiveCompletionFuture(MPICompletionFuture):
+    def __init__(self, exchange, indices_and_names):
+        self.exchange = exchange
+        self.indices_and_names = indices_and_names
+
+        exchange.recv_request.Start()
+        MPICompletionFuture.__init__(self, exchange.recv_request,
+                exchange.pdiscr)
+
+    def finish(self, status):
+        exchange = self.exchange
+        return [], [BoundaryConvertFuture(
+            exchange.pdiscr, exchange.rank, self.indices_and_names,
+            exchange.recv_vec)]
+
+
+
+
 def make_custom_exec_mapper_class(superclass):
     class ExecutionMapper(superclass):
         def __init__(self, context, executor):
@@ -273,12 +412,34 @@ def make_custom_exec_mapper_class(superclass):
 
             if self.discr.instrumented:
                 pdiscr.comm_flux_counter.add(len(pdiscr.neighbor_ranks)*len(arg_fields))
-            return ([],
-                    [BoundarizeSendFuture(pdiscr, rank, arg_fields)
+                pdiscr.comm_message_counter.add(2*len(pdiscr.neighbor_ranks))
+                pdiscr.comm_byte_counter.add(2*sum(
+                    len(arg_fields)
+                    * len(pdiscr.get_boundary(
+                        hedge.mesh.TAG_RANK_BOUNDARY(rank)).nodes)
+                    for rank in pdiscr.neighbor_ranks)
+                    * numpy.dtype(pdiscr.default_scalar_type).itemsize)
+
+            if pdiscr.persistent_exchange:
+                exchanges = [
+                        pdiscr.get_persistent_exchange(
+                            insn, arg_fields.shape, rank)
                         for rank in pdiscr.neighbor_ranks]
-                    + [ReceiveCompletionFuture(pdiscr, arg_fields.shape, rank,
-                        insn.rank_to_index_and_name[rank])
-                        for rank in pdiscr.neighbor_ranks])
+
+                # post receives before sends
+                return ([],
+                        [PersistentReceiveCompletionFuture(xchg,
+                            insn.rank_to_index_and_name[xchg.rank])
+                            for xchg in exchanges]
+                        + [PersistentSendFuture(xchg, arg_fields)
+                            for xchg in exchanges])
+            else:
+                return ([],
+                        [BoundarizeSendFuture(pdiscr, rank, arg_fields)
+                            for rank in pdiscr.neighbor_ranks]
+                        + [ReceiveCompletionFuture(pdiscr, arg_fields.shape, rank,
+                            insn.rank_to_index_and_name[rank])
+                            for rank in pdiscr.neighbor_ranks])
 
     return ExecutionMapper
 
@@ -345,6 +506,38 @@ class FluxCommunicationInserter(
 
 
 
+class MPIReductionBatch(hedge.discretization.ReductionBatch):
+    """A :class:`hedge.discretization.ReductionBatch` that reduces across
+    all ranks with at most one native-op allreduce per reduction kind,
+    nonblocking where the MPI implementation supports it.
+    """
+
+    def __init__(self, pdiscr):
+        hedge.discretization.ReductionBatch.__init__(self, pdiscr.subdiscr)
+        self.communicator = pdiscr.context.communicator
+
+    def _start_allreduce(self, kind, buf):
+        op = {"sum": mpi.SUM, "max": mpi.MAX}[kind]
+        result = numpy.empty_like(buf)
+
+        try:
+            request = self.communicator.Iallreduce(
+                    [buf, mpi.DOUBLE], [result, mpi.DOUBLE], op=op)
+        except (AttributeError, NotImplementedError):
+            self.communicator.Allreduce(
+                    [buf, mpi.DOUBLE], [result, mpi.DOUBLE], op=op)
+            return lambda: result
+
+        # keep buf alive until the request completes
+        def get_reduced(buf=buf):
+            request.Wait()
+            return result
+
+        return get_reduced
+
+
+
+
 class ParallelDiscretization(hedge.discretization.TimestepCalculator):
     @classmethod
     def my_debug_flags(cls):
@@ -357,11 +550,25 @@ class ParallelDiscretization(hedge.discretization.TimestepCalculator):
         return cls.my_debug_flags() | subcls.all_debug_flags()
 
     def __init__(self, rcon, subdiscr_class, rank_data, *args, **kwargs):
+        """
+        :param persistent_exchange: If *True* (the default), exchange
+          rank boundary data through preallocated buffers and persistent
+          MPI requests, see :class:`PersistentExchange`.
+        :param reorder: Renumber the local elements by this method, see
+          :meth:`hedge.mesh.ConformalMesh.reordered_by`.
+        """
         debug = set(kwargs.pop("debug", set()))
         self.debug = self.my_debug_flags() & debug
         kwargs["debug"] = debug - self.debug
         kwargs["run_context"] = rcon
 
+        reorder = kwargs.pop("reorder", None)
+        if reorder is not None:
+            rank_data = rank_data.reordered_by(reorder)
+
+        self.persistent_exchange = kwargs.pop("persistent_exchange", True)
+        self.persistent_exchanges = {}
+
         self.subdiscr = subdiscr_class(rank_data.mesh, *args, **kwargs)
         self.subdiscr.exec_mapper_class = make_custom_exec_mapper_class(
                 self.subdiscr.exec_mapper_class)
@@ -390,14 +597,30 @@ class ParallelDiscretization(hedge.discretization.TimestepCalculator):
                 numpy.float32: mpi.FLOAT,
                 }[self.default_scalar_type]
 
-    def add_instrumentation(self, mgr):
-        self.subdiscr.add_instrumentation(mgr)
+    def add_instrumentation(self, mgr, calibrate_bandwidth=True):
+        self.subdiscr.add_instrumentation(mgr,
+                calibrate_bandwidth=calibrate_bandwidth)
+
+        from hedge.log import get_log_reduction_batcher
+        get_log_reduction_batcher(self).attach(mgr)
 
         from pytools.log import EventCounter
         self.comm_flux_counter = EventCounter("n_comm_flux",
                 "Number of inner flux communication runs")
+        self.comm_wait_timer = self.context.make_timer("t_comm_wait",
+                "Time spent blocked waiting for messages")
+        self.comm_overlap = CommunicationOverlap()
+
+        self.comm_message_counter = EventCounter("n_comm_messages",
+                "Number of messages sent and received for flux communication")
+        self.comm_byte_counter = EventCounter("n_comm_bytes",
+                "Number of bytes sent and received for flux communication")
 
         mgr.add_quantity(self.comm_flux_counter)
+        mgr.add_quantity(self.comm_message_counter)
+        mgr.add_quantity(self.comm_byte_counter)
+        mgr.add_quantity(self.comm_wait_timer)
+        mgr.add_quantity(self.comm_overlap)
 
     # property forwards -------------------------------------------------------
     def __len__(self):
@@ -409,6 +632,14 @@ class ParallelDiscretization(hedge.discretization.TimestepCalculator):
         else:
             raise AttributeError(name)
 
+    def get_persistent_exchange(self, insn, shape, rank):
+        try:
+            return self.persistent_exchanges[insn, rank]
+        except KeyError:
+            result = self.persistent_exchanges[insn, rank] = \
+                    PersistentExchange(self, shape, rank)
+            return result
+
     # neighbor connectivity ---------------------------------------------------
     def _setup_neighbor_connections(self):
         comm = self.context.communicator
@@ -601,21 +832,64 @@ class ParallelDiscretization(hedge.discretization.TimestepCalculator):
                         self.subdiscr.prepare_from_neighbor_map(from_indices)
 
     # norm and integral -------------------------------------------------------
+    def make_reduction_batch(self):
+        return MPIReductionBatch(self)
+
+    def _reduce_one(self, method_name, *args):
+        batch = self.make_reduction_batch()
+        result = getattr(batch, method_name)(*args)
+        batch.execute()
+        return result()
+
     def nodewise_dot_product(self, a, b):
-        return self.context.communicator.allreduce(
-                self.subdiscr.nodewise_inner_product(a, b))
+        return self._reduce_one("nodewise_dot_product", a, b)
 
     def norm(self, volume_vector, p=2):
-        def add_norms(x, y):
-            return (x**p + y**p)**(1/p)
-
-        return self.context.communicator.allreduce(
-                self.subdiscr.norm(volume_vector, p),
-                op=add_norms)
+        return self._reduce_one("norm", volume_vector, p)
 
     def integral(self, volume_vector):
-        return self.context.communicator.allreduce(
-                self.subdiscr.integral(volume_vector))
+        return self._reduce_one("integral", volume_vector)
+
+    def nodewise_max(self, a):
+        return self._reduce_one("nodewise_max", a)
+
+    def nodewise_min(self, a):
+        return self._reduce_one("nodewise_min", a)
+
+    def local_nodewise_max(self, a):
+        return self.subdiscr.nodewise_max(a)
+
+    def cfl_timestep(self, speed, diffusivity=0):
+        return self._reduce_one("cfl_timestep", speed, diffusivity)
+
+    # point evaluation --------------------------------------------------------
+    def get_point_interpolator(self, points, use_btree=True, thresh=0,
+            allow_missing=False):
+        """Like :meth:`hedge.discretization.Discretization.get_point_interpolator`.
+
+        Each point is assigned to the lowest-numbered rank containing it.
+        On all other ranks, the value at that point is zero, so that the
+        true values are obtained by summing the results of all ranks.
+        """
+        interp = self.subdiscr.get_point_interpolator(
+                points, use_btree, thresh, allow_missing=True)
+
+        comm = self.context.communicator
+        rank_if_found = numpy.where(interp.found,
+                comm.rank, comm.size).astype(numpy.intc)
+        owner = numpy.empty_like(rank_if_found)
+        comm.Allreduce([rank_if_found, mpi.INT], [owner, mpi.INT], op=mpi.MIN)
+
+        if not allow_missing and (owner == comm.size).any():
+            raise RuntimeError(
+                    "point %s not found. Consider changing threshold."
+                    % numpy.asarray(points)[owner == comm.size][0])
+
+        not_mine = owner != comm.rank
+        interp.coefficients[not_mine] = 0
+        interp.found[not_mine] = False
+
+        return interp
 
     # dt estimation -----------------------------------------------------------
     def dt_non_geometric_factor(self):
@@ -317,6 +317,169 @@ def dot_dataflow_graph(code, max_node_label_length=30,
 
 
 
+# }}}
+
+# {{{ execution profiling -----------------------------------------------------
+def _count_bytes(value):
+    import numpy
+    if isinstance(value, numpy.ndarray):
+        if value.dtype == object:
+            return sum(_count_bytes(sub_value) for sub_value in value.flat)
+        else:
+            return value.nbytes
+    else:
+        return getattr(value, "nbytes", 0)
+
+
+
+
+class ExecutionProfile(object):
+    """Per-instruction timing record for :meth:`Code.execute`.
+
+    Every executed instruction contributes its wall time and the number of
+    bytes it assigned to newly computed values. Every evaluated future
+    contributes the time spent waiting for it, attributed to the
+    instruction that created it.
+
+    :ivar run_count: number of :meth:`Code.execute` calls recorded.
+    :ivar max_trace_events: trace events beyond this number are dropped,
+      while the aggregated statistics in :meth:`get_report` stay complete.
+    """
+
+    class InstructionStats(Record):
+        __slots__ = ["insn", "count", "time", "bytes",
+                "future_count", "future_time", "future_wait_count"]
+
+    def __init__(self, rank=0, max_trace_events=100000):
+        from time import time
+        self.time_origin = time()
+        self.rank = rank
+        self.max_trace_events = max_trace_events
+
+        self.run_count = 0
+        self.trace_events = []
+        self.insn_stats = {}
+
+    def _get_stats(self, insn):
+        try:
+            return self.insn_stats[insn]
+        except KeyError:
+            result = self.insn_stats[insn] = self.InstructionStats(
+                    insn=insn, count=0, time=0, bytes=0,
+                    future_count=0, future_time=0, future_wait_count=0)
+            return result
+
+    @staticmethod
+    def get_label(insn, max_length=60):
+        label = str(insn).replace("\n", " ")
+        if len(label) > max_length:
+            label = label[:max_length-3] + "..."
+        return label
+
+    def _add_trace_event(self, name, category, start, end, args):
+        if len(self.trace_events) >= self.max_trace_events:
+            return
+
+        self.trace_events.append({
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start-self.time_origin)*1e6,
+            "dur": (end-start)*1e6,
+            "pid": self.rank,
+            "tid": 0,
+            "args": args,
+            })
+
+    def start_run(self):
+        self.run_count += 1
+
+    def add_instruction(self, insn, start, end, assignments):
+        bytes = sum(_count_bytes(value) for target, value in assignments)
+
+        stats = self._get_stats(insn)
+        stats.count += 1
+        stats.time += end-start
+        stats.bytes += bytes
+
+        self._add_trace_event(self.get_label(insn), type(insn).__name__,
+                start, end, {"bytes": bytes})
+
+    def add_future(self, origin_insn, start, end, was_ready, assignments):
+        bytes = sum(_count_bytes(value) for target, value in assignments)
+
+        stats = self._get_stats(origin_insn)
+        stats.future_count += 1
+        stats.future_time += end-start
+        stats.bytes += bytes
+        if not was_ready:
+            stats.future_wait_count += 1
+
+        self._add_trace_event(
+                "future of " + self.get_label(origin_insn), "future",
+                start, end, {"bytes": bytes, "was_ready": was_ready})
+
+    # {{{ output
+    def get_report(self):
+        """Return a text report of all recorded instructions, sorted
+        by decreasing total (instruction plus future) time.
+        """
+        all_stats = sorted(self.insn_stats.itervalues(),
+                key=lambda stats: stats.time+stats.future_time,
+                reverse=True)
+
+        total_time = sum(stats.time+stats.future_time for stats in all_stats)
+
+        lines = []
+        lines.append("%d execution(s), %g s total instruction/future time"
+                % (self.run_count, total_time))
+        lines.append("%8s %6s %10s %10s %12s %10s %6s" % (
+            "time [s]", "%", "count", "t/call", "bytes/call", "fut. [s]",
+            "waits"))
+
+        for stats in all_stats:
+            if total_time:
+                percentage = 100*(stats.time+stats.future_time)/total_time
+            else:
+                percentage = 0
+
+            count = max(stats.count, 1)
+
+            lines.append("%8.4f %6.2f %10d %10.3g %12d %10.4f %6d" % (
+                stats.time, percentage, stats.count, stats.time/count,
+                stats.bytes // count, stats.future_time,
+                stats.future_wait_count))
+
+            for insn_line in str(stats.insn).split("\n"):
+                lines.append("    " + insn_line)
+
+        return "\n".join(lines)
+
+    def get_chrome_trace(self):
+        """Return a :mod:`json`-compatible structure in the Chrome trace
+        event format, which is also understood by Perfetto.
+        """
+        return {
+                "traceEvents": self.trace_events,
+                "displayTimeUnit": "ms",
+                }
+
+    def write_chrome_trace(self, outf):
+        import json
+        json.dump(self.get_chrome_trace(), outf)
+
+    def dump(self):
+        """Write the report and the trace to unique debug files."""
+        from hedge.tools import open_unique_debug_file
+        open_unique_debug_file("op-profile", ".txt").write(self.get_report())
+        self.write_chrome_trace(
+                open_unique_debug_file("op-trace", ".json"))
+
+    # }}}
+
+
+
+
 # }}}
 
 # {{{ code representation -----------------------------------------------------
@@ -327,12 +490,23 @@ class Code(object):
         self.last_schedule = None
         self.static_schedule_attempts = 5
 
+        # a list of (pass name, seconds) tuples, filled in by the compiler
+        self.compile_timings = []
+
     def dump_dataflow_graph(self):
         from hedge.tools import open_unique_debug_file
 
         open_unique_debug_file("dataflow", ".dot")\
                 .write(dot_dataflow_graph(self, max_node_label_length=None))
 
+    def get_compile_timing_report(self):
+        lines = ["compile timings:"]
+        for pass_name, seconds in self.compile_timings:
+            lines.append("    %-30s %8.4f s" % (pass_name, seconds))
+        lines.append("    %-30s %8.4f s" % ("total",
+            sum(seconds for pass_name, seconds in self.compile_timings)))
+        return "\n".join(lines)
+
     def __str__(self):
         lines = []
         for insn in self.instructions:
@@ -385,9 +559,13 @@ class Code(object):
 
         return argmax2(available_insns), discardable_vars
 
-    def execute_dynamic(self, exec_mapper, pre_assign_check=None):
+    def execute_dynamic(self, exec_mapper, pre_assign_check=None,
+            profile=None):
         """Execute the instruction stream, make all scheduling decisions
         dynamically. Record the schedule in *self.last_schedule*.
+
+        :param profile: If not *None*, an :class:`ExecutionProfile`
+          instance into which per-instruction timings are recorded.
         """
         schedule = []
 
@@ -395,10 +573,15 @@ class Code(object):
 
         next_future_id = 0
         futures = []
+        future_origins = {}
         done_insns = set()
 
         force_future = False
 
+        if profile is not None:
+            from time import time
+            profile.start_run()
+
         while True:
             insn = None
             discardable_vars = []
@@ -413,7 +596,17 @@ class Code(object):
 
                     insn = self.EvaluateFuture(future.id)
 
+                    if profile is not None:
+                        origin_insn = future_origins.pop(future.id)
+                        was_ready = not force_future
+                        start = time()
+
                     assignments, new_futures = future()
+
+                    if profile is not None:
+                        profile.add_future(origin_insn,
+                                start, time(), was_ready, assignments)
+
                     force_future = False
                     break
                 else:
@@ -440,9 +633,17 @@ class Code(object):
                         del context[name]
 
                     done_insns.add(insn)
+
+                    if profile is not None:
+                        start = time()
+
                     assignments, new_futures = \
                             insn.get_executor_method(exec_mapper)(insn)
 
+                    if profile is not None:
+                        profile.add_instruction(insn, start, time(),
+                                assignments)
+
             if insn is not None:
                 for target, value in assignments:
                     if pre_assign_check is not None:
@@ -456,6 +657,13 @@ class Code(object):
 
                 for future in new_futures:
                     future.id = next_future_id
+                    if profile is not None:
+                        if isinstance(insn, self.EvaluateFuture):
+                            # attribute nested futures to the original
+                            # instruction
+                            future_origins[future.id] = origin_insn
+                        else:
+                            future_origins[future.id] = insn
                     next_future_id += 1
 
         if len(done_insns) < len(self.instructions):
@@ -480,34 +688,62 @@ class Code(object):
         def __init__(self, future_id):
             self.future_id = future_id
 
-    def execute(self, exec_mapper, pre_assign_check=None):
+    def execute(self, exec_mapper, pre_assign_check=None, profile=None):
         """If we have a saved, static schedule for this instruction stream,
         execute it. Otherwise, punt to the dynamic scheduler below.
+
+        :param profile: If not *None*, an :class:`ExecutionProfile`
+          instance into which per-instruction timings are recorded.
         """
 
         if self.last_schedule is None:
-            return self.execute_dynamic(exec_mapper, pre_assign_check)
+            return self.execute_dynamic(exec_mapper, pre_assign_check,
+                    profile)
 
         context = exec_mapper.context
         id_to_future = {}
+        id_to_origin = {}
         next_future_id = 0
 
         schedule_is_delay_free = True
 
+        if profile is not None:
+            from time import time
+            profile.start_run()
+
         for discardable_vars, insn, new_future_count in self.last_schedule:
             for name in discardable_vars:
                 del context[name]
 
             if isinstance(insn, self.EvaluateFuture):
                 future = id_to_future.pop(insn.future_id)
-                if not future.is_ready():
+                was_ready = future.is_ready()
+                if not was_ready:
                     schedule_is_delay_free = False
+
+                if profile is not None:
+                    origin_insn = id_to_origin.pop(insn.future_id)
+                    start = time()
+
                 assignments, new_futures = future()
+
+                if profile is not None:
+                    profile.add_future(origin_insn, start, time(),
+                            was_ready, assignments)
+
                 del future
             else:
+                origin_insn = insn
+
+                if profile is not None:
+                    start = time()
+
                 assignments, new_futures = \
                         insn.get_executor_method(exec_mapper)(insn)
 
+                if profile is not None:
+                    profile.add_instruction(insn, start, time(), assignments)
+
             for target, value in assignments:
                 if pre_assign_check is not None:
                     pre_assign_check(target, value)
@@ -520,6 +756,8 @@ class Code(object):
 
             for future in new_futures:
                 id_to_future[next_future_id] = future
+                if profile is not None:
+                    id_to_origin[next_future_id] = origin_insn
                 next_future_id += 1
 
         if not schedule_is_delay_free:
@@ -588,12 +826,19 @@ class OperatorCompilerBase(IdentityMapper):
 
     # {{{ top-level driver ----------------------------------------------------
     def __call__(self, expr, type_hints={}):
+        from time import time
+        pass_timings = []
+
+        start = time()
         from hedge.optemplate.mappers.type_inference import TypeInferrer
         self.typedict = TypeInferrer()(expr, type_hints)
+        pass_timings.append(("type inference", time()-start))
 
         # {{{ flux batching
+
         # Fluxes can be evaluated faster in batches. Here, we find flux 
         # batches that we can evaluate together.
+        start = time()
 
         # For each FluxRecord, find the other fluxes its flux depends on.
         flux_queue = self.get_contained_fluxes(expr)
@@ -634,6 +879,8 @@ class OperatorCompilerBase(IdentityMapper):
             else:
                 raise RuntimeError("cannot resolve flux evaluation order")
 
+        pass_timings.append(("flux batching", time()-start))
+
         # }}}
 
         # Once flux batching is figured out, we also need to know which
@@ -643,6 +890,7 @@ class OperatorCompilerBase(IdentityMapper):
         # we can avoid computing (or storing) some of the xyz ones.
         # So figure out which XYZ derivatives of what are needed.
 
+        start = time()
         self.diff_ops = self.collect_diff_ops(expr)
 
         # Flux exchange also works better when batched.
@@ -654,7 +902,19 @@ class OperatorCompilerBase(IdentityMapper):
         # Then, put the toplevel expressions into variables as well.
         from hedge.tools import with_object_array_or_scalar
         result = with_object_array_or_scalar(self.assign_to_new_var, result)
-        return Code(self.aggregate_assignments(self.code, result), result)
+        pass_timings.append(("code generation", time()-start))
+
+        start = time()
+        instructions = self.aggregate_assignments(self.code, result)
+        pass_timings.append(("assignment aggregation", time()-start))
+
+        start = time()
+        instructions = self.aggregate_flux_exchanges(instructions)
+        pass_timings.append(("flux exchange aggregation", time()-start))
+
+        code = Code(instructions, result)
+        code.compile_timings = pass_timings
+        return code
 
     # }}}
 
@@ -872,25 +1132,162 @@ class OperatorCompilerBase(IdentityMapper):
 
     # }}}
 
+    # {{{ flux exchange aggregation pass --------------------------------------
+    def aggregate_flux_exchanges(self, instructions):
+        """Merge :class:`FluxExchangeBatchAssign` instructions that do not
+        (even indirectly) depend on each other, so that all the data one
+        rank sends to a neighbor can travel in a single message.
+        """
+        from pytools import partition
+        exchanges, other_insns = partition(
+                lambda insn: isinstance(insn, FluxExchangeBatchAssign),
+                instructions)
+
+        if len(exchanges) < 2:
+            return instructions
+
+        def get_indirect_deps(insns):
+            """Return a mapping from each instruction to the set of
+            instructions it depends on, directly or indirectly."""
+            origins_map = dict(
+                        (assignee, insn)
+                        for insn in insns
+                        for assignee in insn.get_assignees())
+
+            result = {}
+
+            def get_deps(insn):
+                try:
+                    return result[insn]
+                except KeyError:
+                    pass
+
+                deps = set()
+                for dep in insn.get_dependencies():
+                    dep_origin = origins_map.get(dep.name)
+                    if dep_origin is not None:
+                        deps.add(dep_origin)
+                        deps |= get_deps(dep_origin)
+
+                result[insn] = deps
+                return deps
+
+            for insn in insns:
+                get_deps(insn)
+
+            return result
+
+        def merge_two_exchanges(xchg_1, xchg_2):
+            index_offset = len(xchg_1.arg_fields)
+            return FluxExchangeBatchAssign(
+                    names=xchg_1.names + xchg_2.names,
+                    indices_and_ranks=xchg_1.indices_and_ranks + [
+                        (index + index_offset, rank)
+                        for index, rank in xchg_2.indices_and_ranks],
+                    arg_fields=xchg_1.arg_fields + xchg_2.arg_fields,
+                    dep_mapper_factory=self.dep_mapper_factory)
+
+        did_work = True
+        while did_work:
+            did_work = False
+            indirect_deps = get_indirect_deps(exchanges + other_insns)
+
+            for i, xchg_1 in enumerate(exchanges):
+                for j in range(i+1, len(exchanges)):
+                    xchg_2 = exchanges[j]
+                    if (xchg_1 not in indirect_deps[xchg_2]
+                            and xchg_2 not in indirect_deps[xchg_1]):
+                        exchanges[i] = merge_two_exchanges(xchg_1, xchg_2)
+                        del exchanges[j]
+                        did_work = True
+                        break
+
+                if did_work:
+                    break
+
+        return other_insns + exchanges
+
+    # }}}
+
     # {{{ assignment aggregration pass ----------------------------------------
     def aggregate_assignments(self, instructions, result):
         from pymbolic.primitives import Variable
 
-        # aggregation helpers -------------------------------------------------
-        def get_complete_origins_set(insn, skip_levels=0):
-            if skip_levels < 0:
-                skip_levels = 0
+        # {{{ dependency graph helpers
+
+        origins_map = dict(
+                    (assignee, insn)
+                    for insn in instructions
+                    for assignee in insn.get_assignees())
+
+        # Sets of instructions are represented as integers, with one bit
+        # per instruction.
+        insn_bits = {}
+
+        def get_insn_bit(insn):
+            try:
+                return insn_bits[insn]
+            except KeyError:
+                result = insn_bits[insn] = 1 << len(insn_bits)
+                return result
 
-            result = set()
+        def get_direct_origins(insn):
+            result = []
             for dep in insn.get_dependencies():
                 if isinstance(dep, Variable):
                     dep_origin = origins_map.get(dep.name, None)
                     if dep_origin is not None:
-                        if skip_levels <= 0:
-                            result.add(dep_origin)
-                        result |= get_complete_origins_set(
-                                dep_origin, skip_levels-1)
+                        result.append(dep_origin)
+            return result
 
+        # maps an instruction to the set of instructions it depends
+        # on, directly or indirectly
+        origins_closure_cache = {}
+
+        # maps an instruction to the instructions whose cached closure
+        # was computed from its own
+        closure_dependents = {}
+
+        def get_origins_closure(insn):
+            stack = [insn]
+            while stack:
+                top = stack[-1]
+                if top in origins_closure_cache:
+                    stack.pop()
+                    continue
+
+                top_origins = get_direct_origins(top)
+                missing = [dep_origin for dep_origin in top_origins
+                        if dep_origin not in origins_closure_cache]
+                if missing:
+                    stack.extend(missing)
+                else:
+                    closure = 0
+                    for dep_origin in top_origins:
+                        closure |= (get_insn_bit(dep_origin)
+                                | origins_closure_cache[dep_origin])
+                        closure_dependents.setdefault(
+                                dep_origin, set()).add(top)
+                    origins_closure_cache[top] = closure
+                    stack.pop()
+
+            return origins_closure_cache[insn]
+
+        def invalidate_origins_closures(insns):
+            """Drop the cached closures of *insns* and of all instructions
+            whose cached closure includes one of them."""
+            stack = list(insns)
+            while stack:
+                insn = stack.pop()
+                origins_closure_cache.pop(insn, None)
+                stack.extend(closure_dependents.pop(insn, ()))
+
+        def get_indirect_origins(insn):
+            """Return the set of instructions *insn* depends on through
+            at least one other instruction."""
+            result = 0
+            for dep_origin in get_direct_origins(insn):
+                result |= get_origins_closure(dep_origin)
             return result
 
         var_assignees_cache = {}
@@ -916,11 +1313,7 @@ class OperatorCompilerBase(IdentityMapper):
                     dep_mapper_factory=self.dep_mapper_factory,
                     priority=max(ass_1.priority, ass_2.priority))
 
-        # main aggregation pass -----------------------------------------------
-        origins_map = dict(
-                    (assignee, insn)
-                    for insn in instructions
-                    for assignee in insn.get_assignees())
+        # }}}
 
         from pytools import partition
         unprocessed_assigns, other_insns = partition(
@@ -945,31 +1338,74 @@ class OperatorCompilerBase(IdentityMapper):
             else:
                 i += 1
 
-        # greedy aggregation
-        while unprocessed_assigns:
-            my_assign = unprocessed_assigns.pop()
-
+        # {{{ index of unprocessed assignments
+
+        # Assignments are kept in the order in which they became
+        # unprocessed. Removed ones are skipped when popping.
+        unprocessed_order = []
+        unprocessed_numbers = {}
+        unprocessed_users = {}
+        unprocessed_origins = {}
+
+        def add_unprocessed(ass):
+            unprocessed_numbers[ass] = len(unprocessed_order)
+            unprocessed_order.append(ass)
+            for dep in ass.get_dependencies():
+                unprocessed_users.setdefault(dep, set()).add(ass)
+            for var_assignee in get_var_assignees(ass):
+                unprocessed_origins[var_assignee] = ass
+
+        def remove_unprocessed(ass):
+            del unprocessed_numbers[ass]
+            for dep in ass.get_dependencies():
+                unprocessed_users[dep].remove(ass)
+            for var_assignee in get_var_assignees(ass):
+                del unprocessed_origins[var_assignee]
+
+        def pop_unprocessed():
+            while True:
+                ass = unprocessed_order.pop()
+                if ass in unprocessed_numbers:
+                    remove_unprocessed(ass)
+                    return ass
+
+        def get_agg_candidates(my_assign):
+            """Return the unprocessed assignments that share a dependency
+            with *my_assign* or depend on one another, in order."""
             my_deps = my_assign.get_dependencies()
-            my_assignees = get_var_assignees(my_assign)
 
-            agg_candidates = []
-            for i, other_assign in enumerate(unprocessed_assigns):
-                other_deps = other_assign.get_dependencies()
-                other_assignees = get_var_assignees(other_assign)
+            candidates = set()
+            for dep in my_deps:
+                candidates.update(unprocessed_users.get(dep, ()))
+                dep_origin = unprocessed_origins.get(dep)
+                if dep_origin is not None:
+                    candidates.add(dep_origin)
+            for var_assignee in get_var_assignees(my_assign):
+                candidates.update(unprocessed_users.get(var_assignee, ()))
 
-                if ((my_deps & other_deps
-                        or my_deps & other_assignees
-                        or other_deps & my_assignees)
-                        and my_assign.priority == other_assign.priority):
-                    agg_candidates.append((i, other_assign))
+            return sorted(
+                    (other_assign for other_assign in candidates
+                        if other_assign.priority == my_assign.priority),
+                    key=unprocessed_numbers.__getitem__)
+
+        for ass in unprocessed_assigns:
+            add_unprocessed(ass)
+
+        # }}}
+
+        # greedy aggregation
+        while unprocessed_numbers:
+            my_assign = pop_unprocessed()
+
+            agg_candidates = get_agg_candidates(my_assign)
 
             did_work = False
 
             if agg_candidates:
-                my_indirect_origins = get_complete_origins_set(
-                        my_assign, skip_levels=1)
+                my_bit = get_insn_bit(my_assign)
+                my_indirect_origins = get_indirect_origins(my_assign)
 
-                for other_assign_index, other_assign in agg_candidates:
+                for other_assign in agg_candidates:
                     if self.max_vectors_in_batch_expr is not None:
                         new_assignee_count = len(
                                 set(my_assign.get_assignees())
@@ -984,21 +1420,24 @@ class OperatorCompilerBase(IdentityMapper):
                                 > self.max_vectors_in_batch_expr):
                             continue
 
-                    other_indirect_origins = get_complete_origins_set(
-                            other_assign, skip_levels=1)
+                    other_bit = get_insn_bit(other_assign)
 
-                    if (my_assign not in other_indirect_origins and
-                            other_assign not in my_indirect_origins):
+                    if (not my_bit & get_indirect_origins(other_assign)
+                            and not other_bit & my_indirect_origins):
                         did_work = True
 
                         # aggregate the two assignments
                         new_assignment = aggregate_two_assignments(
                                 my_assign, other_assign)
-                        del unprocessed_assigns[other_assign_index]
-                        unprocessed_assigns.append(new_assignment)
+                        remove_unprocessed(other_assign)
+                        add_unprocessed(new_assignment)
                         for assignee in new_assignment.get_assignees():
                             origins_map[assignee] = new_assignment
 
+                        # Whatever depended on either of the two
+                        # assignments now depends on the new one.
+                        invalidate_origins_closures([my_assign, other_assign])
+
                         break
 
             if not did_work:
@@ -1019,42 +1458,44 @@ class OperatorCompilerBase(IdentityMapper):
             dep_mapper = self.dep_mapper_factory()
 
             names_exprs = zip(ass.names, ass.exprs)
-
-            my_assignees = set(name for name, expr in names_exprs)
-            names_exprs_deps = [
-                    (name, expr,
-                        set(dep.name for dep in dep_mapper(expr) if
-                            isinstance(dep, Variable)) & my_assignees)
-                    for name, expr in names_exprs]
+            name_to_expr = dict(names_exprs)
+            my_assignees = set(ass.names)
+
+            # Schedule the assignments in waves, each consisting of those
+            # whose dependencies were all assigned in earlier waves.
+            unsatisfied_counts = {}
+            users = {}
+            for name, expr in names_exprs:
+                deps = set(dep.name for dep in dep_mapper(expr) if
+                        isinstance(dep, Variable)) & my_assignees
+                unsatisfied_counts[name] = len(deps)
+                for dep in deps:
+                    users.setdefault(dep, []).append(name)
+
+            schedulable = [(str(expr), name)
+                    for name, expr in names_exprs
+                    if not unsatisfied_counts[name]]
 
             ordered_names_exprs = []
-            available_names = set()
-
-            while names_exprs_deps:
-                schedulable = []
-
-                i = 0
-                while i < len(names_exprs_deps):
-                    name, expr, deps = names_exprs_deps[i]
+            while schedulable:
+                # make sure these come out in a constant order
+                schedulable.sort()
 
-                    unsatisfied_deps = deps - available_names
+                next_schedulable = []
+                for key, name in schedulable:
+                    ordered_names_exprs.append((name, name_to_expr[name]))
 
-                    if not unsatisfied_deps:
-                        schedulable.append((str(expr), name, expr))
-                        del names_exprs_deps[i]
-                    else:
-                        i += 1
+                    for user in users.get(name, []):
+                        unsatisfied_counts[user] -= 1
+                        if not unsatisfied_counts[user]:
+                            next_schedulable.append(
+                                    (str(name_to_expr[user]), user))
 
-                # make sure these come out in a constant order
-                schedulable.sort()
+                schedulable = next_schedulable
 
-                if schedulable:
-                    for key, name, expr in schedulable:
-                        ordered_names_exprs.append((name, expr))
-                        available_names.add(name)
-                else:
-                    raise RuntimeError("aggregation resulted in an "
-                            "impossible assignment")
+            if len(ordered_names_exprs) < len(names_exprs):
+                raise RuntimeError("aggregation resulted in an "
+                        "impossible assignment")
 
             return self.finalize_multi_assign(
                     names=[name for name, expr in ordered_names_exprs],
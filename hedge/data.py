@@ -201,6 +201,25 @@ class TimeConstantGivenFunction(ITimeDependentGivenFunction):
 
 
 
+def is_time_constant(given_function):
+    """Return *True* if *given_function* is known not to depend on time."""
+    return isinstance(given_function,
+            (IGivenFunction, TimeConstantGivenFunction))
+
+
+
+
+def is_zero_given_function(given_function):
+    """Return *True* if *given_function* is known to be identically zero."""
+    if isinstance(given_function, TimeConstantGivenFunction):
+        given_function = given_function.gf
+
+    return (isinstance(given_function, ConstantGivenFunction)
+            and not numpy.any(given_function.value))
+
+
+
+
 def make_tdep_constant(x):
     return TimeConstantGivenFunction(ConstantGivenFunction(x))
 
@@ -32,6 +32,7 @@ THE SOFTWARE.
 import numpy
 import numpy.linalg as la
 import hedge.tools
+import hedge.tools.futures
 import hedge.mesh
 import hedge.optemplate
 import hedge._internal
@@ -73,6 +74,55 @@ class _PointEvaluator(object):
 
 
 
+class PointInterpolator(object):
+    """Evaluates volume fields at a fixed set of points, see
+    :meth:`Discretization.get_point_interpolator`.
+
+    .. attribute:: indices
+
+      An integer array of shape ``(point_count, max_el_size)``, the indices
+      of the volume nodes that enter the value at each point.
+
+    .. attribute:: coefficients
+
+      An array of the same shape as :attr:`indices`, the weights of
+      those nodes. Entries past the size of the containing element are
+      zero.
+
+    .. attribute:: found
+
+      A boolean array indicating which points were found in the
+      discretization. The value at the remaining points is zero.
+    """
+
+    def __init__(self, indices, coefficients, found):
+        self.indices = indices
+        self.coefficients = coefficients
+        self.found = found
+
+    @property
+    def point_count(self):
+        return len(self.indices)
+
+    def __call__(self, field):
+        """Return the values of *field* at the interpolation points.
+
+        For an object array of fields, the result has the shape
+        ``(component_count, point_count)``. A leading ensemble dimension
+        on the fields is carried through.
+        """
+        from hedge.tools import is_obj_array
+        if is_obj_array(field):
+            gathered = numpy.array(
+                    [comp[..., self.indices] for comp in field])
+        else:
+            gathered = field[..., self.indices]
+
+        return numpy.sum(gathered*self.coefficients, axis=-1)
+
+
+
+
 # {{{ timestep calculator (deprecated)
 class TimestepCalculator(object):
     def dt_factor(self, max_system_ev, order=1,
@@ -144,6 +194,187 @@ class TimestepCalculator(object):
 
 
 
+# {{{ reduction batching
+class ReductionResult(hedge.tools.futures.Future):
+    """The result of one reduction in a :class:`ReductionBatch`."""
+
+    def __init__(self, batch, finalize):
+        self.batch = batch
+        self.finalize = finalize
+        self.value = None
+        self.has_value = False
+
+    def is_ready(self):
+        return self.has_value
+
+    def __call__(self):
+        if not self.has_value:
+            self.batch.wait()
+        return self.value
+
+
+
+
+class ReductionBatch(object):
+    """Collects the rank-local parts of scalar (or small-array) sum, max
+    and min reductions so that they can be carried out together, in as
+    few collective operations as possible.
+
+    Every ``add_*`` method and every convenience reduction returns a
+    :class:`ReductionResult`, whose value becomes available once
+    :meth:`start` and :meth:`wait` (or just :meth:`execute`) have run.
+
+    :ivar local_discr: the discretization on which the rank-local parts
+      of the reductions are computed.
+
+    This serial version does not communicate.
+    """
+
+    def __init__(self, local_discr):
+        self.local_discr = local_discr
+        self.reductions = {"sum": [], "max": []}
+        self.started = False
+        self.finished = False
+
+    # {{{ adding reductions
+    def _add(self, kind, value, finalize):
+        if self.started:
+            raise RuntimeError("cannot add to a reduction batch that "
+                    "has already been started")
+
+        value = numpy.asarray(value)
+        if kind == "max" and value.dtype.kind == "c":
+            raise ValueError("max/min reductions of complex values "
+                    "are not defined")
+
+        result = ReductionResult(self, finalize)
+        self.reductions[kind].append((value, result))
+        return result
+
+    def add_sum(self, value, finalize=None):
+        return self._add("sum", value, finalize)
+
+    def add_max(self, value, finalize=None):
+        return self._add("max", value, finalize)
+
+    def add_min(self, value, finalize=None):
+        def finalize_min(x):
+            if finalize is not None:
+                return finalize(-x)
+            else:
+                return -x
+
+        return self._add("max", -numpy.asarray(value), finalize_min)
+
+    def integral(self, volume_vector):
+        return self.add_sum(self.local_discr.integral(volume_vector))
+
+    def nodewise_dot_product(self, a, b):
+        return self.add_sum(self.local_discr.nodewise_dot_product(a, b))
+
+    def nodewise_max(self, a):
+        return self.add_max(self.local_discr.nodewise_max(a))
+
+    def nodewise_min(self, a):
+        return self.add_min(self.local_discr.nodewise_min(a))
+
+    def cfl_timestep(self, speed, diffusivity=0):
+        return self.add_min(
+                self.local_discr.cfl_timestep(speed, diffusivity))
+
+    def norm(self, volume_vector, p=2):
+        if p == numpy.Inf:
+            return self.add_max(numpy.abs(volume_vector).max())
+        elif p == 2:
+            local_value = self.local_discr.inner_product(
+                    volume_vector, volume_vector)
+        else:
+            local_value = self.local_discr.integral(
+                    numpy.abs(volume_vector) ** p)
+
+        return self.add_sum(local_value, lambda x: x**(1/p))
+
+    # }}}
+
+    # {{{ execution
+    def _pack(self, kind):
+        values = [value for value, result in self.reductions[kind]]
+        if not values:
+            return None
+
+        from pytools import any
+        if any(v.dtype.kind == "c" for v in values):
+            # sum real and imaginary parts separately
+            return numpy.hstack([
+                numpy.asarray(v, dtype=numpy.complex128).ravel()
+                for v in values]).view(numpy.float64)
+        else:
+            return numpy.hstack([
+                numpy.asarray(v, dtype=numpy.float64).ravel()
+                for v in values])
+
+    def _unpack(self, kind, buf):
+        from pytools import any
+        if any(value.dtype.kind == "c"
+                for value, result in self.reductions[kind]):
+            buf = buf.view(numpy.complex128)
+
+        i = 0
+        for value, result in self.reductions[kind]:
+            reduced = buf[i:i+value.size]
+            if value.shape == ():
+                reduced = reduced[0]
+            else:
+                reduced = reduced.reshape(value.shape)
+            i += value.size
+
+            if result.finalize is not None:
+                reduced = result.finalize(reduced)
+
+            result.value = reduced
+            result.has_value = True
+
+    def _start_allreduce(self, kind, buf):
+        """Start reducing *buf* across ranks with the operation named by
+        *kind* and return a callable that returns the reduced buffer once
+        the reduction is complete.
+        """
+        return lambda: buf
+
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+
+        self.pending = []
+        for kind in self.reductions:
+            buf = self._pack(kind)
+            if buf is not None:
+                self.pending.append((kind, self._start_allreduce(kind, buf)))
+
+    def wait(self):
+        if self.finished:
+            return
+
+        self.start()
+
+        for kind, get_reduced in self.pending:
+            self._unpack(kind, get_reduced())
+
+        del self.pending
+        self.finished = True
+
+    def execute(self):
+        self.start()
+        self.wait()
+
+    # }}}
+
+# }}}
+
+
+
+
 class Discretization(TimestepCalculator):
     """The global approximation space.
 
@@ -179,6 +410,9 @@ class Discretization(TimestepCalculator):
             "dump_op_code",
             "dump_dataflow_graph",
             "dump_optemplate_stages",
+            "dump_bind_specialization",
+            "dump_compile_timings",
+            "profile_op_code",
             "help",
             ])
 
@@ -190,6 +424,7 @@ class Discretization(TimestepCalculator):
         return set([
             "ilist_generation",
             "node_permutation",
+            "profile_op_code",
             ])
 
     # }}}
@@ -215,13 +450,18 @@ class Discretization(TimestepCalculator):
     # {{{ construction / finalization
     def __init__(self, mesh, local_discretization=None,
             order=None, quad_min_degrees={},
-            debug=set(), default_scalar_type=numpy.float64, run_context=None):
+            debug=set(), default_scalar_type=numpy.float64, run_context=None,
+            reorder=None):
         """
         :param quad_min_degrees: A mapping from quadrature tags to the degrees to
           which the desired quadrature is supposed to be exact.
         :param debug: A set of strings indicating which debug checks should
           be activated. See validity check below for the currently defined
           set of debug flags.
+        :param reorder: If not *None*, discretize a copy of *mesh* whose
+          elements are renumbered by this method, see
+          :meth:`hedge.mesh.ConformalMesh.reordered_by`.
+          :attr:`mesh` is the renumbered copy.
         """
 
         self.run_context = run_context
@@ -229,6 +469,9 @@ class Discretization(TimestepCalculator):
         if not isinstance(mesh, hedge.mesh.Mesh):
             raise TypeError("mesh must be of type hedge.mesh.Mesh")
 
+        if reorder is not None:
+            mesh = mesh.reordered_by(reorder)
+
         self.mesh = mesh
 
         local_discretization = self.get_local_discretization(
@@ -256,13 +499,15 @@ class Discretization(TimestepCalculator):
         self.default_scalar_type = default_scalar_type
 
         self.exec_functions = {}
+        self.execution_profiles = []
 
         self._build_element_groups_and_nodes(local_discretization)
         self._calculate_local_matrices()
         self._build_interior_face_groups()
 
     def close(self):
-        pass
+        for profile in self.execution_profiles:
+            profile.dump()
 
     # }}}
 
@@ -290,7 +535,15 @@ class Discretization(TimestepCalculator):
                 self.diff_timer,
                 self.vector_math_timer]
 
-    def add_instrumentation(self, mgr):
+    def add_instrumentation(self, mgr, calibrate_bandwidth=True):
+        """Add timers, event, flop and byte counters, and effective
+        bandwidth quantities to the :class:`pytools.log.LogManager` *mgr*.
+
+        :param calibrate_bandwidth: If *True*, measure the peak memory
+          bandwidth of this node using
+          :func:`hedge.tools.flops.measure_stream_bandwidth` and
+          additionally log each kernel's bandwidth as a percentage of it.
+        """
         from pytools.log import IntervalTimer, EventCounter
 
         self.gather_counter = EventCounter("n_gather",
@@ -314,6 +567,31 @@ class Discretization(TimestepCalculator):
         self.vector_math_flop_counter = EventCounter("n_flops_vector_math",
                 "Number of floating point operations in vector math")
 
+        self.gather_byte_counter = EventCounter("n_bytes_gather",
+                "Number of bytes moved in gather")
+        self.lift_byte_counter = EventCounter("n_bytes_lift",
+                "Number of bytes moved in lift")
+        self.el_local_byte_counter = EventCounter("n_bytes_el_local",
+                "Number of bytes moved in element-local operator "
+                "(without lift)")
+        self.diff_byte_counter = EventCounter("n_bytes_diff",
+                "Number of bytes moved in diff operator")
+        self.vector_math_byte_counter = EventCounter("n_bytes_vector_math",
+                "Number of bytes moved in vector math")
+
+        from hedge.log import EffectiveBandwidth
+        self.gather_bandwidth = EffectiveBandwidth("bw_gather",
+                "Effective memory bandwidth of gather")
+        self.lift_bandwidth = EffectiveBandwidth("bw_lift",
+                "Effective memory bandwidth of lift")
+        self.el_local_bandwidth = EffectiveBandwidth("bw_el_local",
+                "Effective memory bandwidth of element-local operators "
+                "(without lift)")
+        self.diff_bandwidth = EffectiveBandwidth("bw_diff",
+                "Effective memory bandwidth of diff operator")
+        self.vector_math_bandwidth = EffectiveBandwidth("bw_vector_math",
+                "Effective memory bandwidth of vector math")
+
         self.interpolant_counter = EventCounter("n_interp",
                 "Number of interpolant evaluations")
 
@@ -334,9 +612,38 @@ class Discretization(TimestepCalculator):
         mgr.add_quantity(self.diff_flop_counter)
         mgr.add_quantity(self.vector_math_flop_counter)
 
+        byte_counters = [
+                self.gather_byte_counter,
+                self.lift_byte_counter,
+                self.el_local_byte_counter,
+                self.diff_byte_counter,
+                self.vector_math_byte_counter]
+        bandwidths = [
+                self.gather_bandwidth,
+                self.lift_bandwidth,
+                self.el_local_bandwidth,
+                self.diff_bandwidth,
+                self.vector_math_bandwidth]
+
+        for q in byte_counters + bandwidths:
+            mgr.add_quantity(q)
+
+        if calibrate_bandwidth:
+            from hedge.tools.flops import measure_stream_bandwidth
+            from hedge.log import PercentOfPeakBandwidth
+
+            peak = measure_stream_bandwidth(dtype=self.default_scalar_type)
+            mgr.set_constant("stream_bandwidth", peak)
+
+            for bw in bandwidths:
+                mgr.add_quantity(PercentOfPeakBandwidth(bw, peak))
+
         mgr.add_quantity(self.interpolant_counter)
         mgr.add_quantity(self.interpolant_timer)
 
+        from hedge.log import get_log_reduction_batcher
+        get_log_reduction_batcher(self).attach(mgr)
+
         from pytools.log import time_and_count_function
         self.interpolate_volume_function = \
                 time_and_count_function(
@@ -1183,12 +1490,24 @@ class Discretization(TimestepCalculator):
                         sub_a, mass_op(sub_b))
                     for sub_a, sub_b in zip(a, b)))
 
+    def make_reduction_batch(self):
+        """Return a :class:`ReductionBatch` that carries out reductions
+        over this discretization together.
+        """
+        return ReductionBatch(self)
+
     def nodewise_max(self, a):
         return numpy.max(a)
 
     def nodewise_min(self, a):
         return numpy.min(a)
 
+    def local_nodewise_max(self, a):
+        """Like :meth:`nodewise_max`, but only over the part of *a* owned
+        by this rank in a distributed run, without communication.
+        """
+        return self.nodewise_max(a)
+
     # }}}
 
     # {{{ vector primitives ---------------------------------------------------
@@ -1228,10 +1547,61 @@ class Discretization(TimestepCalculator):
 
     @memoize_method
     def dt_geometric_factor(self):
-        return min(min(eg.local_discretization.dt_geometric_factor(
-            [self.mesh.points[i] for i in el.vertex_indices], el)
-            for el in eg.members)
-            for eg in self.element_groups)
+        return numpy.min(self.element_dt_geometric_factors())
+
+    @memoize_method
+    def element_dt_geometric_factors(self):
+        """Return an array, indexed by element number, of the geometric
+        factors that enter the stable time step of each element. See
+        :meth:`dt_geometric_factor` for the global minimum.
+        """
+        result = numpy.empty(len(self.mesh.elements), dtype=numpy.float64)
+        for eg in self.element_groups:
+            ldis = eg.local_discretization
+            for el in eg.members:
+                result[el.id] = ldis.dt_geometric_factor(
+                        [self.mesh.points[i] for i in el.vertex_indices], el)
+
+        return result
+
+    @memoize_method
+    def _element_dt_factors_by_group(self):
+        geometric_factors = self.element_dt_geometric_factors()
+        return [eg.local_discretization.dt_non_geometric_factor()
+                * geometric_factors[[el.id for el in eg.members]]
+                for eg in self.element_groups]
+
+    def cfl_timestep(self, speed, diffusivity=0):
+        """Return the largest time step for which RK4 is stable on every
+        element, given the wave speeds in the volume vector *speed*. Like
+        :meth:`dt_factor`, the result needs to be scaled by the size of the
+        stability region of a different time stepper.
+
+        Each element uses the largest value of *speed* on its nodes, so the
+        output of :class:`hedge.optemplate.operators.ElementwiseMaxOperator`
+        can be passed as-is. With a nonzero *diffusivity*, each element's
+        time step is found as in (7.32) of Hesthaven/Warburton.
+
+        This only considers the elements local to this discretization.
+        """
+        speed = self.convert_volume(speed, kind="numpy")
+
+        result = numpy.inf
+        for eg, dt_factors in zip(
+                self.element_groups, self._element_dt_factors_by_group()):
+            if not len(dt_factors):
+                continue
+
+            rng = eg.ranges
+            el_speeds = numpy.max(
+                    speed[rng.start:rng.start+len(dt_factors)*rng.el_size]
+                    .reshape(len(dt_factors), rng.el_size),
+                    axis=1)
+
+            result = min(result, numpy.min(
+                dt_factors / (el_speeds + diffusivity/dt_factors)))
+
+        return result
 
 
     def get_point_evaluator(self, point, use_btree=False, thresh=0):
@@ -1268,6 +1638,64 @@ class Discretization(TimestepCalculator):
                 "point %s not found. Consider changing threshold."
                 % point)
 
+    def get_point_interpolator(self, points, use_btree=True, thresh=0,
+            allow_missing=False):
+        """Return a :class:`PointInterpolator` that evaluates volume
+        fields at each of *points*.
+
+        Elements containing the points are located only once, so the
+        result should be kept around if fields are evaluated repeatedly.
+
+        :param allow_missing: if *False*, raise :exc:`RuntimeError` if
+          one of the *points* is not contained in any element.
+        """
+        points = numpy.asarray(points, dtype=numpy.float64)
+
+        max_el_size = max(eg.local_discretization.node_count()
+                for eg in self.element_groups)
+        indices = numpy.zeros((len(points), max_el_size), dtype=numpy.intp)
+        coefficients = numpy.zeros((len(points), max_el_size),
+                dtype=self.default_scalar_type)
+        found = numpy.zeros(len(points), dtype=numpy.bool_)
+
+        def get_candidates(point):
+            if use_btree:
+                return self.get_spatial_btree().generate_matches(point)
+            else:
+                return ((el, rng, eg)
+                        for eg in self.element_groups
+                        for el, rng in zip(eg.members, eg.ranges))
+
+        inv_vdm_t = {}
+
+        for i, point in enumerate(points):
+            for el, rng, eg in get_candidates(point):
+                if el.contains_point(point, thresh):
+                    break
+            else:
+                if not allow_missing:
+                    raise RuntimeError(
+                            "point %s not found. Consider changing threshold."
+                            % point)
+                continue
+
+            ldis = eg.local_discretization
+            try:
+                eg_inv_vdm_t = inv_vdm_t[eg]
+            except KeyError:
+                eg_inv_vdm_t = inv_vdm_t[eg] = la.inv(ldis.vandermonde().T)
+
+            basis_values = numpy.array([
+                phi(el.inverse_map(point))
+                for phi in ldis.basis_functions()])
+
+            el_size = ldis.node_count()
+            indices[i, :el_size] = numpy.arange(rng.start, rng.stop)
+            coefficients[i, :el_size] = numpy.dot(eg_inv_vdm_t, basis_values)
+            found[i] = True
+
+        return PointInterpolator(indices, coefficients, found)
+
     def get_regrid_values(self, field_in, new_discr, dtype=None, 
             use_btree=True, thresh=0):
         """:param field_in: nodal values on old grid.
@@ -1279,11 +1707,12 @@ class Discretization(TimestepCalculator):
             raise NotImplementedError(
                     "get_regrid_values needs numpy input field")
 
+        interp = self.get_point_interpolator(
+                new_discr.nodes, use_btree, thresh)
+
         def regrid(scalar_field):
             result = new_discr.volume_empty(dtype=dtype, kind="numpy")
-            for ii in range(len(new_discr.nodes)):
-                pe = self.get_point_evaluator(new_discr.nodes[ii], use_btree, thresh)
-                result[ii] = pe(scalar_field)
+            result[:] = interp(scalar_field)
             return result
 
         from pytools.obj_array import with_object_array_or_scalar
@@ -1315,6 +1744,12 @@ class Discretization(TimestepCalculator):
         if "dump_dataflow_graph" in self.debug:
             ex.code.dump_dataflow_graph()
 
+        if "profile_op_code" in self.debug:
+            from hedge.compiler import ExecutionProfile
+            from hedge.tools import get_rank
+            ex.profile = ExecutionProfile(rank=get_rank(self))
+            self.execution_profiles.append(ex.profile)
+
         if self.instrumented:
             ex.instrument()
         return ex
@@ -98,6 +98,230 @@ class DiagonalPreconditioner(OperatorBase):
 
 
 
+def probe_colored_elements(discr, operator, distance):
+    """Probe the linear, matrix-free *operator* on many elements at once.
+
+    The elements are colored so that any two elements of the same color
+    are more than *distance* faces apart. For each color and local node
+    number, *operator* is applied to the vector that is one at that node
+    of each element of that color and zero elsewhere.
+
+    In a distributed run, every rank takes part in every operator
+    application, but elements on different ranks are not colored against
+    each other.
+
+    :returns: a tuple *(el_colors, probes)*, where *el_colors* is an array
+      of the color of each element and *probes* generates tuples
+      *(color, node, response)*, *response* being the result of applying
+      *operator* to the probe vector, as a :mod:`numpy` array.
+    """
+    from hedge.mesh.tools import greedy_coloring
+    coloring = greedy_coloring(
+            discr.mesh.element_adjacency_graph(), distance=distance)
+
+    el_count = len(discr.mesh.elements)
+    el_colors = numpy.zeros(el_count, dtype=numpy.intp)
+    for el_nr, color in coloring.iteritems():
+        el_colors[el_nr] = color
+
+    batch = discr.make_reduction_batch()
+    color_count = batch.add_max(numpy.max(el_colors)+1)
+    node_count = batch.add_max(max(
+        eg.local_discretization.node_count()
+        for eg in discr.element_groups))
+    batch.execute()
+
+    def generate_probes():
+        for color in range(int(color_count())):
+            for node in range(int(node_count())):
+                probe = discr.volume_zeros(kind="numpy")
+                for eg in discr.element_groups:
+                    el_size = eg.ranges.el_size
+                    if node < el_size:
+                        el_indices, = numpy.nonzero(
+                                el_colors[eg.member_nrs] == color)
+                        probe[eg.ranges.start + el_indices*el_size + node] = 1
+
+                response = discr.convert_volume(
+                        operator(discr.convert_volume(
+                            probe, kind=discr.compute_kind)),
+                        kind="numpy")
+
+                yield color, node, response
+
+    return el_colors, generate_probes()
+
+
+
+
+def extract_element_blocks(discr, operator):
+    """Return a list with one array per element group of *discr*, of shape
+    ``(element_count, node_count, node_count)``, containing the diagonal
+    element blocks of the linear, matrix-free *operator*.
+
+    The blocks are found by :func:`probe_colored_elements`, with elements
+    probed together kept at least three faces apart, so that no probe
+    leaks into the block of another element, even for LDG, whose stencil
+    reaches to neighbors of neighbors. This needs
+    ``color_count * node_count`` operator applications.
+
+    In a distributed run, the blocks of elements at rank boundaries are
+    only approximate.
+    """
+    el_colors, probes = probe_colored_elements(discr, operator, distance=2)
+
+    blocks = []
+    for eg in discr.element_groups:
+        el_size = eg.local_discretization.node_count()
+        blocks.append(numpy.zeros((len(eg.members), el_size, el_size),
+            dtype=operator.dtype))
+
+    for color, node, response in probes:
+        for eg, eg_blocks in zip(discr.element_groups, blocks):
+            el_size = eg.ranges.el_size
+            if node < el_size:
+                el_indices, = numpy.nonzero(
+                        el_colors[eg.member_nrs] == color)
+                dof_starts = eg.ranges.start + el_indices*el_size
+                eg_blocks[el_indices, :, node] = response[
+                        dof_starts[:, numpy.newaxis]
+                        + numpy.arange(el_size)]
+
+    return blocks
+
+
+
+
+class BlockJacobiPreconditioner(OperatorBase):
+    """Applies the inverses of the diagonal element blocks of a linear
+    operator, as found by :func:`extract_element_blocks`. The blocks are
+    extracted and inverted once, at construction.
+    """
+
+    def __init__(self, discr, operator):
+        self.discr = discr
+        self.operator_dtype = operator.dtype
+
+        self.inverse_blocks = [
+                numpy.linalg.inv(eg_blocks)
+                for eg_blocks in extract_element_blocks(discr, operator)]
+
+    @property
+    def dtype(self):
+        return self.operator_dtype
+
+    @property
+    def shape(self):
+        n = len(self.discr)
+        return n, n
+
+    def __call__(self, operand):
+        result = numpy.empty_like(operand)
+        for eg, inv_blocks in zip(
+                self.discr.element_groups, self.inverse_blocks):
+            el_count, el_size, _ = inv_blocks.shape
+            dofs = slice(eg.ranges.start, eg.ranges.start+el_count*el_size)
+            result[dofs] = numpy.einsum("eij,ej->ei",
+                    inv_blocks,
+                    operand[dofs].reshape(el_count, el_size)).ravel()
+
+        return result
+
+
+
+
+class PMultigridPreconditioner(OperatorBase):
+    """A polynomial multigrid V-cycle.
+
+    :param discrs: a list of discretizations of the same mesh, from the
+      finest (highest order) to the coarsest.
+    :param operators: a list of the same linear operator, bound to each
+      discretization in *discrs*.
+
+    Corrections are transferred between levels using
+    :class:`hedge.discretization.Projector`. Residuals are restricted by
+    the transpose of that, i.e. they are taken out of the mass-weighted
+    space, projected and mass-weighted again on the coarser level. This
+    keeps the V-cycle symmetric for symmetric *operators*. Each level is
+    smoothed by *smoothing_steps* damped block-Jacobi iterations before
+    and after the coarse-level correction. The coarsest level is solved
+    by block-Jacobi-preconditioned CG to *coarse_tol*.
+    """
+
+    def __init__(self, discrs, operators, smoothing_steps=2, damping=2/3,
+            coarse_tol=1e-8):
+        if len(discrs) != len(operators):
+            raise ValueError("must pass one operator per discretization")
+
+        self.discrs = discrs
+        self.operators = operators
+        self.smoothing_steps = smoothing_steps
+        self.damping = damping
+        self.coarse_tol = coarse_tol
+
+        self.smoothers = [BlockJacobiPreconditioner(discr, op)
+                for discr, op in zip(discrs, operators)]
+
+        from hedge.discretization import Projector
+        self.restrictors = [Projector(fine, coarse)
+                for fine, coarse in zip(discrs, discrs[1:])]
+        self.prolongators = [Projector(coarse, fine)
+                for fine, coarse in zip(discrs, discrs[1:])]
+
+        from hedge.optemplate import MassOperator, InverseMassOperator
+        self.inverse_masses = [InverseMassOperator().bind(discr)
+                for discr in discrs[:-1]]
+        self.masses = [MassOperator().bind(discr)
+                for discr in discrs[1:]]
+
+    @property
+    def dtype(self):
+        return self.operators[0].dtype
+
+    @property
+    def shape(self):
+        return self.operators[0].shape
+
+    def smooth(self, level, x, rhs):
+        op = self.operators[level]
+        smoother = self.smoothers[level]
+
+        for i in range(self.smoothing_steps):
+            if x is None:
+                x = self.damping*smoother(rhs)
+            else:
+                x += self.damping*smoother(rhs - op(x))
+
+        return x
+
+    def v_cycle(self, level, rhs):
+        discr = self.discrs[level]
+        op = self.operators[level]
+
+        if level == len(self.discrs) - 1:
+            cg = CGStateContainer(op, self.smoothers[level],
+                    dot=discr.nodewise_dot_product)
+            cg.reset(rhs, discr.volume_zeros())
+            return cg.run(tol=self.coarse_tol)
+
+        x = self.smooth(level, None, rhs)
+        if x is None:
+            x = discr.volume_zeros()
+
+        coarse_rhs = self.masses[level](
+                self.restrictors[level](
+                    self.inverse_masses[level](rhs - op(x))))
+
+        x += self.prolongators[level](self.v_cycle(level+1, coarse_rhs))
+
+        return self.smooth(level, x, rhs)
+
+    def __call__(self, operand):
+        return self.v_cycle(0, operand)
+
+
+
+
 class ConvergenceError(RuntimeError):
     pass
 
@@ -166,6 +390,7 @@ class CGStateContainer:
             max_iterations = 10 * self.operator.shape[0]
 
         if self.inner(self.rhs, self.rhs) == 0:
+            self.iterations = 0
             return self.rhs
 
         iterations = 0
@@ -192,6 +417,7 @@ class CGStateContainer:
                     debug_callback("end", iterations, self.x, self.residual, self.d, delta)
                 if debug:
                     print "%d iterations" % iterations
+                self.iterations = iterations
                 return self.x
 
             if debug and iterations % debug == 0:
@@ -203,15 +429,420 @@ class CGStateContainer:
 
 
 
+def _start_inner_products(discr, inner, pairs):
+    """Start computing the inner products of all *pairs* and return
+    a callable that returns their values. If *discr* is not *None*, all
+    of them are computed in a single reduction, otherwise by *inner*.
+    """
+    if discr is None:
+        values = [inner(a, b) for a, b in pairs]
+        return lambda: values
+
+    batch = discr.make_reduction_batch()
+    results = [batch.nodewise_dot_product(a, b.conj())
+            for a, b in pairs]
+    batch.start()
+    return lambda: [result() for result in results]
+
+
+
+
+class PipelinedCGStateContainer(CGStateContainer):
+    """Preconditioned CG, rearranged so that both inner products of an
+    iteration are carried out as one global reduction, and so that this
+    reduction overlaps with the application of the preconditioner and of
+    the operator.
+
+    If *discr* is given, the inner products are computed through
+    :meth:`hedge.discretization.Discretization.make_reduction_batch`,
+    which, in distributed runs, results in a single nonblocking
+    allreduce per iteration. Otherwise, *dot* is used as in
+    :class:`CGStateContainer`.
+
+    All vector updates happen in place. Since the recurrences let the
+    computed residual drift away from the true one, :meth:`one_iteration`
+    recomputes all recurrence vectors from *x* and the search direction
+    when asked for the real residual.
+
+    See P. Ghysels and W. Vanroose, "Hiding global synchronization latency
+    in the preconditioned Conjugate Gradient algorithm", Parallel
+    Computing 40 (2014), pp. 224-238, Algorithm 3.
+    """
+
+    def __init__(self, operator, precon=None, dot=None, discr=None):
+        CGStateContainer.__init__(self, operator, precon, dot)
+        self.discr = discr
+
+    def _reduce_and_apply(self):
+        get_inner_products = _start_inner_products(self.discr, self.inner, [
+            (self.residual, self.u), (self.w, self.u)])
+
+        # overlaps with the reduction
+        self.m = self._precon(self.w)
+        self.n = self.operator(self.m)
+
+        self.delta, self.w_u = get_inner_products()
+
+    def reset(self, rhs, x=None):
+        self.rhs = rhs
+
+        if x is None:
+            x = numpy.zeros((self.operator.shape[0],))
+        self.x = x
+
+        self.residual = rhs - self.operator(x)
+        self.u = self._precon(self.residual)
+        self.w = self.operator(self.u)
+
+        self.d = numpy.zeros_like(self.u)
+        self.s = numpy.zeros_like(self.w)
+        self.q = numpy.zeros_like(self.u)
+        self.z = numpy.zeros_like(self.w)
+        self.scratch = numpy.empty_like(self.x)
+
+        self.alpha = None
+
+        self._reduce_and_apply()
+        return self.delta
+
+    def _precon(self, vec):
+        # vectors are updated in place below, so they must not alias
+        result = self.precon(vec)
+        if result is vec:
+            result = vec.copy()
+        return result
+
+    def _add_scaled(self, target, factor, vec):
+        """*target* += *factor* * *vec*, without temporaries."""
+        numpy.multiply(vec, factor, self.scratch)
+        target += self.scratch
+
+    def one_iteration(self, compute_real_residual=False):
+        gamma = self.delta
+
+        if self.alpha is None:
+            beta = 0
+            self.alpha = gamma / self.w_u
+        else:
+            beta = gamma / self.gamma_old
+            self.alpha = gamma / (self.w_u - beta*gamma/self.alpha)
+
+        self.gamma_old = gamma
+        alpha = self.alpha
+
+        # p = u + beta*p, and so on
+        for target, vec in [
+                (self.z, self.n),
+                (self.q, self.m),
+                (self.s, self.w),
+                (self.d, self.u),
+                ]:
+            target *= beta
+            target += vec
+
+        self._add_scaled(self.x, alpha, self.d)
+
+        if compute_real_residual:
+            self.residual = self.rhs - self.operator(self.x)
+            self.u = self._precon(self.residual)
+            self.w = self.operator(self.u)
+            self.s = self.operator(self.d)
+            self.q = self._precon(self.s)
+            self.z = self.operator(self.q)
+        else:
+            self._add_scaled(self.residual, -alpha, self.s)
+            self._add_scaled(self.u, -alpha, self.q)
+            self._add_scaled(self.w, -alpha, self.z)
+
+        self._reduce_and_apply()
+        return self.delta
+
+
+
+
+class MultiRHSCGStateContainer:
+    """Runs preconditioned CG for several right-hand sides with the same
+    operator in lockstep.
+
+    *operator* is applied to object arrays holding the search directions
+    of all unconverged systems at once, so operators that support this
+    (such as :class:`hedge.models.poisson.BoundPoissonOperator`) traverse
+    the mesh once per iteration instead of once per system. The inner
+    products of all systems are batched into one reduction per CG step,
+    using *discr* if given (see :class:`PipelinedCGStateContainer`).
+    *precon* is applied to one vector at a time.
+
+    Systems drop out of the lockstep iteration as they converge. The
+    operator still always receives as many vectors as there are
+    right-hand sides, with zeros in place of the converged systems, so
+    that operators compiled for a fixed number of vectors are not
+    recompiled as the number of active systems shrinks.
+    """
+
+    def __init__(self, operator, precon=None, dot=None, discr=None):
+        if precon is None:
+            precon = IdentityOperator(operator.dtype, operator.shape[0])
+
+        self.operator = operator
+        self.precon = precon
+        self.discr = discr
+
+        if dot is None:
+            dot = numpy.dot
+
+        def inner(a, b):
+            return dot(a, b.conj())
+
+        self.inner = inner
+
+    def _inner_products(self, pairs):
+        return _start_inner_products(self.discr, self.inner, pairs)()
+
+    def _apply_operator(self, indices, vecs):
+        """Apply the operator to *vecs*, the vectors of the systems
+        numbered *indices*, padded with zeros for all other systems.
+        """
+        from hedge.tools import make_obj_array
+        padded = [self.zero]*len(self.rhss)
+        for i, vec in zip(indices, vecs):
+            padded[i] = vec
+
+        result = self.operator(make_obj_array(padded))
+        return [result[i] for i in indices]
+
+    def reset(self, rhss, xs=None):
+        """
+        :param rhss: an object array of right-hand sides.
+        :param xs: an object array of initial guesses, or *None*.
+        """
+        self.rhss = rhss
+        self.zero = numpy.zeros((self.operator.shape[0],),
+                dtype=self.operator.dtype)
+
+        if xs is None:
+            from hedge.tools import make_obj_array
+            xs = make_obj_array([
+                numpy.zeros((self.operator.shape[0],))
+                for rhs in rhss])
+        self.xs = xs
+
+        all_indices = range(len(rhss))
+        axs = self._apply_operator(all_indices, list(xs))
+        self.residuals = [rhs - ax for rhs, ax in zip(rhss, axs)]
+        self.ds = [self.precon(r) for r in self.residuals]
+        self.deltas = self._inner_products(zip(self.residuals, self.ds))
+
+        return self.deltas
+
+    def one_iteration(self, active, compute_real_residual=False):
+        """Carry out one CG step for the systems whose indices are in
+        *active*.
+        """
+        qs = self._apply_operator(active, [self.ds[i] for i in active])
+        myips = self._inner_products(
+                [(self.ds[i], q) for i, q in zip(active, qs)])
+
+        for i, q, myip in zip(active, qs, myips):
+            alpha = self.deltas[i] / myip
+            self.xs[i] += alpha * self.ds[i]
+
+            if not compute_real_residual:
+                self.residuals[i] -= alpha*q
+
+        if compute_real_residual:
+            axs = self._apply_operator(active,
+                    [self.xs[i] for i in active])
+            for i, ax in zip(active, axs):
+                self.residuals[i] = self.rhss[i] - ax
+
+        ss = [self.precon(self.residuals[i]) for i in active]
+        new_deltas = self._inner_products(
+                [(self.residuals[i], s) for i, s in zip(active, ss)])
+
+        for i, s, delta in zip(active, ss, new_deltas):
+            beta = delta / self.deltas[i]
+            self.deltas[i] = delta
+            self.ds[i] = s + beta * self.ds[i]
+
+    def run(self, max_iterations=None, tol=1e-7, debug=0):
+        if max_iterations is None:
+            max_iterations = 10 * self.operator.shape[0]
+
+        rhs_norms2 = self._inner_products(zip(self.rhss, self.rhss))
+        active = [i for i, rhs_norm2 in enumerate(rhs_norms2)
+                if rhs_norm2 != 0]
+        for i, rhs_norm2 in enumerate(rhs_norms2):
+            if rhs_norm2 == 0:
+                self.xs[i] = self.rhss[i]
+
+        self.iterations = [0] * len(self.rhss)
+
+        iterations = 0
+        deltas_0 = self.deltas[:]
+        while active and iterations < max_iterations:
+            def is_converged(i):
+                return abs(self.deltas[i]) < tol*tol * abs(deltas_0[i])
+
+            compute_real_residual = \
+                    iterations % 50 == 0 or \
+                    any(is_converged(i) for i in active)
+
+            self.one_iteration(active,
+                    compute_real_residual=compute_real_residual)
+
+            if compute_real_residual:
+                for i in active:
+                    if is_converged(i):
+                        self.iterations[i] = iterations
+                active = [i for i in active if not is_converged(i)]
+
+            if debug and iterations % debug == 0:
+                print "debug: %d systems active, max delta=%g" % (
+                        len(active),
+                        max([abs(self.deltas[i]) for i in active] + [0]))
+            iterations += 1
+
+        if active:
+            raise ConvergenceError("cg failed to converge")
+
+        if debug:
+            print "%d iterations" % iterations
+
+        return self.xs
+
+
+
+
+def _default_dot(a, b):
+    from hedge.tools import is_obj_array
+    if is_obj_array(a):
+        return sum(numpy.dot(a_i, b_i) for a_i, b_i in zip(a, b))
+    else:
+        return numpy.dot(a, b)
+
+
+
+
+def gmres(operator, b, x=None, precon=None, tol=1e-7, restart=30,
+        max_iterations=None, dot=None):
+    """Solve *operator* x = *b* by restarted, right-preconditioned GMRES.
+
+    *b* may also be an object array of vectors, as long as *operator* and
+    *precon* accept such object arrays. *dot* defaults to a dot product
+    that also handles object arrays.
+
+    :returns: a tuple *(x, iterations)*.
+    """
+    if dot is None:
+        dot = _default_dot
+
+    def inner(a, b):
+        return dot(a, b.conj())
+
+    def norm(a):
+        return numpy.sqrt(abs(inner(a, a)))
+
+    if precon is None:
+        precon = lambda v: v
+
+    if x is None:
+        x = 0*b
+
+    if max_iterations is None:
+        max_iterations = 10*restart
+
+    b_norm = norm(b)
+    if b_norm == 0:
+        return 0*b, 0
+
+    from hedge.tools import is_obj_array
+    if is_obj_array(b):
+        is_complex = any(numpy.iscomplexobj(b_i) for b_i in b)
+    else:
+        is_complex = numpy.iscomplexobj(b)
+
+    iterations = 0
+    while True:
+        residual = b - operator(x)
+        beta = norm(residual)
+        if beta <= tol*b_norm:
+            return x, iterations
+
+        if iterations >= max_iterations:
+            raise ConvergenceError("gmres failed to converge")
+
+        basis = [residual/beta]
+        precon_basis = []
+        hessenberg = numpy.zeros((restart+1, restart), dtype=numpy.complex128)
+
+        for j in range(restart):
+            precon_basis.append(precon(basis[j]))
+            w = operator(precon_basis[j])
+
+            # modified Gram-Schmidt
+            for i in range(j+1):
+                hessenberg[i, j] = inner(w, basis[i])
+                w = w - hessenberg[i, j]*basis[i]
+
+            hessenberg[j+1, j] = norm(w)
+            iterations += 1
+
+            # small least-squares problem, solved from scratch every time
+            rhs = numpy.zeros(j+2, dtype=numpy.complex128)
+            rhs[0] = beta
+            h = hessenberg[:j+2, :j+1]
+            y = numpy.linalg.lstsq(h, rhs, rcond=-1)[0]
+            est_residual = numpy.linalg.norm(numpy.dot(h, y) - rhs)
+
+            if (est_residual <= tol*b_norm
+                    or hessenberg[j+1, j] == 0
+                    or iterations >= max_iterations):
+                break
+
+            basis.append(w/hessenberg[j+1, j])
+
+        if not is_complex:
+            y = y.real
+
+        for y_i, z_i in zip(y, precon_basis):
+            x = x + y_i*z_i
+
+
+
+
 def parallel_cg(pcon, operator, b, precon=None, x=None, tol=1e-7, max_iterations=None,
-        debug=False, debug_callback=None, dot=None):
+        debug=False, debug_callback=None, dot=None, pipelined=False, discr=None):
+    """
+    :param pipelined: if *True*, use :class:`PipelinedCGStateContainer`,
+      which needs one global reduction per iteration instead of two.
+    :param discr: passed on to :class:`PipelinedCGStateContainer`.
+    """
     if x is None:
         x = numpy.zeros((operator.shape[1],))
 
-    cg = CGStateContainer(operator, precon, dot=dot)
+    if pipelined:
+        cg = PipelinedCGStateContainer(operator, precon, dot=dot, discr=discr)
+    else:
+        cg = CGStateContainer(operator, precon, dot=dot)
     cg.reset(b, x)
 
     if not pcon.is_head_rank:
         debug = False
 
     return cg.run(max_iterations, tol, debug_callback, debug)
+
+
+
+
+def parallel_multi_rhs_cg(pcon, operator, bs, precon=None, xs=None, tol=1e-7,
+        max_iterations=None, debug=False, dot=None, discr=None):
+    """Solve *operator* x = b for each b in the object array *bs*, using
+    :class:`MultiRHSCGStateContainer`.
+    """
+    cg = MultiRHSCGStateContainer(operator, precon, dot=dot, discr=discr)
+    cg.reset(bs, xs)
+
+    if not pcon.is_head_rank:
+        debug = False
+
+    return cg.run(max_iterations, tol, debug)
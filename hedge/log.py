@@ -26,7 +26,7 @@ THE SOFTWARE.
 
 
 
-from pytools.log import LogQuantity, MultiLogQuantity
+from pytools.log import LogQuantity, MultiLogQuantity, PostLogQuantity
 import numpy
 
 
@@ -45,7 +45,129 @@ def axis_name(axis):
 
 
 
-class Integral(LogQuantity):
+# reduction batching ----------------------------------------------------------
+class LogReductionBatcher(object):
+    """Carries out the reductions of all
+    :class:`BatchedReductionQuantity` instances on one discretization
+    that are due in a logging step in one
+    :class:`hedge.discretization.ReductionBatch`.
+
+    Batching requires knowing the tick and the logging interval of each
+    quantity, so it only happens once :meth:`attach` has been called with
+    the :class:`pytools.log.LogManager`, which
+    :meth:`hedge.discretization.Discretization.add_instrumentation` does.
+    Until then, each quantity carries out its own reductions.
+
+    The batch is executed when the first quantity asks for its value in
+    a tick. Its results are only handed out during that same tick.
+
+    The logging intervals are read from the gather descriptor lists of
+    the :class:`pytools.log.LogManager`. :meth:`attach` raises a
+    :exc:`TypeError` if the manager does not have them.
+    """
+
+    gather_descriptor_list_names = [
+            "before_gather_descriptors", "after_gather_descriptors"]
+
+    def __init__(self, discr):
+        self.discr = discr
+        self.quantities = []
+        self.logmgr = None
+        self.results = {}
+        self.results_tick = None
+
+    def register(self, quantity):
+        self.quantities.append(quantity)
+
+    def attach(self, logmgr):
+        for gd_list_name in self.gather_descriptor_list_names:
+            if not hasattr(logmgr, gd_list_name):
+                raise TypeError("log manager has no attribute '%s', "
+                        "which is needed to find the logging intervals "
+                        "of batched reductions" % gd_list_name)
+
+        self.logmgr = logmgr
+        self.results = {}
+        self.results_tick = None
+
+    def get_due_quantities(self, tick):
+        intervals = {}
+        for gd_list_name in self.gather_descriptor_list_names:
+            for gd in getattr(self.logmgr, gd_list_name):
+                intervals[id(gd.quantity)] = gd.interval
+
+        return [q for q in self.quantities
+                if id(q) in intervals and tick % intervals[id(q)] == 0]
+
+    def run_batch(self, quantities):
+        batch = self.discr.make_reduction_batch()
+        results = dict(
+                (q, q.add_reductions(batch))
+                for q in quantities)
+        batch.execute()
+        return results
+
+    def get_value(self, quantity):
+        if self.logmgr is None:
+            return self.run_batch([quantity])[quantity]()
+
+        tick = self.logmgr.tick_count
+        if tick != self.results_tick:
+            due = self.get_due_quantities(tick)
+            if quantity not in due:
+                due.append(quantity)
+
+            self.results = self.run_batch(due)
+            self.results_tick = tick
+
+        try:
+            result = self.results.pop(quantity)
+        except KeyError:
+            # asked for more than once in this tick
+            result = self.run_batch([quantity])[quantity]
+
+        return result()
+
+
+
+
+def get_log_reduction_batcher(discr):
+    try:
+        return discr._log_reduction_batcher
+    except AttributeError:
+        result = discr._log_reduction_batcher = LogReductionBatcher(discr)
+        return result
+
+
+
+
+class BatchedReductionQuantity(object):
+    """A mixin for log quantities whose values are global reductions.
+
+    Subclasses implement :meth:`add_reductions` instead of
+    :meth:`__call__`, and call :meth:`register_for_batching` from their
+    constructor.
+    """
+
+    def register_for_batching(self, discr):
+        self.reduction_batcher = get_log_reduction_batcher(discr)
+        self.reduction_batcher.register(self)
+
+    def add_reductions(self, batch):
+        """Add the reductions for this quantity to the
+        :class:`hedge.discretization.ReductionBatch` *batch* and return a
+        callable that returns the value of this quantity after the batch
+        has been executed.
+        """
+        raise NotImplementedError
+
+    def __call__(self):
+        return self.reduction_batcher.get_value(self)
+
+
+
+
+class Integral(BatchedReductionQuantity, LogQuantity):
     """Log the volume integral of a variable in a scope."""
 
     def __init__(self, getter, discr, name=None,
@@ -70,27 +192,28 @@ class Integral(LogQuantity):
         LogQuantity.__init__(self, name, unit, description)
 
         self.discr = discr
+        self.register_for_batching(discr)
 
     @property
     def default_aggregator(self):
         return sum
 
-    def __call__(self):
+    def add_reductions(self, batch):
         var = self.getter()
 
         from hedge.tools import log_shape
 
         if len(log_shape(var)) == 1:
-            return sum(
-                    self.discr.integral(numpy.abs(v))
-                    for v in var)
+            return batch.add_sum(sum(
+                    batch.local_discr.integral(numpy.abs(v))
+                    for v in var))
         else:
-            return self.discr.integral(var)
+            return batch.integral(var)
 
 
 
 
-class LpNorm(LogQuantity):
+class LpNorm(BatchedReductionQuantity, LogQuantity):
     """Log the Lp norm of a variable in a scope."""
 
     def __init__(self, getter, discr, p=2, name=None,
@@ -117,6 +240,8 @@ class LpNorm(LogQuantity):
 
         LogQuantity.__init__(self, name, unit, description)
 
+        self.register_for_batching(discr)
+
     @property
     def default_aggregator(self):
         from pytools import norm_inf, Norm
@@ -126,9 +251,61 @@ class LpNorm(LogQuantity):
         else:
             return Norm(self.p)
 
+    def add_reductions(self, batch):
+        return batch.norm(self.getter(), self.p)
+
+
+
+
+# memory bandwidth ------------------------------------------------------------
+class EffectiveBandwidth(PostLogQuantity):
+    """Log the memory bandwidth (in GB/s) achieved by a kernel, based on
+    byte counts from the models in :mod:`hedge.tools.flops`.
+    """
+
+    def __init__(self, name, description=None):
+        PostLogQuantity.__init__(self, name, "GB/s", description)
+        self.bytes = 0
+        self.elapsed = 0
+
+    def add(self, bytes, elapsed):
+        self.bytes += bytes
+        self.elapsed += elapsed
+
+    @property
+    def bandwidth(self):
+        """Bandwidth in bytes/s since the last tick."""
+        if self.elapsed:
+            return self.bytes/self.elapsed
+        else:
+            return 0
+
+    def prepare_for_tick(self):
+        self.bytes = 0
+        self.elapsed = 0
+
     def __call__(self):
-        var = self.getter()
-        return self.discr.norm(var, self.p)
+        return self.bandwidth*1e-9
+
+
+
+
+class PercentOfPeakBandwidth(PostLogQuantity):
+    """Log the bandwidth recorded by an :class:`EffectiveBandwidth` as
+    a percentage of *peak* (in bytes/s), e.g. as found by
+    :func:`hedge.tools.flops.measure_stream_bandwidth`.
+    """
+
+    def __init__(self, bandwidth, peak, name=None, description=None):
+        if name is None:
+            name = "%s_pct_peak" % bandwidth.name
+
+        PostLogQuantity.__init__(self, name, "%", description)
+        self.bandwidth = bandwidth
+        self.peak = peak
+
+    def __call__(self):
+        return 100*self.bandwidth.bandwidth/self.peak
 
 
 
@@ -156,17 +333,18 @@ class EMFieldGetter(object):
 
 
 
-class ElectricFieldEnergy(LogQuantity):
+class ElectricFieldEnergy(BatchedReductionQuantity, LogQuantity):
     def __init__(self, fields, name="W_el"):
         LogQuantity.__init__(self, name, "J", "Energy of the electric field")
         self.fields = fields
+        self.register_for_batching(fields.discr)
 
     @property
     def default_aggregator(self):
         from pytools import norm_2
         return norm_2
 
-    def __call__(self):
+    def add_reductions(self, batch):
         max_op = self.fields.maxwell_op
 
         e = self.fields.e
@@ -174,22 +352,23 @@ class ElectricFieldEnergy(LogQuantity):
 
         from hedge.tools import ptwise_dot
         energy_density = 1/2*(ptwise_dot(1, 1, e, d))
-        return self.fields.discr.integral(energy_density)
+        return batch.integral(energy_density)
 
 
 
 
-class MagneticFieldEnergy(LogQuantity):
+class MagneticFieldEnergy(BatchedReductionQuantity, LogQuantity):
     def __init__(self, fields, name="W_mag"):
         LogQuantity.__init__(self, name, "J", "Energy of the magnetic field")
         self.fields = fields
+        self.register_for_batching(fields.discr)
 
     @property
     def default_aggregator(self):
         from pytools import norm_2
         return norm_2
 
-    def __call__(self):
+    def add_reductions(self, batch):
         max_op = self.fields.maxwell_op
 
         h = self.fields.h
@@ -197,11 +376,11 @@ class MagneticFieldEnergy(LogQuantity):
 
         from hedge.tools import ptwise_dot
         energy_density = 1/2*(ptwise_dot(1, 1, h, b))
-        return self.fields.discr.integral(energy_density)
+        return batch.integral(energy_density)
 
 
 
-class EMFieldMomentum(MultiLogQuantity):
+class EMFieldMomentum(BatchedReductionQuantity, MultiLogQuantity):
     def __init__(self, fields, c0, names=None):
         if names is None:
             names = ["p%s_field" % axis_name(i)
@@ -225,7 +404,9 @@ class EMFieldMomentum(MultiLogQuantity):
                 op2_subset=h_subset,
                 )
 
-    def __call__(self):
+        self.register_for_batching(fields.discr)
+
+    def add_reductions(self, batch):
         max_op = self.fields.maxwell_op
 
         e = self.fields.e
@@ -234,7 +415,7 @@ class EMFieldMomentum(MultiLogQuantity):
         poynting_s = self.poynting_cross(e, h)
 
         momentum_density = poynting_s/self.c0**2
-        return self.fields.discr.integral(momentum_density)
+        return batch.integral(momentum_density)
 
 
 
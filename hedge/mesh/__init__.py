@@ -489,13 +489,21 @@ class ConformalMesh(Mesh):
         if method == "cuthill":
             from hedge.mesh.tools import cuthill_mckee
             return cuthill_mckee(self.element_adjacency_graph())
+        elif method == "hilbert":
+            from hedge.mesh.tools import hilbert_order, get_element_centroids
+            return hilbert_order(get_element_centroids(self))
+        elif method == "morton":
+            from hedge.mesh.tools import morton_order, get_element_centroids
+            return morton_order(get_element_centroids(self))
         else:
             raise ValueError("invalid mesh reorder method")
 
     def reordered_by(self, method):
         """Return a reordered copy of *self*.
 
-        :param method: "cuthill"
+        :param method: "cuthill" (Cuthill-McKee on the element adjacency
+          graph), or "hilbert" or "morton" (element centroids sorted
+          along a space-filling curve).
         """
 
         old_numbers = self.get_reorder_oldnumbers(method)
@@ -79,3 +79,185 @@ def cuthill_mckee(graph):
         levelset = list(next_levelset)
 
     return old_numbers
+
+
+
+
+def get_element_centroids(mesh):
+    """Return an array of shape *(len(mesh.elements), dimensions)*
+    containing the vertex centroid of each element of *mesh*.
+    """
+    import numpy
+    el_vertices = numpy.array([el.vertex_indices for el in mesh.elements],
+            dtype=numpy.intp)
+    return numpy.asarray(mesh.points)[el_vertices].mean(axis=1)
+
+
+
+
+def _quantize_points(points, bits):
+    """Map each coordinate of *points* onto the integers in
+    :math:`[0, 2^{bits})`, using one common scale for all axes.
+    """
+    import numpy
+    points = numpy.asarray(points, dtype=numpy.float64)
+    low = numpy.min(points, axis=0)
+    extent = numpy.max(numpy.max(points, axis=0) - low)
+    if extent == 0:
+        extent = 1
+
+    max_coord = (1 << bits) - 1
+    return numpy.minimum(
+            ((points - low) * (max_coord/extent)).astype(numpy.int64),
+            max_coord)
+
+
+
+
+def _interleave_bits(coords, bits):
+    """Return the Morton (Z-order) key of each row of the integer array
+    *coords*, taking *bits* bits from each column, most significant first.
+    """
+    import numpy
+    key = numpy.zeros(len(coords), dtype=numpy.int64)
+    for bit in range(bits-1, -1, -1):
+        for axis in range(coords.shape[1]):
+            key = (key << 1) | ((coords[:, axis] >> bit) & 1)
+    return key
+
+
+
+
+def _hilbert_transpose(coords, bits):
+    """Return the Hilbert index of each row of the integer array *coords*
+    in "transposed" form, i.e. with its bits spread across the columns
+    such that :func:`_interleave_bits` yields the index.
+
+    See J. Skilling, Programming the Hilbert curve,
+    AIP Conf. Proc. 707, 381 (2004).
+    """
+    import numpy
+    x = coords.copy()
+    dims = x.shape[1]
+    top = 1 << (bits-1)
+
+    # inverse undo excess work
+    q = top
+    while q > 1:
+        p = q - 1
+        for axis in range(dims):
+            bit_set = (x[:, axis] & q) != 0
+            x[bit_set, 0] ^= p
+
+            bit_clear = ~bit_set
+            swap = (x[bit_clear, 0] ^ x[bit_clear, axis]) & p
+            x[bit_clear, 0] ^= swap
+            x[bit_clear, axis] ^= swap
+        q >>= 1
+
+    # Gray encode
+    for axis in range(1, dims):
+        x[:, axis] ^= x[:, axis-1]
+
+    t = numpy.zeros(len(x), dtype=x.dtype)
+    q = top
+    while q > 1:
+        t[(x[:, dims-1] & q) != 0] ^= q - 1
+        q >>= 1
+
+    x ^= t[:, numpy.newaxis]
+    return x
+
+
+
+
+def _default_curve_bits(dimensions):
+    return min(20, 62 // dimensions)
+
+
+
+
+def morton_order(points, bits=None):
+    """Return a list of indices into *points* that sorts them along a
+    Morton (Z-order) curve.
+
+    *points* is an array of shape *(count, dimensions)*. The bounding box
+    of *points* is divided into :math:`2^{bits}` cells along each axis.
+    Points in the same cell keep their relative order.
+    """
+    import numpy
+    points = numpy.asarray(points)
+    if bits is None:
+        bits = _default_curve_bits(points.shape[1])
+
+    keys = _interleave_bits(_quantize_points(points, bits), bits)
+    return list(numpy.argsort(keys, kind="mergesort"))
+
+
+
+
+def hilbert_order(points, bits=None):
+    """Return a list of indices into *points* that sorts them along a
+    Hilbert curve. Unlike the Morton curve, the Hilbert curve only ever
+    moves between adjacent cells, which makes for fewer far-away
+    neighbors.
+
+    See :func:`morton_order` for the meaning of the arguments.
+    """
+    import numpy
+    points = numpy.asarray(points)
+    if bits is None:
+        bits = _default_curve_bits(points.shape[1])
+
+    keys = _interleave_bits(
+            _hilbert_transpose(_quantize_points(points, bits), bits),
+            bits)
+    return list(numpy.argsort(keys, kind="mergesort"))
+
+
+
+
+# graph coloring --------------------------------------------------------------
+def get_graph_neighborhood(graph, node, distance=1):
+    """Return the set of nodes of *graph*, other than *node*, that are at
+    most *distance* edges away from *node*.
+    """
+    result = set(graph.get(node, []))
+    frontier = result
+    for i in range(distance-1):
+        frontier = set(nb
+                for frontier_node in frontier
+                for nb in graph[frontier_node]) - result
+        result.update(frontier)
+
+    result.discard(node)
+    return result
+
+
+
+
+def greedy_coloring(graph, distance=1):
+    """Return a dictionary mapping each node of *graph* to a color, a
+    nonnegative integer, such that no two nodes that are at most *distance*
+    edges apart share a color.
+
+    Nodes are colored in order of decreasing degree (Welsh-Powell).
+
+    *graph* is given as an adjacency mapping, i.e. each node is
+    mapped to a list of its neighbors.
+    """
+    nodes = sorted(graph.keys(), key=lambda node: len(graph[node]),
+            reverse=True)
+
+    coloring = {}
+    for node in nodes:
+        taken = set(coloring[nb]
+                for nb in get_graph_neighborhood(graph, node, distance)
+                if nb in coloring)
+
+        color = 0
+        while color in taken:
+            color += 1
+        coloring[node] = color
+
+    return coloring
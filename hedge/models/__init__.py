@@ -58,17 +58,191 @@ class HyperbolicOperator(Operator):
 
     def estimate_timestep(self, discr, 
             stepper=None, stepper_class=None, stepper_args=None,
-            t=None, fields=None):
+            t=None, fields=None, speed=None):
         u"""Estimate the largest stable timestep, given a time stepper
         `stepper_class`. If none is given, RK4 is assumed.
+
+        If *speed*, a volume vector of wave speeds, is given, it is used
+        element by element through
+        :meth:`hedge.discretization.Discretization.cfl_timestep` instead of
+        :meth:`max_eigenvalue`.
         """
 
-        rk4_dt = 1 / self.max_eigenvalue(t, fields, discr) \
-                * (discr.dt_non_geometric_factor()
-                * discr.dt_geometric_factor())
+        if speed is not None:
+            rk4_dt = discr.cfl_timestep(speed)
+        else:
+            rk4_dt = 1 / self.max_eigenvalue(t, fields, discr) \
+                    * (discr.dt_non_geometric_factor()
+                    * discr.dt_geometric_factor())
 
         from hedge.timestep.stability import \
                 approximate_rk4_relative_imag_stability_region
         return rk4_dt * approximate_rk4_relative_imag_stability_region(
                 stepper, stepper_class, stepper_args)
 
+
+
+
+class BindSpecializer(object):
+    """Specializes an operator template against a discretization and the
+    data supplied to it, for use in an operator's ``bind`` method.
+
+    Inputs of the operator template are registered using
+    :meth:`add_boundary_data` and :meth:`add_volume_data`. When compiling
+    through :meth:`compile`,
+
+    * boundary fluxes on boundaries that are empty in the mesh are
+      removed, see :class:`hedge.optemplate.mappers.EmptyFluxKiller`,
+    * inputs that are identically zero are replaced by zero in the
+      operator template, if the caller allowed this,
+    * inputs no longer used by the operator template are never evaluated,
+    * inputs that do not depend on time are evaluated only once.
+
+    :meth:`get_report` describes these decisions. It is printed on
+    compilation if the discretization has the debug flag
+    ``dump_bind_specialization``.
+    """
+
+    def __init__(self, discr):
+        self.discr = discr
+        self.inputs = []
+        self.decisions = []
+        self.constant_values = {}
+        self.used_inputs = None
+
+    # {{{ input registration
+
+    def add_boundary_data(self, name, data, tag, prune_zero=False,
+            component_indices=None):
+        """Register the field *name* to be obtained from the
+        boundary interpolant of *data* on *tag*.
+
+        :param data: an :class:`hedge.data.ITimeDependentGivenFunction`
+          or an :class:`hedge.data.IGivenFunction`.
+        :param prune_zero: whether *name* may be replaced by zero in the
+          operator template if *data* is identically zero.
+        :param component_indices: if not *None*, an index into the
+          interpolant to select the components that make up *name*.
+        """
+        from hedge.data import ITimeDependentGivenFunction
+        if isinstance(data, ITimeDependentGivenFunction):
+            def get(t):
+                return data.boundary_interpolant(t, self.discr, tag)
+        else:
+            def get(t):
+                return data.boundary_interpolant(self.discr, tag)
+
+        self._add_input(name, data, get, prune_zero, component_indices)
+
+    def add_volume_data(self, name, data, prune_zero=False,
+            component_indices=None):
+        """Register the field *name* to be obtained from the volume
+        interpolant of *data*. See :meth:`add_boundary_data` for the
+        parameters.
+        """
+        from hedge.data import ITimeDependentGivenFunction
+        if isinstance(data, ITimeDependentGivenFunction):
+            def get(t):
+                return data.volume_interpolant(t, self.discr)
+        else:
+            def get(t):
+                return data.volume_interpolant(self.discr)
+
+        self._add_input(name, data, get, prune_zero, component_indices)
+
+    def _add_input(self, name, data, get, prune_zero, component_indices):
+        if component_indices is not None:
+            def get_components(t, get=get):
+                return get(t)[component_indices]
+        else:
+            get_components = get
+
+        from hedge.data import is_zero_given_function, is_time_constant
+        self.inputs.append((name, get_components,
+            prune_zero and is_zero_given_function(data),
+            is_time_constant(data)))
+
+    # }}}
+
+    # {{{ compilation
+
+    def __call__(self, optemplate):
+        """Specialize the bound *optemplate*. Used as the
+        *post_bind_mapper* in :meth:`compile`.
+        """
+        from hedge.optemplate.mappers import (
+                EmptyFluxKiller, ZeroFieldSubstitutor, DependencyMapper)
+
+        zero_names = set(name
+                for name, get, is_zero, is_constant in self.inputs
+                if is_zero)
+        for name in sorted(zero_names):
+            self.decisions.append("%s: identically zero, "
+                    "replaced by zero" % name)
+        optemplate = ZeroFieldSubstitutor(zero_names)(optemplate)
+
+        killer = EmptyFluxKiller(self.discr.mesh)
+        optemplate = killer(optemplate)
+        for tag in sorted(killer.killed_tags):
+            self.decisions.append("boundary '%s': empty, "
+                    "fluxes removed" % tag)
+
+        from hedge.tools import is_obj_array
+        if is_obj_array(optemplate):
+            exprs = optemplate.flat
+        else:
+            exprs = [optemplate]
+
+        dep_mapper = DependencyMapper(
+                include_operator_bindings=False,
+                include_subscripts=False,
+                include_calls="descend_args")
+        used_names = set()
+        for expr in exprs:
+            used_names.update(dep.name for dep in dep_mapper(expr))
+
+        self.used_inputs = []
+        for name, get, is_zero, is_constant in self.inputs:
+            if name not in used_names:
+                if not is_zero:
+                    self.decisions.append("%s: unused, not evaluated" % name)
+            elif is_constant:
+                self.decisions.append("%s: time-independent, "
+                        "evaluated once" % name)
+                self.constant_values[name] = get(0)
+            else:
+                self.used_inputs.append((name, get))
+
+        return optemplate
+
+    def compile(self, optemplate):
+        """Compile *optemplate* on the discretization, specialized as
+        described above.
+        """
+        self.decisions = []
+        self.constant_values = {}
+
+        result = self.discr.compile(optemplate, post_bind_mapper=self)
+
+        if "dump_bind_specialization" in self.discr.debug:
+            print self.get_report()
+
+        return result
+
+    def get_report(self):
+        if not self.decisions:
+            return "bind specialization: no changes"
+        else:
+            return "bind specialization:\n" + "\n".join(
+                    "    " + decision for decision in self.decisions)
+
+    # }}}
+
+    def get_data(self, t):
+        """Return a :class:`dict` of the values of all inputs still
+        needed by the compiled operator at time *t*.
+        """
+        result = self.constant_values.copy()
+        for name, get in self.used_inputs:
+            result[name] = get(t)
+        return result
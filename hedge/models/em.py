@@ -382,33 +382,30 @@ class MaxwellOperator(HyperbolicOperator):
         check_bc_coverage(discr.mesh, [
             self.pec_tag, self.absorb_tag, self.incident_tag])
 
-        compiled_op_template = discr.compile(self.op_template())
-
         from hedge.tools import full_to_subset_indices
         e_indices = full_to_subset_indices(self.get_eh_subset()[0:3])
         all_indices = full_to_subset_indices(self.get_eh_subset())
 
-        def rhs(t, w):
-            if self.current is not None:
-                j = self.current.volume_interpolant(t, discr)[e_indices]
-            else:
-                j = 0
+        from hedge.models import BindSpecializer
+        specializer = BindSpecializer(discr)
+        if self.current is not None:
+            specializer.add_volume_data("j", self.current,
+                    prune_zero=True, component_indices=e_indices)
+        if self.incident_bc_data is not None:
+            specializer.add_boundary_data("incident_bc",
+                    self.incident_bc_data, self.incident_tag,
+                    prune_zero=True, component_indices=all_indices)
 
-            if self.incident_bc_data is not None:
-                incident_bc_data = self.incident_bc_data.boundary_interpolant(
-                        t, discr, self.incident_tag)[all_indices]
-            else:
-                incident_bc_data = 0
+        compiled_op_template = specializer.compile(self.op_template())
 
-            kwargs = {}
+        def rhs(t, w):
+            kwargs = specializer.get_data(t)
             kwargs.update(extra_context)
             if not self.fixed_material:
                 kwargs["epsilon"] = self.epsilon.volume_interpolant(t, discr)
                 kwargs["mu"] = self.mu.volume_interpolant(t, discr)
 
-            return compiled_op_template(
-                    w=w, j=j, incident_bc=incident_bc_data,
-                    **kwargs)
+            return compiled_op_template(w=w, **kwargs)
 
         return rhs
 
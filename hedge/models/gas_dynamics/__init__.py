@@ -800,15 +800,39 @@ class GasDynamicsOperator(TimeDependentOperator):
     # }}}
 
     # {{{ operator binding ----------------------------------------------------
-    def bind(self, discr, sensor=None, sensor_scaling=None, viscosity_only=False):
+    def bind(self, discr, sensor=None, sensor_scaling=None, viscosity_only=False,
+            elementwise_speed=False):
+        """Return a function *rhs(t, q)* that returns a tuple
+        *(ode_rhs, speed)*. *speed* is the largest characteristic speed,
+        found along with the right-hand side. In a distributed run, it is
+        only the largest on this rank, so that the right-hand side does
+        not wait for other ranks. :meth:`estimate_timestep` reduces it
+        across ranks.
+
+        If *elementwise_speed* is *True*, *speed* is instead a volume vector
+        with the largest characteristic speed of each element. No global
+        reduction is done in the right-hand side, and *speed* can be passed
+        to :meth:`estimate_timestep`.
+        """
         if (sensor is None and 
                 self.artificial_viscosity_mode is not None):
             raise ValueError("must specify a sensor if using "
                     "artificial viscosity")
 
-        bound_op = discr.compile(self.op_template(
+        from hedge.models import BindSpecializer
+        specializer = BindSpecializer(discr)
+        specializer.add_boundary_data("bc_q_in",
+                self.bc_inflow, self.inflow_tag)
+        specializer.add_boundary_data("bc_q_out",
+                self.bc_outflow, self.outflow_tag)
+        specializer.add_boundary_data("bc_q_noslip",
+                self.bc_noslip, self.noslip_tag)
+        specializer.add_boundary_data("bc_q_supersonic_in",
+                self.bc_supersonic_inflow, self.supersonic_inflow_tag)
+
+        bound_op = specializer.compile(self.op_template(
             sensor_scaling=sensor_scaling,
-            viscosity_only=False))
+            viscosity_only=viscosity_only))
 
         from hedge.mesh import check_bc_coverage
         check_bc_coverage(discr.mesh, [
@@ -833,22 +857,16 @@ class GasDynamicsOperator(TimeDependentOperator):
             if sensor is not None:
                 extra_kwargs["sensor"] = sensor(q)
 
-            opt_result = bound_op(q=q,
-                    bc_q_in=self.bc_inflow.boundary_interpolant(
-                        t, discr, self.inflow_tag),
-                    bc_q_out=self.bc_outflow.boundary_interpolant(
-                        t, discr, self.outflow_tag),
-                    bc_q_noslip=self.bc_noslip.boundary_interpolant(
-                        t, discr, self.noslip_tag),
-                    bc_q_supersonic_in=self.bc_supersonic_inflow
-                    .boundary_interpolant(t, discr, 
-                        self.supersonic_inflow_tag),
-                    **extra_kwargs
-                    )
+            extra_kwargs.update(specializer.get_data(t))
+
+            opt_result = bound_op(q=q, **extra_kwargs)
 
             max_speed = opt_result[-1]
             ode_rhs = opt_result[:-1]
-            return ode_rhs, discr.nodewise_max(max_speed)
+            if elementwise_speed:
+                return ode_rhs, max_speed
+            else:
+                return ode_rhs, discr.local_nodewise_max(max_speed)
 
         return rhs
 
@@ -858,16 +876,27 @@ class GasDynamicsOperator(TimeDependentOperator):
 
     def estimate_timestep(self, discr, 
             stepper=None, stepper_class=None, stepper_args=None,
-            t=None, max_eigenvalue=None):
+            t=None, max_eigenvalue=None, speed=None):
         u"""Estimate the largest stable timestep, given a time stepper
         `stepper_class`. If none is given, RK4 is assumed.
+
+        Pass either *max_eigenvalue*, the largest characteristic speed
+        (on this rank, in a distributed run), or *speed*, the per-element
+        speeds obtained from a right-hand side bound with
+        *elementwise_speed=True*. The latter allows each element its own
+        geometric factor.
         """
 
-        dg_factor = (discr.dt_non_geometric_factor()
-                * discr.dt_geometric_factor())
+        if speed is not None:
+            rk4_dt = discr.cfl_timestep(speed, diffusivity=self.mu)
+        else:
+            dg_factor = (discr.dt_non_geometric_factor()
+                    * discr.dt_geometric_factor())
+
+            max_eigenvalue = discr.nodewise_max(max_eigenvalue)
 
-        # see JSH/TW, eq. (7.32)
-        rk4_dt = dg_factor / (max_eigenvalue + self.mu / dg_factor)
+            # see JSH/TW, eq. (7.32)
+            rk4_dt = dg_factor / (max_eigenvalue + self.mu / dg_factor)
 
         from hedge.timestep.stability import \
                 approximate_rk4_relative_imag_stability_region
@@ -29,6 +29,7 @@ THE SOFTWARE.
 
 
 import numpy
+from pytools import memoize_method
 
 from hedge.models import Operator
 from hedge.second_order import LDGSecondDerivative
@@ -183,17 +184,61 @@ class BoundPoissonOperator(hedge.iterative.OperatorBase):
         nodes = len(self.discr)
         return nodes, nodes
 
+    @memoize_method
+    def get_compiled_block_op(self, rhs_count):
+        """Return the operator compiled for an object array of *rhs_count*
+        arguments at once, so that each flux and derivative batch processes
+        all of them together.
+        """
+        from hedge.optemplate import make_vector_field
+        from hedge.tools import make_obj_array
+
+        u = make_vector_field("u", rhs_count)
+        return self.discr.compile(make_obj_array([
+            self.poisson_op.op_template(
+                apply_minv=False, u=u[i], dir_bc=0, neu_bc=0)
+            for i in range(rhs_count)]))
+
     def op(self, u):
+        """Apply the operator to *u*, which may also be an object array
+        of vectors, as used for solving with multiple right-hand sides
+        at once.
+        """
+        from hedge.tools import is_obj_array
+        if is_obj_array(u):
+            compiled_op = self.get_compiled_block_op(len(u))
+        else:
+            compiled_op = self.compiled_op
+
         context = {"u": u}
         if not isinstance(self.poisson_op.diffusion_tensor, numpy.ndarray):
             context["diffusion"] = self.diffusion
 
-        result = self.compiled_op(**context)
+        result = compiled_op(**context)
 
         if self.poincare_mean_value_hack:
-            state_int = self.discr.integral(u)
-            mean_state = state_int / self.discr.mesh_volume()
-            return result - mean_state * self.discr._mass_ones()
+            mass_ones = self.discr._mass_ones()
+            mesh_volume = self.discr.mesh_volume()
+
+            # one collective operation for the integrals of all
+            # right-hand sides
+            batch = self.discr.make_reduction_batch()
+            if is_obj_array(u):
+                integrals = [batch.integral(u_i) for u_i in u]
+            else:
+                integral = batch.integral(u)
+            batch.execute()
+
+            def mean_value_fix(result_i, integral_i):
+                return result_i - integral_i() / mesh_volume * mass_ones
+
+            if is_obj_array(u):
+                from hedge.tools import make_obj_array
+                return make_obj_array([
+                    mean_value_fix(result_i, integral_i)
+                    for result_i, integral_i in zip(result, integrals)])
+            else:
+                return mean_value_fix(result, integral)
         else:
             return result
 
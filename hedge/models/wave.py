@@ -194,18 +194,19 @@ class StrongWaveOperator(HyperbolicOperator):
             self.neumann_tag,
             self.radiation_tag])
 
-        compiled_op_template = discr.compile(self.op_template())
-
-        def rhs(t, w):
-            kwargs = {"w": w}
-            if self.dirichlet_bc_f:
-                kwargs["dir_bc_u"] = self.dirichlet_bc_f.boundary_interpolant(
-                        t, discr, self.dirichlet_tag)
+        from hedge.models import BindSpecializer
+        specializer = BindSpecializer(discr)
+        if self.dirichlet_bc_f:
+            specializer.add_boundary_data("dir_bc_u", self.dirichlet_bc_f,
+                    self.dirichlet_tag, prune_zero=True)
+        if self.source_f is not None:
+            specializer.add_volume_data("source_u", self.source_f,
+                    prune_zero=True)
 
-            if self.source_f is not None:
-                kwargs["source_u"] = self.source_f.volume_interpolant(t, discr)
+        compiled_op_template = specializer.compile(self.op_template())
 
-            return compiled_op_template(**kwargs)
+        def rhs(t, w):
+            return compiled_op_template(w=w, **specializer.get_data(t))
 
         return rhs
 
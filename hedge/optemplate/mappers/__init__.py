@@ -211,6 +211,94 @@ class BoundOpMapperMixin(object):
 
 
 
+
+def _get_constant_types(expr, memo):
+    """Return a hashable summary of the types of all leaves of *expr*,
+    following the structure of :meth:`__getinitargs__`.
+
+    pymbolic's comparison and hashing consider ``1``, ``1.0`` and ``1+0j``
+    equal, yet code generated from them differs, e.g. in whether a quotient
+    is an integer division. Adding this summary to a key keeps such
+    expressions apart. *memo* maps ids of expressions already seen to
+    tuples *(expr, result)*.
+    """
+    if isinstance(expr, pymbolic.primitives.Expression):
+        try:
+            return memo[id(expr)][1]
+        except KeyError:
+            pass
+
+        try:
+            initargs = expr.__getinitargs__()
+        except AttributeError:
+            result = type(expr)
+        else:
+            result = (type(expr),
+                    _get_constant_types(initargs, memo))
+
+        memo[id(expr)] = expr, result
+        return result
+    elif isinstance(expr, (tuple, list)):
+        return tuple(_get_constant_types(child, memo) for child in expr)
+    elif isinstance(expr, numpy.ndarray):
+        if expr.dtype.char == "O":
+            return (expr.shape, tuple(
+                _get_constant_types(child, memo) for child in expr.flat))
+        else:
+            return expr.dtype
+    else:
+        return type(expr)
+
+
+
+
+class NodeCachingMapperMixin(object):
+    """Caches the result of mapping each expression node, so that each
+    distinct subexpression is only mapped once, no matter how often it
+    occurs. Since equal nodes are mapped to the same result object, this
+    also carries sharing established by :class:`OpTemplateInterner`
+    through the mapper.
+
+    Nodes are considered equal if they compare equal and their constants
+    have the same types, see :meth:`get_node_key`.
+
+    Only suitable for mappers whose result for a node does not depend on
+    where the node occurs. Calls with extra arguments are not cached.
+    """
+
+    def get_node_key(self, expr):
+        """Return a key under which *expr* is cached. Unlike *expr*
+        itself, it tells apart nodes that differ only in the types of
+        their constants.
+        """
+        try:
+            memo = self._constant_types_memo
+        except AttributeError:
+            memo = self._constant_types_memo = {}
+
+        return expr, _get_constant_types(expr, memo)
+
+    def rec(self, expr, *args, **kwargs):
+        if args or kwargs or not isinstance(
+                expr, pymbolic.primitives.Expression):
+            return super(NodeCachingMapperMixin, self).rec(
+                    expr, *args, **kwargs)
+
+        try:
+            cache = self._node_cache_dict
+        except AttributeError:
+            cache = self._node_cache_dict = {}
+
+        key = self.get_node_key(expr)
+        try:
+            return cache[key]
+        except KeyError:
+            result = super(NodeCachingMapperMixin, self).rec(expr)
+            cache[key] = result
+            return result
+
+
+
 # }}}
 
 # {{{ basic mappers -----------------------------------------------------------
@@ -303,8 +391,36 @@ class CSERemover(IdentityMapper):
 
 # }}}
 
+# {{{ interning ---------------------------------------------------------------
+class OpTemplateInterner(NodeCachingMapperMixin, IdentityMapper):
+    """Rebuilds an operator template so that structurally equal
+    subexpressions are represented by one shared node. Subexpressions
+    whose constants differ in type, such as ``1`` and ``1.0``, are not
+    considered equal, see :meth:`NodeCachingMapperMixin.get_node_key`.
+
+    Comparing shared nodes reduces to an identity check, and mappers
+    using :class:`NodeCachingMapperMixin` then process each of them once.
+    The table of nodes is kept across calls, so that several operator
+    templates mapped by the same instance share their common parts.
+    """
+
+    def __init__(self):
+        IdentityMapper.__init__(self)
+        self.nodes = {}
+
+    def rec(self, expr, *args, **kwargs):
+        result = NodeCachingMapperMixin.rec(self, expr, *args, **kwargs)
+
+        if isinstance(result, pymbolic.primitives.Expression):
+            result = self.nodes.setdefault(self.get_node_key(result), result)
+
+        return result
+
+# }}}
+
 # {{{ operator binder ---------------------------------------------------------
-class OperatorBinder(CSECachingMapperMixin, IdentityMapper):
+class OperatorBinder(NodeCachingMapperMixin, CSECachingMapperMixin,
+        IdentityMapper):
     map_common_subexpression_uncached = \
             IdentityMapper.map_common_subexpression
 
@@ -331,7 +447,8 @@ class OperatorBinder(CSECachingMapperMixin, IdentityMapper):
 # }}}
 
 # {{{ operator specializer ----------------------------------------------------
-class OperatorSpecializer(CSECachingMapperMixin, IdentityMapper):
+class OperatorSpecializer(NodeCachingMapperMixin, CSECachingMapperMixin,
+        IdentityMapper):
     """Guided by a typedict obtained through type inference (i.e. by
     :class:`hedge.optemplate.mappers.type_inference.TypeInferrrer`),
     substitutes more specialized operators for generic ones.
@@ -507,7 +624,8 @@ class OperatorSpecializer(CSECachingMapperMixin, IdentityMapper):
 
 # {{{ global-to-reference mapper ----------------------------------------------
 
-class GlobalToReferenceMapper(CSECachingMapperMixin, IdentityMapper):
+class GlobalToReferenceMapper(NodeCachingMapperMixin, CSECachingMapperMixin,
+        IdentityMapper):
     """Maps operators that apply on the global function space down to operators on
     reference elements, together with explicit multiplication by geometric factors.
     """
@@ -1004,6 +1122,7 @@ class QuadratureUpsamplerChanger(CSECachingMapperMixin, IdentityMapper):
 
 # {{{ simplification / optimization -------------------------------------------
 class CommutativeConstantFoldingMapper(
+        NodeCachingMapperMixin,
         pymbolic.mapper.constant_folder.CommutativeConstantFoldingMapper,
         IdentityMapperMixin):
 
@@ -1140,10 +1259,19 @@ class CommutativeConstantFoldingMapper(
 
 
 
-class EmptyFluxKiller(CSECachingMapperMixin, IdentityMapper):
+class EmptyFluxKiller(NodeCachingMapperMixin, CSECachingMapperMixin,
+        IdentityMapper):
+    """Removes boundary fluxes on boundaries that are empty in *mesh*.
+
+    .. attribute:: killed_tags
+
+      The set of boundary tags whose fluxes were removed.
+    """
+
     def __init__(self, mesh):
         IdentityMapper.__init__(self)
         self.mesh = mesh
+        self.killed_tags = set()
 
     map_common_subexpression_uncached = \
             IdentityMapper.map_common_subexpression
@@ -1153,6 +1281,7 @@ class EmptyFluxKiller(CSECachingMapperMixin, IdentityMapper):
 
         if (isinstance(expr.op, BoundaryFluxOperatorBase) and
             len(self.mesh.tag_to_boundary.get(expr.op.boundary_tag, [])) == 0):
+            self.killed_tags.add(expr.op.boundary_tag)
             return 0
         else:
             return IdentityMapper.map_operator_binding(self, expr)
@@ -1160,6 +1289,36 @@ class EmptyFluxKiller(CSECachingMapperMixin, IdentityMapper):
 
 
 
+class ZeroFieldSubstitutor(NodeCachingMapperMixin, CSECachingMapperMixin,
+        IdentityMapper):
+    """Replaces the fields named in *names*, and all their components,
+    by zero.
+    """
+
+    def __init__(self, names):
+        IdentityMapper.__init__(self)
+        self.names = names
+
+    map_common_subexpression_uncached = \
+            IdentityMapper.map_common_subexpression
+
+    def map_variable(self, expr):
+        if expr.name in self.names:
+            return 0
+        else:
+            return IdentityMapper.map_variable(self, expr)
+
+    def map_subscript(self, expr):
+        from pymbolic.primitives import Variable
+        if (isinstance(expr.aggregate, Variable)
+                and expr.aggregate.name in self.names):
+            return 0
+        else:
+            return IdentityMapper.map_subscript(self, expr)
+
+
+
+
 class _InnerDerivativeJoiner(pymbolic.mapper.RecursiveMapper):
     def map_operator_binding(self, expr, derivatives):
         from hedge.optemplate import DifferentiationOperator
@@ -1228,7 +1387,8 @@ class _InnerDerivativeJoiner(pymbolic.mapper.RecursiveMapper):
 
 
 
-class DerivativeJoiner(CSECachingMapperMixin, IdentityMapper):
+class DerivativeJoiner(NodeCachingMapperMixin, CSECachingMapperMixin,
+        IdentityMapper):
     """Joins derivatives:
 
     .. math::
@@ -1355,7 +1515,8 @@ class _InnerInverseMassContractor(pymbolic.mapper.RecursiveMapper):
 
 
 
-class InverseMassContractor(CSECachingMapperMixin, IdentityMapper):
+class InverseMassContractor(NodeCachingMapperMixin, CSECachingMapperMixin,
+        IdentityMapper):
     # assumes all operators to be bound
     map_common_subexpression_uncached = \
             IdentityMapper.map_common_subexpression
@@ -1386,7 +1547,8 @@ class InverseMassContractor(CSECachingMapperMixin, IdentityMapper):
 # }}}
 
 # {{{ error checker -----------------------------------------------------------
-class ErrorChecker(CSECachingMapperMixin, IdentityMapper):
+class ErrorChecker(NodeCachingMapperMixin, CSECachingMapperMixin,
+        IdentityMapper):
     map_common_subexpression_uncached = \
             IdentityMapper.map_common_subexpression
 
@@ -1525,14 +1687,27 @@ class Evaluator(pymbolic.mapper.evaluator.EvaluationMapper):
         return BoundaryPair(self.rec(bp.field), self.rec(bp.bfield), bp.tag)
 # }}}
 
-# {{{ boundary combiner (used by CUDA backend) --------------------------------
+# {{{ boundary combiner (used by CUDA and JIT backends) -----------------------
 class BoundaryCombiner(CSECachingMapperMixin, IdentityMapper):
     """Combines inner fluxes and boundary fluxes into a
     single, whole-domain operator of type
     :class:`hedge.optemplate.operators.WholeDomainFluxOperator`.
+
+    :param combine_rank_boundaries: If *False*, fluxes on
+      :class:`hedge.mesh.TAG_RANK_BOUNDARY` boundaries are left alone, so
+      that the combined flux does not have to wait for data from
+      neighboring ranks.
     """
-    def __init__(self, mesh):
+    def __init__(self, mesh, combine_rank_boundaries=True):
         self.mesh = mesh
+        self.combine_rank_boundaries = combine_rank_boundaries
+
+    def is_excluded(self, expr):
+        from hedge.optemplate.primitives import BoundaryPair
+        from hedge.mesh import TAG_RANK_BOUNDARY
+        return (not self.combine_rank_boundaries
+                and isinstance(expr.field, BoundaryPair)
+                and isinstance(expr.field.tag, TAG_RANK_BOUNDARY))
 
     map_common_subexpression_uncached = \
             IdentityMapper.map_common_subexpression
@@ -1554,7 +1729,8 @@ class BoundaryCombiner(CSECachingMapperMixin, IdentityMapper):
         for ch in expressions:
             from hedge.optemplate.operators import FluxOperatorBase
             if (isinstance(ch, OperatorBinding)
-                    and isinstance(ch.op, FluxOperatorBase)):
+                    and isinstance(ch.op, FluxOperatorBase)
+                    and not self.is_excluded(ch)):
                 skip = False
 
                 my_is_lift = ch.op.is_lift
@@ -1608,9 +1784,13 @@ class BoundaryCombiner(CSECachingMapperMixin, IdentityMapper):
 
     def map_operator_binding(self, expr):
         from hedge.optemplate.operators import FluxOperatorBase
-        if isinstance(expr.op, FluxOperatorBase):
+        if (isinstance(expr.op, FluxOperatorBase)
+                and not self.is_excluded(expr)):
             wdf, rest = self.gather_one_wdflux([expr])
             assert not rest
+            if wdf is None:
+                # a boundary flux on an empty boundary
+                return 0
             return wdf
         else:
             return IdentityMapper \
@@ -31,7 +31,7 @@ from pytools import memoize_method
 from pymbolic.mapper import CSECachingMapperMixin
 from hedge.optemplate.mappers import (
         IdentityMapper, DependencyMapper, CombineMapper,
-        OperatorReducerMixin)
+        OperatorReducerMixin, NodeCachingMapperMixin)
 
 
 
@@ -89,7 +89,8 @@ class ExpensiveBoundaryOperatorDetector(CombineMapper):
 
 
 
-class BCToFluxRewriter(CSECachingMapperMixin, IdentityMapper):
+class BCToFluxRewriter(NodeCachingMapperMixin, CSECachingMapperMixin,
+        IdentityMapper):
     """Operates on :class:`FluxOperator` instances bound to :class:`BoundaryPair`. If the
     boundary pair's *bfield* is an expression of what's available in the
     *field*, we can avoid fetching the data for the explicit boundary
@@ -31,12 +31,13 @@ import numpy
 import numpy.linalg as la
 import pymbolic.primitives
 from pytools import Record, memoize_method
+from hedge.optemplate.primitives import _CachedHashMixin
 
 
 
 
 # {{{ base classes ------------------------------------------------------------
-class Operator(pymbolic.primitives.Leaf):
+class Operator(_CachedHashMixin, pymbolic.primitives.Leaf):
     def stringifier(self):
         from hedge.optemplate import StringifyMapper
         return StringifyMapper
@@ -493,7 +494,8 @@ class BoundarizeOperator(Operator):
 
 
 
-class FluxExchangeOperator(pymbolic.primitives.AlgebraicLeaf):
+class FluxExchangeOperator(_CachedHashMixin,
+        pymbolic.primitives.AlgebraicLeaf):
     """An operator that results in the sending and receiving of
     boundary information for its argument fields.
     """
@@ -664,9 +666,10 @@ class VectorFluxOperator(object):
 
 
 
-class WholeDomainFluxOperator(pymbolic.primitives.AlgebraicLeaf):
-    """Used by the CUDA backend to represent a flux computation on the
-    whole domain--interior and boundary.
+class WholeDomainFluxOperator(_CachedHashMixin,
+        pymbolic.primitives.AlgebraicLeaf):
+    """Used by the CUDA and JIT backends to represent a flux computation
+    on the whole domain--interior and boundary.
 
     Unlike other operators, :class:`WholeDomainFluxOperator` instances
     are not bound.
@@ -745,7 +748,7 @@ class WholeDomainFluxOperator(pymbolic.primitives.AlgebraicLeaf):
         return StringifyMapper
 
     def repr_op(self):
-        return type(self)(False, [], [], self.quadrature_tag)
+        return type(self)(self.is_lift, [], [], self.quadrature_tag)
 
     @memoize_method
     def rebuild_optemplate(self):
@@ -771,10 +774,16 @@ class WholeDomainFluxOperator(pymbolic.primitives.AlgebraicLeaf):
 
     # infrastructure interaction
     def get_hash(self):
-        return hash((self.__class__, self.rebuild_optemplate()))
+        return hash((self.__class__, self.is_lift, self.quadrature_tag,
+            self.rebuild_optemplate()))
 
     def is_equal(self, other):
+        # is_lift and quadrature_tag are compared explicitly, since the
+        # rebuilt optemplate does not capture them for empty instances,
+        # such as those returned by repr_op.
         return (other.__class__ == WholeDomainFluxOperator
+                and self.is_lift == other.is_lift
+                and self.quadrature_tag == other.quadrature_tag
                 and self.rebuild_optemplate() == other.rebuild_optemplate())
 
     def __getinitargs__(self):
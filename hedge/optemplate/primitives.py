@@ -35,6 +35,34 @@ import hedge.mesh
 
 
 
+# {{{ hashing -----------------------------------------------------------------
+class _CachedHashMixin(object):
+    """Op template nodes are immutable, and many of them are expensive to
+    hash, so compute their hash only once. Also short-circuit comparisons
+    of a node with itself, which are common once equal subexpressions
+    share nodes (see :class:`hedge.optemplate.mappers.OpTemplateInterner`).
+    """
+
+    def __hash__(self):
+        try:
+            return self._hash_value
+        except AttributeError:
+            self._hash_value = self.get_hash()
+            return self._hash_value
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        return super(_CachedHashMixin, self).__eq__(other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+# }}}
+
 # {{{ variables ---------------------------------------------------------------
 from hedge.tools.symbolic import CFunction
 
@@ -61,7 +89,8 @@ class ScalarParameter(pymbolic.primitives.Variable):
 # }}}
 
 # {{{ technical helpers -------------------------------------------------------
-class OperatorBinding(pymbolic.primitives.AlgebraicLeaf):
+class OperatorBinding(_CachedHashMixin,
+        pymbolic.primitives.AlgebraicLeaf):
     def __init__(self, op, field):
         self.op = op
         self.field = field
@@ -110,7 +139,8 @@ class PrioritizedSubexpression(pymbolic.primitives.CommonSubexpression):
 
 
 
-class BoundaryPair(pymbolic.primitives.AlgebraicLeaf):
+class BoundaryPair(_CachedHashMixin,
+        pymbolic.primitives.AlgebraicLeaf):
     """Represents a pairing of a volume and a boundary field, used for the
     application of boundary fluxes.
     """
@@ -148,7 +178,8 @@ class BoundaryPair(pymbolic.primitives.AlgebraicLeaf):
 # }}}
 
 # {{{ geometry data -----------------------------------------------------------
-class BoundaryNormalComponent(pymbolic.primitives.AlgebraicLeaf):
+class BoundaryNormalComponent(_CachedHashMixin,
+        pymbolic.primitives.AlgebraicLeaf):
     def __init__(self, boundary_tag, axis, quadrature_tag=None):
         self.boundary_tag = boundary_tag
         self.axis = axis
@@ -182,7 +213,8 @@ def make_normal(tag, dimensions):
 
 
 
-class GeometricFactorBase(pymbolic.primitives.AlgebraicLeaf):
+class GeometricFactorBase(_CachedHashMixin,
+        pymbolic.primitives.AlgebraicLeaf):
     def __init__(self, quadrature_tag):
         """
         :param quadrature_tag: quadrature tag for the grid on
@@ -238,18 +238,24 @@ def process_optemplate(optemplate, post_bind_mapper=None,
     from hedge.optemplate.mappers import (
             OperatorBinder, CommutativeConstantFoldingMapper,
             EmptyFluxKiller, InverseMassContractor, DerivativeJoiner,
-            ErrorChecker, OperatorSpecializer, GlobalToReferenceMapper)
+            ErrorChecker, OperatorSpecializer, GlobalToReferenceMapper,
+            OpTemplateInterner)
     from hedge.optemplate.mappers.bc_to_flux import BCToFluxRewriter
     from hedge.optemplate.mappers.type_inference import TypeInferrer
 
+    # Equal subexpressions are made to share one node, which the
+    # node-caching passes below then only process once. Those passes map
+    # shared nodes to shared results, so the sharing is preserved.
+    interner = OpTemplateInterner()
+
     dumper("before-bind", optemplate)
-    optemplate = OperatorBinder()(optemplate)
+    optemplate = interner(OperatorBinder()(optemplate))
 
     ErrorChecker(mesh)(optemplate)
 
     if post_bind_mapper is not None:
         dumper("before-postbind", optemplate)
-        optemplate = post_bind_mapper(optemplate)
+        optemplate = interner(post_bind_mapper(optemplate))
 
     if mesh is not None:
         dumper("before-empty-flux-killer", optemplate)
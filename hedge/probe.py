@@ -0,0 +1,248 @@
+"""Sampling of fields at fixed points, with buffered time series output."""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2007 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+
+
+import numpy
+
+
+
+
+_MAGIC = "HEDGEPRB"
+_FORMAT_VERSION = 1
+
+
+
+
+def make_line_points(start, end, point_count):
+    """Return *point_count* points spaced evenly on the line segment from
+    *start* to *end*, including both end points.
+    """
+    start = numpy.asarray(start, dtype=numpy.float64)
+    end = numpy.asarray(end, dtype=numpy.float64)
+    return (start
+            + numpy.linspace(0, 1, point_count)[:, numpy.newaxis]*(end-start))
+
+
+
+
+def _is_hdf5_filename(filename):
+    return filename.endswith(".h5") or filename.endswith(".hdf5")
+
+
+
+
+# {{{ writers
+
+class _BinaryProbeWriter(object):
+    """Writes a header followed by fixed-size records, each consisting of
+    a time and the sampled values. See :func:`read_probe_data`.
+    """
+
+    def __init__(self, filename, points, value_shape, value_dtype):
+        self.record_dtype = numpy.dtype([
+            ("t", "<f8"),
+            ("values", value_dtype.newbyteorder("<"), value_shape)])
+
+        self.outf = open(filename, "wb")
+        self.outf.write(_MAGIC)
+        numpy.array(
+                [_FORMAT_VERSION, len(value_shape)] + list(value_shape)
+                + list(points.shape),
+                dtype="<i8").tofile(self.outf)
+        self.outf.write(self.record_dtype["values"].base.str.ljust(8))
+        numpy.asarray(points, dtype="<f8").tofile(self.outf)
+
+    def write(self, times, values):
+        records = numpy.empty(len(times), dtype=self.record_dtype)
+        records["t"] = times
+        records["values"] = values
+        records.tofile(self.outf)
+        self.outf.flush()
+
+    def close(self):
+        self.outf.close()
+
+
+
+
+class _HDF5ProbeWriter(object):
+    def __init__(self, filename, points, value_shape, value_dtype):
+        import h5py
+        self.file = h5py.File(filename, "w")
+        self.file.create_dataset("points", data=points)
+        self.times = self.file.create_dataset("t",
+                shape=(0,), maxshape=(None,), dtype=numpy.float64,
+                chunks=True)
+        self.values = self.file.create_dataset("values",
+                shape=(0,) + value_shape, maxshape=(None,) + value_shape,
+                dtype=value_dtype, chunks=True)
+
+    def write(self, times, values):
+        old_count = len(self.times)
+        new_count = old_count + len(times)
+
+        self.times.resize((new_count,))
+        self.times[old_count:] = times
+        self.values.resize((new_count,) + self.values.shape[1:])
+        self.values[old_count:] = values
+
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+
+
+def read_probe_data(filename):
+    """Read a file written by :class:`ProbeSampler`.
+
+    :returns: a tuple *(points, times, values)*, where the leading index
+      of *values* matches *times*.
+    """
+    if _is_hdf5_filename(filename):
+        import h5py
+        inf = h5py.File(filename, "r")
+        try:
+            return (inf["points"][...], inf["t"][...], inf["values"][...])
+        finally:
+            inf.close()
+
+    inf = open(filename, "rb")
+    try:
+        if inf.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError("'%s' is not a probe data file" % filename)
+
+        version, value_ndim = numpy.fromfile(inf, dtype="<i8", count=2)
+        if version != _FORMAT_VERSION:
+            raise ValueError("unsupported probe data format version %d"
+                    % version)
+
+        shapes = numpy.fromfile(inf, dtype="<i8", count=value_ndim+2)
+        value_shape = tuple(int(n) for n in shapes[:value_ndim])
+        points_shape = tuple(int(n) for n in shapes[value_ndim:])
+
+        value_dtype = numpy.dtype(inf.read(8).strip())
+        points = numpy.fromfile(inf, dtype="<f8",
+                count=numpy.prod(points_shape)).reshape(points_shape)
+
+        records = numpy.fromfile(inf, dtype=numpy.dtype([
+            ("t", "<f8"),
+            ("values", value_dtype, value_shape)]))
+    finally:
+        inf.close()
+
+    return points, records["t"], records["values"]
+
+# }}}
+
+
+
+
+class ProbeSampler(object):
+    """Records time series of fields at a fixed set of points.
+
+    The points are located once, on construction. Each sample then
+    evaluates all components of the given fields at all points with a
+    single :class:`hedge.discretization.PointInterpolator` application.
+    Samples are buffered in memory and written to *filename* in bulk,
+    every *buffer_size* samples and on :meth:`close`. A *filename* ending
+    in ``.h5`` or ``.hdf5`` is written using :mod:`h5py`, anything else
+    in a compact binary format. Both can be read back with
+    :func:`read_probe_data`.
+
+    On distributed discretizations, all ranks must take every sample.
+    Each rank evaluates only the points in its part of the mesh, and the
+    buffered values are summed onto the head rank when they are written.
+    Only the head rank writes *filename*.
+    """
+
+    def __init__(self, discr, points, filename, buffer_size=100,
+            use_btree=True, thresh=0):
+        self.discr = discr
+        self.points = numpy.asarray(points, dtype=numpy.float64)
+        self.filename = filename
+        self.buffer_size = buffer_size
+
+        self.interpolator = discr.get_point_interpolator(
+                self.points, use_btree=use_btree, thresh=thresh)
+
+        self.times = []
+        self.values = []
+        self.writer = None
+
+    @property
+    def is_distributed(self):
+        return getattr(self.discr, "subdiscr", None) is not None
+
+    def __call__(self, t, fields):
+        """Record the values of *fields* (a volume vector or an object
+        array of them) at time *t*.
+        """
+        self.times.append(t)
+        self.values.append(self.interpolator(fields))
+
+        if len(self.times) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered samples."""
+        if not self.times:
+            return
+
+        times = numpy.array(self.times, dtype=numpy.float64)
+        values = numpy.array(self.values)
+        self.times = []
+        self.values = []
+
+        if self.is_distributed:
+            import pytools.mpiwrap as mpi
+            rcon = self.discr.context
+            values = rcon.communicator.reduce(values,
+                    op=mpi.SUM, root=rcon.head_rank)
+            if not rcon.is_head_rank:
+                return
+
+        if self.writer is None:
+            if _is_hdf5_filename(self.filename):
+                writer_class = _HDF5ProbeWriter
+            else:
+                writer_class = _BinaryProbeWriter
+
+            self.writer = writer_class(self.filename, self.points,
+                    values.shape[1:], values.dtype)
+
+        self.writer.write(times, values)
+
+    def close(self):
+        """Write all buffered samples and close the output file."""
+        self.flush()
+
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
@@ -103,3 +103,34 @@ def times_and_steps(max_dt_getter, taken_dt_getter=None,
 
         step += 1
         t += taken_dt
+
+
+
+
+class SideOutputRecorder(object):
+    """Wraps a right-hand side *rhs(t, y)* that returns a tuple
+    *(ode_rhs, side_output)*, such as a gas dynamics operator's, into one
+    that returns only *ode_rhs* and so can be passed to time steppers.
+
+    .. attribute:: side_output
+
+        The side output of the most recent evaluation, e.g. the wave speeds
+        from the last stage of the latest time step. This can serve to
+        choose the next time step without another pass over the data::
+
+            rhs = SideOutputRecorder(op.bind(discr, elementwise_speed=True))
+            rhs(0, fields)
+            for step, t, dt in times_and_steps(
+                    final_time=final_time,
+                    max_dt_getter=lambda t: op.estimate_timestep(discr,
+                        stepper=stepper, t=t, speed=rhs.side_output)):
+                fields = stepper(fields, t, dt, rhs)
+    """
+
+    def __init__(self, rhs):
+        self.rhs = rhs
+        self.side_output = None
+
+    def __call__(self, t, y):
+        result, self.side_output = self.rhs(t, y)
+        return result
@@ -124,12 +124,232 @@ def make_ab_coefficients(order):
 
 
 
+# history and in-place arithmetic ---------------------------------------------
+class RingHistory(object):
+    """A history of at most *length* entries, newest first, stored in a
+    ring buffer. :meth:`push` replaces the oldest entry once the history
+    is full, without moving the others.
+    """
+
+    def __init__(self, length, entries=[]):
+        self.slots = [None]*length
+        self.head = 0
+        self.count = 0
+
+        for entry in entries[::-1]:
+            self.push(entry)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return self.slots[(self.head + i) % len(self.slots)]
+
+    def __iter__(self):
+        for i in xrange(self.count):
+            yield self[i]
+
+    def push(self, entry):
+        """Make *entry* the newest entry."""
+        self.head = (self.head - 1) % len(self.slots)
+        self.slots[self.head] = entry
+        self.count = min(self.count + 1, len(self.slots))
+
+
+
+
+def get_state_leaves(vec):
+    """Return a list of the :class:`numpy.ndarray` instances making up
+    *vec*, which may be an array or a (nested) object array of them, in a
+    fixed order. Return *None* if *vec* is anything else.
+    """
+    if not isinstance(vec, numpy.ndarray):
+        return None
+
+    if vec.dtype != object:
+        return [vec]
+
+    result = []
+    for sub_vec in vec.flat:
+        sub_leaves = get_state_leaves(sub_vec)
+        if sub_leaves is None:
+            return None
+        result.extend(sub_leaves)
+
+    return result
+
+
+
+
+def get_matching_leaves(vecs):
+    """Return a list containing the result of :func:`get_state_leaves`
+    for each of *vecs*, or *None* unless all of *vecs* consist of the
+    same number of arrays with matching shapes.
+    """
+    result = [get_state_leaves(vec) for vec in vecs]
+    if None in result:
+        return None
+
+    for vec_leaves in result[1:]:
+        if len(vec_leaves) != len(result[0]):
+            return None
+        for leaf, first_leaf in zip(vec_leaves, result[0]):
+            if leaf.shape != first_leaf.shape:
+                return None
+
+    return result
+
+
+
+
+def rebuild_state(template, leaves):
+    """Return a state with the same object array structure as *template*,
+    taking the arrays in the order of :func:`get_state_leaves` from the
+    iterator *leaves*.
+    """
+    if template.dtype != object:
+        return leaves.next()
+
+    result = numpy.empty(template.shape, dtype=object)
+    for i, sub_template in enumerate(template.flat):
+        result.flat[i] = rebuild_state(sub_template, leaves)
+    return result
+
+
+
+
+class ScratchSpace(object):
+    """Arrays that are allocated on first use and reused afterwards, as
+    long as their shape and dtype stay the same.
+    """
+
+    def __init__(self):
+        self.arrays = {}
+
+    def get(self, key, shape, dtype):
+        ary = self.arrays.get(key)
+        if ary is None or ary.shape != shape or ary.dtype != dtype:
+            ary = self.arrays[key] = numpy.empty(shape, dtype)
+        return ary
+
+
+
+
+def linear_comb_into(acc, tmp, coefficients, vectors):
+    """Store ``coefficients[0]*vectors[0] + coefficients[1]*vectors[1] +
+    ...`` in the array *acc*, using *tmp* as scratch space.
+
+    The operations are carried out in the same order as in
+    ``reduce(add, (c*v for c, v in zip(coefficients, vectors)))``, so the
+    result is bit-for-bit the same.
+    """
+    numpy.multiply(coefficients[0], vectors[0], out=acc)
+    for i in xrange(1, len(coefficients)):
+        numpy.multiply(coefficients[i], vectors[i], out=tmp)
+        numpy.add(acc, tmp, out=acc)
+
+
+
+
+def ab_update(scratch, y, dt, terms, in_place=False):
+    """Return ``y + dt * (lc_0 + lc_1 + ...)``, where ``lc_i`` is the linear
+    combination of the vectors in *terms[i][1]* with the coefficients in
+    *terms[i][0]*, evaluated as by :func:`linear_comb_into`. Intermediate
+    results are kept in the :class:`ScratchSpace` *scratch*.
+
+    If *in_place* is true, *y* is overwritten with the result if that is
+    safe. Otherwise, the result is newly allocated.
+
+    :returns: the result, or *None* if *y* and the vectors are not
+      :class:`numpy.ndarray` instances (or object arrays of them) of
+      matching shapes.
+    """
+    all_vecs = [y]
+    for coefficients, vectors in terms:
+        all_vecs.extend(vectors)
+
+    leaves = get_matching_leaves(all_vecs)
+    if leaves is None:
+        return None
+
+    y_leaves = leaves[0]
+    term_leaves = []
+    i = 1
+    for coefficients, vectors in terms:
+        term_leaves.append(leaves[i:i+len(vectors)])
+        i += len(vectors)
+
+    acc_dtypes = [
+            numpy.result_type(*[
+                numpy.result_type(coefficients[0], tl[0][leaf_nr])
+                for (coefficients, vectors), tl in zip(terms, term_leaves)])
+            for leaf_nr in range(len(y_leaves))]
+
+    if in_place:
+        in_place = all(
+                numpy.result_type(y_leaf, acc_dtype) == y_leaf.dtype
+                for y_leaf, acc_dtype in zip(y_leaves, acc_dtypes))
+    if in_place:
+        # the right-hand side may have returned (parts of) its argument
+        vec_ids = set(id(leaf) for vec_leaves in leaves[1:]
+                for leaf in vec_leaves)
+        in_place = not any(id(leaf) in vec_ids for leaf in y_leaves)
+
+    new_leaves = []
+    for i, y_leaf in enumerate(y_leaves):
+        shape, dtype = y_leaf.shape, acc_dtypes[i]
+        acc = scratch.get(("acc", i), shape, dtype)
+        tmp = scratch.get(("tmp", i), shape, dtype)
+
+        for term_nr, ((coefficients, vectors), tl) in enumerate(
+                zip(terms, term_leaves)):
+            leaves_i = [vec_leaves[i] for vec_leaves in tl]
+            if term_nr == 0:
+                linear_comb_into(acc, tmp, coefficients, leaves_i)
+            else:
+                term_acc = scratch.get(("term_acc", i), shape, dtype)
+                linear_comb_into(term_acc, tmp, coefficients, leaves_i)
+                numpy.add(acc, term_acc, out=acc)
+
+        numpy.multiply(dt, acc, out=acc)
+
+        if in_place:
+            numpy.add(y_leaf, acc, out=y_leaf)
+        else:
+            new_leaves.append(y_leaf + acc)
+
+    if in_place:
+        return y
+    else:
+        return rebuild_state(y, iter(new_leaves))
+
+
+
+
 # time steppers ---------------------------------------------------------------
 class AdamsBashforthTimeStepper(TimeStepper):
+    """
+    :param update_in_place: If *True*, a state *y* that was returned by
+      the previous call is overwritten with the new state. No arrays are
+      then allocated per step, apart from the ones returned by the
+      right-hand side. Callers must not hold on to earlier states.
+
+    If the states are :class:`numpy.ndarray` instances or object arrays
+    of them, the update uses in-place arithmetic on preallocated scratch
+    arrays. Its result is bit-for-bit the same as that of the
+    straightforward formula, which is used for all other types of state.
+    """
+
     dt_fudge_factor = 0.95
 
-    def __init__(self, order, startup_stepper=None, dtype=numpy.float64, rcon=None):
-        self.f_history = []
+    def __init__(self, order, startup_stepper=None, dtype=numpy.float64, rcon=None,
+            update_in_place=False):
+        self.f_history = RingHistory(order)
+        self.update_in_place = update_in_place
+        self.last_result = None
+        self.scratch = ScratchSpace()
 
         from pytools import match_precision
         self.dtype = numpy.dtype(dtype)
@@ -168,10 +388,25 @@ class AdamsBashforthTimeStepper(TimeStepper):
     def __getinitargs__(self):
         return (self.order, self.startup_stepper)
 
+    def combine(self, y, dt):
+        """Return ``y + dt * sum(coeff * f)`` over the history."""
+        result = ab_update(self.scratch, y, dt,
+                [(self.coefficients, list(self.f_history))],
+                in_place=self.update_in_place and y is self.last_result)
+
+        if result is None:
+            from operator import add
+            result = y + dt * reduce(add,
+                    (coeff * f
+                        for coeff, f in
+                        zip(self.coefficients, self.f_history)))
+
+        return result
+
     def __call__(self, y, t, dt, rhs):
         if len(self.f_history) == 0:
             # insert IC
-            self.f_history.append(rhs(t, y))
+            self.f_history.push(rhs(t, y))
 
             from hedge.tools import count_dofs
             self.dof_count = count_dofs(self.f_history[0])
@@ -183,19 +418,13 @@ class AdamsBashforthTimeStepper(TimeStepper):
                 del self.startup_stepper
 
         else:
-            from operator import add
-
             sub_timer = self.timer.start_sub_timer()
             assert len(self.coefficients) == len(self.f_history)
-            ynew = y + dt * reduce(add,
-                    (coeff * f 
-                        for coeff, f in 
-                        zip(self.coefficients, self.f_history)))
-
-            self.f_history.pop()
+            ynew = self.combine(y, dt)
+            self.last_result = ynew
             sub_timer.stop().submit()
 
         self.flop_counter.add((2+2*len(self.coefficients)-1)*self.dof_count)
 
-        self.f_history.insert(0, rhs(t+dt, ynew))
+        self.f_history.push(rhs(t+dt, ynew))
         return ynew
@@ -231,3 +231,127 @@ class KennedyCarpenterIMEXARK4(KennedyCarpenterIMEXRungeKuttaBase):
             == len(low_order_coeffs)
             == len(high_order_coeffs)
             == len(c))
+
+
+
+
+class NewtonKrylovImplicitSolver(object):
+    r"""Solves the implicit stage equations of
+    :class:`KennedyCarpenterIMEXRungeKuttaBase` by Jacobian-free
+    Newton-GMRES, so that an instance can be passed as *rhs_impl*.
+
+    :arg rhs: the implicit part *f* of the right-hand side, with a signature
+      of *(t, y)*. This may be a bound
+      :class:`hedge.models.diffusion.DiffusionOperator`, or, for the
+      viscous part of :class:`hedge.models.gas_dynamics.GasDynamicsOperator`,
+      ``lambda t, q: viscous_rhs(t, q)[0]`` with ``viscous_rhs`` obtained
+      from ``bind(discr, viscosity_only=True)``.
+    :arg make_precon: if given, called as ``make_precon(alpha)`` to
+      obtain a preconditioner, i.e. an approximate inverse of
+      :math:`\mathrm{Id} - \alpha J_f`. Preconditioners are cached per
+      value of *alpha*, which is constant for a fixed time step.
+    :arg newton_tol: relative tolerance for the nonlinear residual.
+    :arg newton_abs_tol: absolute tolerance for the nonlinear residual,
+      for problems whose right-hand side may vanish.
+    :arg krylov_tol: relative tolerance of each GMRES solve.
+    :arg dot: passed on to :func:`hedge.iterative.gmres`, and used for
+      the Newton residual norm. Pass ``discr.nodewise_dot_product`` in
+      distributed runs.
+
+    Each solve starts from the solution of the previous one, i.e. from
+    the previous stage's *k*. Jacobian-vector products are approximated by
+    forward differences of *rhs*.
+    """
+
+    def __init__(self, rhs, make_precon=None,
+            newton_tol=1e-8, newton_abs_tol=0, max_newton_iterations=20,
+            krylov_tol=1e-4, gmres_restart=30, max_gmres_iterations=None,
+            dot=None):
+        self.rhs = rhs
+        self.make_precon = make_precon
+        self.precon_cache = {}
+
+        self.newton_tol = newton_tol
+        self.newton_abs_tol = newton_abs_tol
+        self.max_newton_iterations = max_newton_iterations
+        self.krylov_tol = krylov_tol
+        self.gmres_restart = gmres_restart
+        self.max_gmres_iterations = max_gmres_iterations
+
+        if dot is None:
+            from hedge.iterative import _default_dot
+            dot = _default_dot
+        self.dot = dot
+
+        self.last_k = None
+
+        self.newton_iterations = 0
+        self.krylov_iterations = 0
+        self.rhs_evaluations = 0
+
+    def norm(self, v):
+        return numpy.sqrt(abs(self.dot(v, v.conj())))
+
+    def get_precon(self, alpha):
+        if self.make_precon is None:
+            return None
+
+        try:
+            return self.precon_cache[alpha]
+        except KeyError:
+            result = self.precon_cache[alpha] = self.make_precon(alpha)
+            return result
+
+    def __call__(self, t, y0, alpha):
+        if alpha == 0:
+            self.rhs_evaluations += 1
+            return self.rhs(t, y0)
+
+        if self.last_k is not None:
+            k = self.last_k
+        else:
+            self.rhs_evaluations += 1
+            k = self.rhs(t, y0)
+
+        from hedge.iterative import gmres, ConvergenceError
+
+        # square root of the machine epsilon
+        fd_base_eps = 1.5e-8
+
+        for it in range(self.max_newton_iterations):
+            y = y0 + alpha*k
+            f_y = self.rhs(t, y)
+            self.rhs_evaluations += 1
+
+            residual = k - f_y
+            residual_norm = self.norm(residual)
+            if residual_norm <= (self.newton_abs_tol
+                    + self.newton_tol*self.norm(f_y)):
+                self.last_k = k
+                return k
+
+            y_norm = self.norm(y)
+
+            def jacobian_vector_product(v):
+                v_norm = self.norm(v)
+                if v_norm == 0:
+                    return v
+
+                eps = fd_base_eps*(1+y_norm)/v_norm
+                self.rhs_evaluations += 1
+                return v - alpha/eps*(self.rhs(t, y + eps*v) - f_y)
+
+            dk, gmres_its = gmres(jacobian_vector_product, -residual,
+                    precon=self.get_precon(alpha),
+                    tol=self.krylov_tol,
+                    restart=self.gmres_restart,
+                    max_iterations=self.max_gmres_iterations,
+                    dot=self.dot)
+
+            self.newton_iterations += 1
+            self.krylov_iterations += gmres_its
+
+            k = k + dk
+
+        raise ConvergenceError("Newton iteration for implicit stage "
+                "failed to converge")
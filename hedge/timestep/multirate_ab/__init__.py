@@ -30,12 +30,13 @@ THE SOFTWARE.
 
 
 import numpy
-from pytools import memoize, memoize_method
+from pytools import memoize_method
 from hedge.timestep.base import TimeStepper
 from hedge.timestep.runge_kutta import LSRK4TimeStepper
 from hedge.timestep.ab import \
         make_generic_ab_coefficients, \
-        make_ab_coefficients
+        make_ab_coefficients, \
+        RingHistory, ScratchSpace, ab_update
 from hedge.timestep.multirate_ab.methods import \
         HIST_NAMES
 from hedge.timestep.multirate_ab.processors import \
@@ -99,7 +100,9 @@ class TwoRateAdamsBashforthTimeStepper(TimeStepper):
         self.max_order = max(self.orders.values())
 
         # histories of rhs evaluations
-        self.histories = dict((hn, []) for hn in HIST_NAMES)
+        self.histories = dict(
+                (hn, RingHistory(self.orders[hn])) for hn in HIST_NAMES)
+        self.scratch = ScratchSpace()
 
         if startup_stepper is not None:
             self.startup_stepper = startup_stepper
@@ -131,8 +134,8 @@ class TwoRateAdamsBashforthTimeStepper(TimeStepper):
 
                 hist = hist[:self.orders[hn]]
 
-                self.histories[hn] = [
-                        hist_entry[i] for hist_entry in hist]
+                self.histories[hn] = RingHistory(self.orders[hn], [
+                        hist_entry[i] for hist_entry in hist])
 
                 assert len(self.histories[hn]) == self.orders[hn]
 
@@ -251,18 +254,20 @@ class _MRABEvaluator(MRABProcessor):
                     self.var_time_level[insn.result_name]
 
         hists = self.stepper.histories
-        self_history = hists[self_hn][:]
-        cross_history = hists[cross_hn][:]
-        if False:
-            my_integrated_y = memoize(
-                    lambda: my_y + self.stepper.large_dt * (
-                    _linear_comb(self_coefficients, self_history)
-                    + _linear_comb(cross_coefficients, cross_history)))
-        else:
+        self_history = list(hists[self_hn])
+        cross_history = list(hists[cross_hn])
+
+        # not in place: earlier results stay in self.context
+        my_new_y = ab_update(self.stepper.scratch, my_y,
+                self.stepper.large_dt, [
+                    (self_coefficients, self_history),
+                    (cross_coefficients, cross_history)])
+        if my_new_y is None:
             my_new_y = my_y + self.stepper.large_dt * (
                     _linear_comb(self_coefficients, self_history)
                     + _linear_comb(cross_coefficients, cross_history))
-            my_integrated_y = lambda: my_new_y
+
+        my_integrated_y = lambda: my_new_y
 
         self.context[insn.result_name] = my_integrated_y
         self.var_time_level[insn.result_name] = end_time_level
@@ -282,9 +287,7 @@ class _MRABEvaluator(MRABProcessor):
 
         rhs = self.rhss[HIST_NAMES.index(insn.which)]
 
-        hist = self.stepper.histories[insn.which]
-        hist.pop()
-        hist.insert(0,
+        self.stepper.histories[insn.which].push(
                 rhs(t,
                     self.context[insn.fast_arg],
                     self.context[insn.slow_arg]))
@@ -0,0 +1,668 @@
+# -*- coding: utf8 -*-
+
+"""Element-wise local time stepping by N-rate Adams-Bashforth."""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2007 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+
+
+import numpy
+from pytools import Record, memoize_method
+from pytools.log import LogQuantity
+from hedge.timestep.base import TimeStepper
+from hedge.timestep.ab import make_generic_ab_coefficients
+from hedge.timestep.multirate_ab import _linear_comb
+
+
+
+
+# {{{ rate classes ------------------------------------------------------------
+
+class RateClass(Record):
+    """A set of elements that is time-stepped with the same step size.
+
+    .. attribute:: index
+
+      Class number. Class *k* is stepped with ``dt/2**k``, where *dt* is
+      the step size of the slowest class 0.
+
+    .. attribute:: element_numbers
+
+      An array of the element numbers belonging to this class.
+
+    .. attribute:: dof_indices
+
+      Index into a volume vector that selects this class' degrees of
+      freedom. A :class:`slice` if the elements of this class are
+      numbered contiguously, an array of indices otherwise.
+
+    .. attribute:: element_ranges
+
+      A list with one :class:`hedge._internal.UniformElementRanges` per
+      element group, covering just this class, or *None* if the class is
+      not contiguous. See :meth:`RateClassification.get_reorder_oldnumbers`.
+
+    .. attribute:: min_dt_factor
+
+      The smallest geometric time step factor among this class' elements.
+    """
+
+    @property
+    def element_count(self):
+        return len(self.element_numbers)
+
+
+
+
+class RateClassification(Record):
+    """
+    .. attribute:: classes
+
+      A list of :class:`RateClass` instances, slowest first.
+
+    .. attribute:: element_count
+    """
+
+    @property
+    def class_count(self):
+        return len(self.classes)
+
+    def get_reorder_oldnumbers(self):
+        """Return an element reordering suitable for
+        :meth:`hedge.mesh.Mesh.reordered` that numbers the elements of
+        each class contiguously. On a discretization built from the
+        reordered mesh, each class covers one range of elements, so that
+        the class' part of a volume vector is a view, and operators can be
+        restricted to :attr:`RateClass.element_ranges`.
+        """
+        return numpy.hstack([rc.element_numbers for rc in self.classes])
+
+    def is_contiguous(self):
+        return all(rc.element_ranges is not None for rc in self.classes)
+
+    def get_dt_multiplier(self):
+        """Return the factor by which the time step of the slowest class may
+        exceed the global stable time step (as given by
+        :meth:`hedge.discretization.Discretization.dt_factor`).
+        """
+        global_min = min(rc.min_dt_factor for rc in self.classes)
+        return min(2**rc.index * rc.min_dt_factor
+                for rc in self.classes) / global_min
+
+    def get_work_estimate(self):
+        """Return the ratio of element right-hand side evaluations done by
+        global time stepping with the step size of the fastest class to
+        that done by local time stepping.
+        """
+        fastest = self.class_count - 1
+        return (self.element_count * 2**fastest
+                / sum(rc.element_count * 2**rc.index
+                    for rc in self.classes))
+
+    def __str__(self):
+        lines = ["class  dt ratio  elements"]
+        for rc in self.classes:
+            lines.append("%5d  %8d  %8d" % (
+                rc.index, 2**rc.index, rc.element_count))
+        lines.append("estimated speedup over global stepping: %.2f"
+                % self.get_work_estimate())
+        return "\n".join(lines)
+
+
+
+
+def bin_elements_by_rate(discr, max_class_count=None,
+        reference_dt_factor=None):
+    """Sort the elements of *discr* into power-of-two rate classes by their
+    :meth:`hedge.discretization.Discretization.element_dt_geometric_factors`.
+
+    An element whose geometric factor is *f* ends up in class
+    ``ceil(log2(f_ref/f))``, where *f_ref* is *reference_dt_factor* or,
+    by default, the largest geometric factor in *discr*. Empty classes are
+    kept so that class *k* always steps with ``dt/2**k``. Elements that
+    would end up beyond *max_class_count* are put into the fastest class.
+
+    In a distributed run, pass the same *reference_dt_factor* on all ranks.
+
+    :returns: a :class:`RateClassification`.
+    """
+    factors = discr.element_dt_geometric_factors()
+    if reference_dt_factor is None:
+        reference_dt_factor = numpy.max(factors)
+
+    el_classes = numpy.ceil(
+            numpy.log2(reference_dt_factor/factors)-1e-10).astype(numpy.intp)
+    el_classes[el_classes < 0] = 0
+
+    if max_class_count is not None:
+        el_classes[el_classes >= max_class_count] = max_class_count-1
+
+    class_count = numpy.max(el_classes)+1
+
+    # element number -> (element group index, position within group)
+    el_group_positions = {}
+    el_dof_slices = [None]*len(factors)
+    for i_eg, eg in enumerate(discr.element_groups):
+        for i_el, el in enumerate(eg.members):
+            el_group_positions[el.id] = i_eg, i_el
+            el_dof_slices[el.id] = eg.ranges[i_el]
+
+    from hedge._internal import UniformElementRanges
+
+    def get_element_ranges(el_nrs):
+        """Return one :class:`UniformElementRanges` per element group that
+        covers the elements *el_nrs*, or *None* if they are not
+        contiguous within each group.
+        """
+        group_positions = [[] for eg in discr.element_groups]
+        for el_nr in el_nrs:
+            i_eg, i_el = el_group_positions[el_nr]
+            group_positions[i_eg].append(i_el)
+
+        result = []
+        for eg, positions in zip(discr.element_groups, group_positions):
+            el_size = eg.ranges.el_size
+            positions = numpy.array(sorted(positions), dtype=numpy.intp)
+            if not len(positions):
+                result.append(UniformElementRanges(eg.ranges.start, el_size, 0))
+            elif (positions == numpy.arange(
+                    positions[0], positions[0]+len(positions))).all():
+                result.append(UniformElementRanges(
+                    eg.ranges.start + positions[0]*el_size,
+                    el_size, len(positions)))
+            else:
+                return None
+
+        return result
+
+    classes = []
+    for i_class in range(class_count):
+        el_nrs, = numpy.nonzero(el_classes == i_class)
+
+        if len(el_nrs):
+            dof_indices = numpy.hstack([
+                numpy.arange(el_dof_slices[el_nr].start,
+                    el_dof_slices[el_nr].stop)
+                for el_nr in el_nrs])
+            dof_indices.sort()
+
+            if (dof_indices == numpy.arange(
+                    dof_indices[0], dof_indices[0]+len(dof_indices))).all():
+                dof_indices = slice(dof_indices[0],
+                        dof_indices[0]+len(dof_indices))
+        else:
+            dof_indices = slice(0, 0)
+
+        if len(el_nrs):
+            min_dt_factor = numpy.min(factors[el_nrs])
+        else:
+            min_dt_factor = reference_dt_factor/2**i_class
+
+        classes.append(RateClass(
+            index=i_class,
+            element_numbers=el_nrs,
+            dof_indices=dof_indices,
+            element_ranges=get_element_ranges(el_nrs),
+            min_dt_factor=min_dt_factor))
+
+    return RateClassification(
+            classes=classes,
+            element_count=len(factors))
+
+# }}}
+
+# {{{ vector helpers ----------------------------------------------------------
+
+def _restrict(vec, indices):
+    from hedge.tools import is_obj_array, make_obj_array
+    if is_obj_array(vec):
+        return make_obj_array([v[indices].copy() for v in vec])
+    else:
+        return vec[indices].copy()
+
+
+
+
+def _insert(target, indices, value):
+    from hedge.tools import is_obj_array
+    if is_obj_array(target):
+        for target_i, value_i in zip(target, value):
+            target_i[indices] = value_i
+    else:
+        target[indices] = value
+
+
+
+
+def _copy(vec):
+    from hedge.tools import is_obj_array, make_obj_array
+    if is_obj_array(vec):
+        return make_obj_array([v.copy() for v in vec])
+    else:
+        return vec.copy()
+
+
+
+
+def _zeros_like(vec):
+    from hedge.tools import is_obj_array, make_obj_array
+    if is_obj_array(vec):
+        return make_obj_array([numpy.zeros_like(v) for v in vec])
+    else:
+        return numpy.zeros_like(vec)
+
+# }}}
+
+# {{{ evaluation restricted to rate classes -----------------------------------
+
+class TAG_LTS_CUT(object):
+    """A boundary tag for the faces where a :class:`ClassRestrictedRHS`
+    cuts the mesh."""
+    pass
+
+
+
+
+class _Subdomain(Record):
+    pass
+
+
+
+
+class ClassRestrictedRHS(object):
+    """Evaluates an operator on the elements of some rate classes only, for
+    use as the *rhs* of a :class:`LocalAdamsBashforthTimeStepper` with
+    *rhs_accepts_classes* set.
+
+    For each set of due classes, a discretization of the elements of
+    these classes and of *halo_depth* layers of face neighbors around
+    them is built once, using :func:`hedge.partition.partition_mesh`, and
+    the operator is bound to it. Only the outermost layer touches the cut,
+    whose faces are tagged :class:`TAG_LTS_CUT` and are not part of
+    ``TAG_ALL``.
+
+    The values on the due elements are those of the full operator as long
+    as the operator's right-hand side on an element depends only on
+    elements at most *halo_depth* faces away. One layer suffices for
+    first-order operators, whose fluxes couple face neighbors only.
+    Operators with second derivatives, such as
+    :class:`hedge.models.diffusion.DiffusionOperator`, viscous
+    :class:`hedge.models.gas_dynamics.GasDynamicsOperator` instances or
+    operators with artificial viscosity, lift the fluxes of an auxiliary
+    gradient, and so need *halo_depth* = 2.
+
+    :arg bind: a function that takes a discretization and returns a
+      right-hand side *rhs(t, y)* on it, such as an operator's ``bind``.
+    :arg halo_depth: the number of layers of face neighbors by which the
+      due elements are extended, see above.
+    :arg make_discretization: a function that takes a mesh and returns a
+      discretization of it. By default, a discretization of the same
+      class, local discretization, quadrature degrees and scalar type as
+      *discr* is made.
+    """
+
+    def __init__(self, discr, classification, bind,
+            make_discretization=None, halo_depth=1):
+        if any(axis_per is not None for axis_per in discr.mesh.periodicity):
+            raise NotImplementedError("restricted evaluation "
+                    "on periodic meshes")
+        if halo_depth < 1:
+            raise ValueError("halo_depth must be at least 1")
+
+        self.halo_depth = halo_depth
+
+        self.discr = discr
+        self.classification = classification
+        self.bind = bind
+
+        if make_discretization is None:
+            def make_discretization(mesh):
+                from pytools import single_valued
+                return discr.__class__(mesh,
+                        single_valued(eg.local_discretization
+                            for eg in discr.element_groups),
+                        quad_min_degrees=discr.quad_min_degrees,
+                        debug=discr.debug,
+                        default_scalar_type=discr.default_scalar_type)
+
+        self.make_discretization = make_discretization
+        self.full_rhs = bind(discr)
+
+    @memoize_method
+    def get_subdomain(self, class_indices):
+        """Return a :class:`_Subdomain` for the rate classes numbered
+        *class_indices*, given as a sorted tuple.
+        """
+        discr = self.discr
+        mesh = discr.mesh
+
+        is_due = numpy.zeros(len(mesh.elements), dtype=numpy.bool)
+        for i in class_indices:
+            is_due[self.classification.classes[i].element_numbers] = True
+
+        in_subdomain = is_due
+        for i in range(self.halo_depth):
+            grown = in_subdomain.copy()
+            for (el1, face1), (el2, face2) in mesh.interfaces:
+                if in_subdomain[el1.id]:
+                    grown[el2.id] = True
+                if in_subdomain[el2.id]:
+                    grown[el1.id] = True
+            in_subdomain = grown
+
+        from hedge.partition import partition_mesh
+        for part_data in partition_mesh(mesh,
+                numpy.where(in_subdomain, 0, 1).astype(numpy.int32),
+                lambda part: TAG_LTS_CUT):
+            if part_data.part_nr == 0:
+                break
+
+        sub_discr = self.make_discretization(part_data.mesh)
+
+        gather_indices = numpy.empty(len(sub_discr), dtype=numpy.intp)
+        due_sub_indices = []
+        due_indices = []
+        for g_el, l_el in part_data.global2local_elements.iteritems():
+            g_slice = discr.find_el_range(g_el)
+            l_slice = sub_discr.find_el_range(l_el)
+            g_indices = numpy.arange(g_slice.start, g_slice.stop)
+
+            gather_indices[l_slice] = g_indices
+            if is_due[g_el]:
+                due_sub_indices.append(
+                        numpy.arange(l_slice.start, l_slice.stop))
+                due_indices.append(g_indices)
+
+        return _Subdomain(
+                discr=sub_discr,
+                rhs=self.bind(sub_discr),
+                gather_indices=gather_indices,
+                due_sub_indices=numpy.hstack(due_sub_indices),
+                due_indices=numpy.hstack(due_indices),
+                element_count=len(part_data.global2local_elements))
+
+    def _get_class_indices(self, classes):
+        return tuple(sorted(rc.index for rc in classes))
+
+    def get_element_count(self, classes):
+        """Return the number of elements on which the operator is evaluated
+        to obtain the right-hand side of *classes*.
+        """
+        class_indices = self._get_class_indices(classes)
+        if len(class_indices) == self.classification.class_count:
+            return self.classification.element_count
+        else:
+            return self.get_subdomain(class_indices).element_count
+
+    def __call__(self, t, y, classes):
+        class_indices = self._get_class_indices(classes)
+        if len(class_indices) == self.classification.class_count:
+            return self.full_rhs(t, y)
+
+        subdomain = self.get_subdomain(class_indices)
+        sub_result = subdomain.rhs(t, _restrict(y, subdomain.gather_indices))
+
+        result = _zeros_like(y)
+        _insert(result, subdomain.due_indices,
+                _restrict(sub_result, subdomain.due_sub_indices))
+        return result
+
+# }}}
+
+# {{{ time stepper ------------------------------------------------------------
+
+class LocalAdamsBashforthTimeStepper(TimeStepper):
+    """Timesteps each rate class of a :class:`RateClassification` with its
+    own Adams-Bashforth step size, *dt* for class 0 down to
+    ``dt/2**(class_count-1)`` for the fastest class.
+
+    The classes are advanced fastest-first in the sense of Gear and Wells
+    [1]. Whenever a class needs the state of a slower class at an
+    intermediate time, that state is extrapolated from the slower class'
+    own right-hand side history. Each class' history is kept at its own
+    step size and is managed automatically.
+
+    By default, *rhs* is called as ``rhs(t, y)``. If *rhs_accepts_classes*
+    is set, it is called as ``rhs(t, y, classes)``, where *classes* is the
+    list of :class:`RateClass` instances that are due for a new right-hand
+    side. It only needs to return correct values for the degrees of freedom
+    of these classes. :class:`ClassRestrictedRHS` evaluates an operator
+    that way. Only then is the work reduction estimated by
+    :meth:`RateClassification.get_work_estimate` (approximately) realized.
+    If *rhs* has a ``get_element_count(classes)`` method, it is used to
+    count the elements actually evaluated.
+
+    [1] C.W. Gear and D.R. Wells, "Multirate linear multistep methods," BIT
+    Numerical Mathematics,  vol. 24, Dec. 1984, pg. 484-502.
+    """
+
+    def __init__(self, order, classification, startup_stepper=None,
+            rhs_accepts_classes=False, dtype=numpy.float64):
+        self.order = order
+        self.classification = classification
+        self.rhs_accepts_classes = rhs_accepts_classes
+
+        self.substep_count = 2**(classification.class_count-1)
+
+        # number of finest substeps per step of each class
+        self.class_strides = [
+                2**(classification.class_count-1-rc.index)
+                for rc in classification.classes]
+
+        if startup_stepper is not None:
+            self.startup_stepper = startup_stepper
+        else:
+            from hedge.timestep.runge_kutta import LSRK4TimeStepper
+            self.startup_stepper = LSRK4TimeStepper(dtype)
+
+        self.startup_history = []
+
+        # per-class histories, newest first
+        self.histories = None
+        self.last_dt = None
+
+        from pytools.log import IntervalTimer, EventCounter
+        self.timer = IntervalTimer(
+                "t_lts", "Time spent doing algebra in local time stepping")
+        self.element_rhs_counter = EventCounter(
+                "n_el_rhs_lts",
+                "Element right-hand sides evaluated by local time stepping")
+        self.global_element_rhs_counter = EventCounter(
+                "n_el_rhs_global",
+                "Element right-hand sides global time stepping would "
+                "have evaluated")
+
+        self.element_rhs_count = 0
+        self.global_element_rhs_count = 0
+
+    def get_stability_relevant_init_args(self):
+        return (self.order,)
+
+    def add_instrumentation(self, logmgr):
+        logmgr.add_quantity(self.timer)
+        logmgr.add_quantity(self.element_rhs_counter)
+        logmgr.add_quantity(self.global_element_rhs_counter)
+        logmgr.add_quantity(LocalTimeSteppingSpeedup(self))
+
+    def get_speedup(self):
+        """Return the ratio of element right-hand side evaluations global
+        time stepping (at the step size of the fastest class) would have
+        done to those actually done, not counting startup.
+        """
+        if not self.element_rhs_count:
+            return None
+        return self.global_element_rhs_count / self.element_rhs_count
+
+    @memoize_method
+    def get_coefficients(self, end_fraction):
+        """Return coefficients that integrate a class' history from its
+        newest entry to *end_fraction* of that class' step.
+        """
+        return make_generic_ab_coefficients(
+                numpy.arange(0, -self.order, -1, dtype=numpy.float64),
+                0, end_fraction)
+
+    def _evaluate_rhs(self, rhs, t, y, classes):
+        if self.rhs_accepts_classes:
+            result = rhs(t, y, classes)
+            try:
+                get_element_count = rhs.get_element_count
+            except AttributeError:
+                work = sum(rc.element_count for rc in classes)
+            else:
+                work = get_element_count(classes)
+        else:
+            work = self.classification.element_count
+            result = rhs(t, y)
+
+        return result, work
+
+    def _finish_startup(self):
+        self.histories = []
+        for rc, stride in zip(
+                self.classification.classes, self.class_strides):
+            hist = self.startup_history[::stride][:self.order]
+            assert len(hist) == self.order
+            self.histories.append([
+                _restrict(f, rc.dof_indices) for f in hist])
+
+        # here's some memory we won't need any more
+        self.startup_stepper = None
+        del self.startup_history
+
+    def __call__(self, y, t, dt, rhs):
+        if self.last_dt is not None:
+            assert abs(dt - self.last_dt) <= 1e-12*abs(dt), \
+                    "local time stepping requires a constant time step"
+        self.last_dt = dt
+
+        small_dt = dt/self.substep_count
+
+        if self.histories is None:
+            def full_rhs(t, y):
+                if self.rhs_accepts_classes:
+                    return rhs(t, y, self.classification.classes)
+                else:
+                    return rhs(t, y)
+
+            if not self.startup_history:
+                self.startup_history.append(full_rhs(t, y))
+
+            if self.order == 1:
+                self._finish_startup()
+            else:
+                for i in range(self.substep_count):
+                    y = self.startup_stepper(y, t+i*small_dt, small_dt,
+                            full_rhs)
+                    self.startup_history.insert(0,
+                            full_rhs(t+(i+1)*small_dt, y))
+
+                if len(self.startup_history) == \
+                        (self.order-1)*self.substep_count + 1:
+                    self._finish_startup()
+
+                return y
+
+        return self.run_lts(y, t, dt, rhs)
+
+    def run_lts(self, y, t, dt, rhs):
+        classes = self.classification.classes
+        small_dt = dt/self.substep_count
+
+        # state of each class at the level of its newest history entry
+        class_y = [_restrict(y, rc.dof_indices) for rc in classes]
+        class_level = [0 for rc in classes]
+
+        y_work = _copy(y)
+
+        for level in range(1, self.substep_count+1):
+            due = [i for i, stride in enumerate(self.class_strides)
+                    if level % stride == 0]
+
+            sub_timer = self.timer.start_sub_timer()
+
+            step_coeffs = self.get_coefficients(1)
+            for i in due:
+                class_y[i] = class_y[i] + dt/2**i * _linear_comb(
+                        step_coeffs, self.histories[i])
+                class_level[i] = level
+
+            for i, rc in enumerate(classes):
+                if i in due:
+                    y_i = class_y[i]
+                else:
+                    stride = self.class_strides[i]
+                    y_i = class_y[i] + dt/2**i * _linear_comb(
+                            self.get_coefficients(
+                                (level-class_level[i])/stride),
+                            self.histories[i])
+
+                _insert(y_work, rc.dof_indices, y_i)
+
+            sub_timer.stop().submit()
+
+            due_classes = [classes[i] for i in due]
+            f, work = self._evaluate_rhs(
+                    rhs, t+level*small_dt, y_work, due_classes)
+
+            self.element_rhs_count += work
+            self.element_rhs_counter.add(work)
+
+            for i in due:
+                hist = self.histories[i]
+                hist.pop()
+                hist.insert(0, _restrict(f, classes[i].dof_indices))
+
+        global_work = self.substep_count*self.classification.element_count
+        self.global_element_rhs_count += global_work
+        self.global_element_rhs_counter.add(global_work)
+
+        result = _copy(y_work)
+        for rc, y_i in zip(classes, class_y):
+            _insert(result, rc.dof_indices, y_i)
+
+        return result
+
+
+
+
+class LocalTimeSteppingSpeedup(LogQuantity):
+    """Logs the ratio of element right-hand side evaluations that global
+    time stepping would have done to those done by a
+    :class:`LocalAdamsBashforthTimeStepper`.
+    """
+
+    def __init__(self, stepper, name="lts_speedup"):
+        LogQuantity.__init__(self, name, "1",
+                "Work saved by local over global time stepping")
+        self.stepper = stepper
+
+    def __call__(self):
+        return self.stepper.get_speedup()
+
+# }}}
+
+# vim: foldmethod=marker
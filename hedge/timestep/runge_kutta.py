@@ -119,7 +119,8 @@ class LSRK4TimeStepper(TimeStepper):
             this_rhs = rhs(t + c*dt, y)
 
             sub_timer = self.timer.start_sub_timer()
-            self.residual = lc((a, self.residual), (dt, this_rhs))
+            self.residual = lc((a, self.residual), (dt, this_rhs),
+                    out=self.residual)
             del this_rhs
             y = lc((1, y), (b, self.residual))
             sub_timer.stop().submit()
@@ -145,9 +146,386 @@ class RK4TimeStepper(LSRK4TimeStepper):
 
 
 
+# {{{ low-storage SSP RK ------------------------------------------------------
+class LowStorageSSPTimeStepperBase(TimeStepper):
+    """Base class for strong-stability-preserving Runge-Kutta methods that
+    only keep a fixed number of state-sized registers. These are allocated
+    on the first step and then updated in place by fused linear
+    combinations.
+
+    :param limiter: applied to each stage value and to the result.
+    :param update_in_place: If *True*, a state *y* that was returned by
+      the previous call is overwritten with the new state. Callers must
+      then not hold on to earlier states.
+
+    *ssp_coefficient* is the factor by which the step size of the method
+    may exceed that of forward Euler while preserving strong stability.
+    """
+
+    dt_fudge_factor = 1
+
+    adaptive = False
+
+    def __init__(self, dtype=numpy.float64, rcon=None,
+            vector_primitive_factory=None, limiter=None,
+            update_in_place=False):
+        if vector_primitive_factory is None:
+            from hedge.vector_primitives import VectorPrimitiveFactory
+            self.vector_primitive_factory = VectorPrimitiveFactory()
+        else:
+            self.vector_primitive_factory = vector_primitive_factory
+
+        if limiter is None:
+            self.limiter = lambda x: x
+        else:
+            self.limiter = limiter
+
+        self.update_in_place = update_in_place
+
+        from pytools.log import IntervalTimer, EventCounter
+        timer_factory = IntervalTimer
+        if rcon is not None:
+            timer_factory = rcon.make_timer
+
+        self.timer = timer_factory(
+                "t_rk", "Time spent doing algebra in Runge-Kutta")
+        self.flop_counter = EventCounter(
+                "n_flops_rk", "Floating point operations performed in Runge-Kutta")
+
+        from pytools import match_precision
+        self.dtype = numpy.dtype(dtype)
+        self.scalar_dtype = match_precision(
+                numpy.dtype(numpy.float64), self.dtype)
+
+        self.linear_combiner_cache = {}
+        self.registers = [None]*self.register_count
+        self.last_result = None
+
+    def get_stability_relevant_init_args(self):
+        return ()
+
+    def add_instrumentation(self, logmgr):
+        logmgr.add_quantity(self.timer)
+        logmgr.add_quantity(self.flop_counter)
+
+    def combine(self, out, *args):
+        """Return the linear combination of the *(factor, vector)* pairs
+        *args*, stored in *out* unless that is *None*.
+        """
+        try:
+            lc = self.linear_combiner_cache[len(args)]
+        except KeyError:
+            lc = self.linear_combiner_cache[len(args)] = \
+                    self.vector_primitive_factory.make_linear_combiner(
+                            self.dtype, self.scalar_dtype, args[0][1],
+                            arg_count=len(args))
+
+        self.flop_count += len(args)*2 - 1
+
+        sub_timer = self.timer.start_sub_timer()
+        result = lc(*args, **{"out": out})
+        sub_timer.stop().submit()
+        return result
+
+    def __call__(self, y, t, dt, rhs):
+        self.flop_count = 0
+
+        if self.update_in_place and y is self.last_result:
+            out = y
+        else:
+            out = None
+
+        result = self.run_stages(y, t, dt, rhs, out)
+
+        try:
+            self.dof_count
+        except AttributeError:
+            from hedge.tools import count_dofs
+            self.dof_count = count_dofs(result)
+
+        self.flop_counter.add(self.flop_count*self.dof_count)
+        self.last_result = result
+        return result
+
+    def run_stages(self, y, t, dt, rhs, out):
+        """Return the state after one step of size *dt* from *y* at time
+        *t*, stored in *out* unless that is *None*. *y* must not be
+        modified otherwise.
+        """
+        raise NotImplementedError
+
+
+
+
+class LowStorageSSP54TimeStepper(LowStorageSSPTimeStepperBase):
+    """The optimal five-stage fourth-order SSP Runge-Kutta method of [1],
+    implemented with three registers, including the one holding the
+    initial state. The SSP coefficient is about 1.51.
+
+    [1] R.J. Spiteri and S.J. Ruuth, A new class of optimal high-order
+    strong-stability-preserving time discretization methods, SIAM J.
+    Numer. Anal. 40 (2002), pp. 469-491.
+    """
+
+    register_count = 2
+    ssp_coefficient = 1.508
+
+    # coefficients of the Shu-Osher form in [1]
+    _B1 = 0.391752226571890
+    _A2, _B2 = 0.444370493651235, 0.368410593050371
+    _A3, _B3 = 0.620101851488403, 0.251891774271694
+    _A4, _B4 = 0.178079954393132, 0.544974750228521
+    _FINAL_U2 = 0.517231671970585
+    _FINAL_U3, _FINAL_F3 = 0.096059710526147, 0.063692468666290
+    _FINAL_U4, _FINAL_F4 = 0.386708617503269, 0.226007483236906
+
+    # stage times, as fractions of the step
+    _C1 = _B1
+    _C2 = (1-_A2)*_C1 + _B2
+    _C3 = (1-_A3)*_C2 + _B3
+    _C4 = (1-_A4)*_C3 + _B4
+
+    def run_stages(self, y, t, dt, rhs, out):
+        lc = self.combine
+        lim = self.limiter
+        stage, acc = self.registers
+
+        stage = lim(lc(stage, (1, y), (self._B1*dt, rhs(t, y))))
+        stage = lim(lc(stage, (self._A2, y), (1-self._A2, stage),
+            (self._B2*dt, rhs(t+self._C1*dt, stage))))
+
+        # accumulate the parts of the result that use u2 and u3 as soon as
+        # they are available, so they need not be kept
+        acc = lc(acc, (self._FINAL_U2, stage))
+
+        stage = lim(lc(stage, (self._A3, y), (1-self._A3, stage),
+            (self._B3*dt, rhs(t+self._C2*dt, stage))))
+
+        this_rhs = rhs(t+self._C3*dt, stage)
+        acc = lc(acc, (1, acc), (self._FINAL_U3, stage),
+                (self._FINAL_F3*dt, this_rhs))
+        stage = lim(lc(stage, (self._A4, y), (1-self._A4, stage),
+            (self._B4*dt, this_rhs)))
+        del this_rhs
+
+        self.registers = [stage, acc]
+
+        return lim(lc(out, (1, acc), (self._FINAL_U4, stage),
+            (self._FINAL_F4*dt, rhs(t+self._C4*dt, stage))))
+
+
+
+
+class LowStorageSSP104TimeStepper(LowStorageSSPTimeStepperBase):
+    """The ten-stage fourth-order SSP Runge-Kutta method of [1], implemented
+    with two registers in addition to the one holding the initial state.
+    The SSP coefficient is 6, which makes the method 50% more efficient
+    than :class:`LowStorageSSP54TimeStepper` if strong stability limits
+    the step size.
+
+    [1] D.I. Ketcheson, Highly efficient strong stability preserving
+    Runge-Kutta methods with low-storage implementations, SIAM J. Sci.
+    Comput. 30 (2008), pp. 2113-2136.
+    """
+
+    register_count = 2
+    ssp_coefficient = 6
+
+    def run_stages(self, y, t, dt, rhs, out):
+        lc = self.combine
+        lim = self.limiter
+        q1, q2 = self.registers
+
+        q1 = lim(lc(q1, (1, y), (dt/6, rhs(t, y))))
+        for i in range(1, 5):
+            q1 = lim(lc(q1, (1, q1), (dt/6, rhs(t+i*dt/6, q1))))
+
+        q2 = lc(q2, (1/25, y), (9/25, q1))
+        q1 = lim(lc(q1, (15, q2), (-5, q1)))
+
+        for i in range(2, 6):
+            q1 = lim(lc(q1, (1, q1), (dt/6, rhs(t+i*dt/6, q1))))
+
+        self.registers = [q1, q2]
+
+        return lim(lc(out, (1, q2), (3/5, q1), (dt/10, rhs(t+dt, q1))))
+
+# }}}
+
+
+
+
 # {{{ Embedded Runge-Kutta schemes base class ---------------------------------
-def adapt_step_size(t, dt,
-        start_y, high_order_end_y, low_order_end_y, stepper, lc2, norm):
+
+# {{{ step size controllers
+
+class StepSizeController(object):
+    """Decides, from the relative error estimate of an embedded Runge-Kutta
+    step, whether to accept the step and which step size to try next.
+
+    :arg safety: factor applied to every step size proposed by the
+      controller.
+    :arg max_dt_growth: largest factor by which the step size may grow
+      after an accepted step.
+    :arg min_dt_shrinkage: smallest factor by which the step size may
+      shrink, after an accepted or a rejected step.
+    """
+
+    def __init__(self, safety=0.9, max_dt_growth=5, min_dt_shrinkage=0.1):
+        self.safety = safety
+        self.max_dt_growth = max_dt_growth
+        self.min_dt_shrinkage = min_dt_shrinkage
+
+    def reset(self):
+        """Forget all error history, e.g. when starting a new run."""
+        pass
+
+    def __call__(self, dt, rel_err, stepper):
+        """Return a tuple *(accept, next_dt)*. *rel_err* is the error
+        estimate of the step just taken with step size *dt*, relative to
+        the tolerance, and is *nan* if the step produced invalid values.
+        """
+        raise NotImplementedError
+
+
+
+
+class IntegralStepSizeController(StepSizeController):
+    """The classical controller, using only the error of the current step.
+    Accepted steps are scaled by the estimated error to the power
+    :math:`-1/p_{high}`, rejected steps by its power :math:`-1/p_{low}`.
+    """
+
+    def __call__(self, dt, rel_err, stepper):
+        if rel_err > 1 or numpy.isnan(rel_err):
+            if numpy.isnan(rel_err):
+                return False, self.min_dt_shrinkage*dt
+
+            return False, max(
+                    self.safety * dt * rel_err**(-1/stepper.low_order),
+                    self.min_dt_shrinkage * dt)
+        else:
+            return True, min(
+                    self.safety * dt * rel_err**(-1/stepper.high_order),
+                    self.max_dt_growth*dt)
+
+
+
+
+class PIDStepSizeController(StepSizeController):
+    r"""A controller that filters the error estimates of the current and
+    the two preceding accepted steps. An accepted step of size *dt* is
+    followed by one of size
+
+    .. math::
+
+        \text{safety} \cdot dt \cdot
+        \epsilon_n^{-\beta_1/k}
+        \epsilon_{n-1}^{-\beta_2/k}
+        \epsilon_{n-2}^{-\beta_3/k},
+
+    where :math:`\epsilon` are the relative error estimates and
+    :math:`k` is one more than the order of the embedded low-order
+    method. The result is kept within *min_dt_shrinkage* and
+    *max_dt_growth*. The step size never grows right after a rejected
+    step.
+
+    The defaults are Soderlind's H312PID filter. *(1, 0, 0)* gives back
+    an integral controller.
+
+    See G. Soderlind, Digital filters in adaptive time-stepping,
+    ACM Trans. Math. Softw. 29 (2003), 1-26.
+    """
+
+    def __init__(self, beta1=1/18, beta2=1/9, beta3=1/18, **kwargs):
+        StepSizeController.__init__(self, **kwargs)
+        self.betas = (beta1, beta2, beta3)
+        self.reset()
+
+    def reset(self):
+        self.error_history = [1, 1]
+        self.last_rejected = False
+
+    def __call__(self, dt, rel_err, stepper):
+        k = stepper.low_order + 1
+
+        if rel_err > 1 or numpy.isnan(rel_err):
+            self.last_rejected = True
+
+            if numpy.isnan(rel_err):
+                return False, self.min_dt_shrinkage*dt
+
+            return False, max(
+                    self.safety * dt * rel_err**(-1/k),
+                    self.min_dt_shrinkage * dt)
+
+        factor = self.safety
+        for beta, err in zip(self.betas, [rel_err] + self.error_history):
+            if beta:
+                factor *= err**(-beta/k)
+
+        factor = max(min(factor, self.max_dt_growth), self.min_dt_shrinkage)
+        if self.last_rejected:
+            factor = min(factor, 1)
+
+        self.error_history = [rel_err] + self.error_history[:-1]
+        self.last_rejected = False
+
+        return True, factor*dt
+
+
+
+
+class PIStepSizeController(PIDStepSizeController):
+    """A :class:`PIDStepSizeController` without the third term. The
+    defaults are Gustafsson's, with the estimated error of the current
+    step entering to the power :math:`-0.7/k` and that of the previous
+    accepted step to the power :math:`0.4/k`.
+
+    See K. Gustafsson, Control theoretic techniques for stepsize selection
+    in explicit Runge-Kutta methods, ACM Trans. Math. Softw. 17 (1991),
+    533-554.
+    """
+
+    def __init__(self, beta1=0.7, beta2=-0.4, **kwargs):
+        PIDStepSizeController.__init__(self, beta1, beta2, 0, **kwargs)
+
+# }}}
+
+
+
+
+class AdaptiveStepStatistics(object):
+    """Counts kept by an adaptive Runge-Kutta time stepper since its creation
+    or the last call to its :meth:`reset_statistics`.
+
+    .. attribute:: accepted_steps
+    .. attribute:: rejected_steps
+    .. attribute:: rhs_evaluations
+    .. attribute:: rhs_evaluations_saved
+
+        Number of right-hand side evaluations that were avoided by reusing
+        an existing one, either the last stage of the preceding step
+        (first-same-as-last) or the first stage of a rejected step.
+    """
+
+    def __init__(self):
+        self.accepted_steps = 0
+        self.rejected_steps = 0
+        self.rhs_evaluations = 0
+        self.rhs_evaluations_saved = 0
+
+    def __str__(self):
+        return ("%d steps accepted, %d rejected, "
+                "%d rhs evaluations, %d saved" % (
+                    self.accepted_steps, self.rejected_steps,
+                    self.rhs_evaluations, self.rhs_evaluations_saved))
+
+
+
+
+def estimate_relative_error(start_y, high_order_end_y, low_order_end_y,
+        stepper, lc2, norm):
     normalization = stepper.atol + stepper.rtol*max(
                 norm(low_order_end_y), norm(start_y))
 
@@ -161,39 +539,43 @@ def adapt_step_size(t, dt,
     if rel_err == 0:
        rel_err = 1e-14
 
-    if rel_err > 1 or numpy.isnan(rel_err):
-        # reject step
+    return rel_err
 
-        last_dt = dt
-        if not numpy.isnan(rel_err):
-            dt = max(
-                    0.9 * dt * rel_err**(-1/stepper.low_order),
-                    stepper.min_dt_shrinkage * dt)
-        else:
-            dt = stepper.min_dt_shrinkage*dt
 
-        if t + dt == t:
-            from hedge.timestep import TimeStepUnderflow
-            raise TimeStepUnderflow()
 
-        return False, dt, rel_err
+
+def adapt_step_size(t, dt,
+        start_y, high_order_end_y, low_order_end_y, stepper, lc2, norm):
+    rel_err = estimate_relative_error(
+            start_y, high_order_end_y, low_order_end_y, stepper, lc2, norm)
+
+    accept, next_dt = stepper.controller(dt, rel_err, stepper)
+
+    if accept:
+        stepper.statistics.accepted_steps += 1
     else:
-        # accept step
+        stepper.statistics.rejected_steps += 1
 
-        next_dt = min(
-                0.9 * dt * rel_err**(-1/stepper.high_order),
-                stepper.max_dt_growth*dt)
+        if t + next_dt == t:
+            from hedge.timestep import TimeStepUnderflow
+            raise TimeStepUnderflow()
 
-        return True, next_dt, rel_err
+    return accept, next_dt, rel_err
 
 
 
 
 class EmbeddedRungeKuttaTimeStepperBase(TimeStepper):
+    """
+    :arg controller: a :class:`StepSizeController` used when *atol* or
+      *rtol* is given. Defaults to an :class:`IntegralStepSizeController`
+      with *max_dt_growth* and *min_dt_shrinkage*.
+    """
+
     def __init__(self, use_high_order=True, dtype=numpy.float64, rcon=None,
             vector_primitive_factory=None, atol=0, rtol=0,
             max_dt_growth=5, min_dt_shrinkage=0.1,
-            limiter=None):
+            limiter=None, controller=None):
         if vector_primitive_factory is None:
             from hedge.vector_primitives import VectorPrimitiveFactory
             self.vector_primitive_factory = VectorPrimitiveFactory()
@@ -230,11 +612,22 @@ class EmbeddedRungeKuttaTimeStepperBase(TimeStepper):
         self.max_dt_growth = max_dt_growth
         self.min_dt_shrinkage = min_dt_shrinkage
 
+        if controller is None:
+            controller = IntegralStepSizeController(
+                    max_dt_growth=max_dt_growth,
+                    min_dt_shrinkage=min_dt_shrinkage)
+        self.controller = controller
+
+        self.statistics = AdaptiveStepStatistics()
+
         self.linear_combiner_cache = {}
 
     def get_stability_relevant_init_args(self):
         return (self.use_high_order,)
 
+    def reset_statistics(self):
+        self.statistics = AdaptiveStepStatistics()
+
     def add_instrumentation(self, logmgr):
         logmgr.add_quantity(self.timer)
         logmgr.add_quantity(self.flop_counter)
@@ -254,6 +647,14 @@ class EmbeddedRungeKuttaTimeStepperBase(TimeStepper):
 
 
 class EmbeddedButcherTableauTimeStepperBase(EmbeddedRungeKuttaTimeStepperBase):
+    def is_first_same_as_last(self):
+        """Return whether the last stage of :attr:`butcher_tableau` is
+        evaluated at the high-order solution, so that its right-hand side
+        can serve as the first stage of the next step.
+        """
+        c, coeffs = self.butcher_tableau[-1]
+        return c == 1 and list(coeffs) + [0] == list(self.high_order_coeffs)
+
     def __call__(self, y, t, dt, rhs, reject_hook=None):
         from hedge.tools import count_dofs
 
@@ -261,14 +662,7 @@ class EmbeddedButcherTableauTimeStepperBase(EmbeddedRungeKuttaTimeStepperBase):
         try:
             self.last_rhs
         except AttributeError:
-            self.last_rhs = rhs(t, y)
-            self.dof_count = count_dofs(self.last_rhs)
-
-            if self.adaptive:
-                self.norm = self.vector_primitive_factory \
-                        .make_maximum_norm(self.last_rhs)
-            else:
-                self.norm = None
+            self.last_rhs = None
 
         # }}}
 
@@ -282,6 +676,23 @@ class EmbeddedButcherTableauTimeStepperBase(EmbeddedRungeKuttaTimeStepperBase):
             for i, (c, coeffs) in enumerate(self.butcher_tableau):
                 if len(coeffs) == 0:
                     assert c == 0
+                    if self.last_rhs is None:
+                        self.last_rhs = rhs(t, y)
+                        self.statistics.rhs_evaluations += 1
+                    else:
+                        self.statistics.rhs_evaluations_saved += 1
+
+                    try:
+                        self.dof_count
+                    except AttributeError:
+                        self.dof_count = count_dofs(self.last_rhs)
+
+                        if self.adaptive:
+                            self.norm = self.vector_primitive_factory \
+                                    .make_maximum_norm(self.last_rhs)
+                        else:
+                            self.norm = None
+
                     this_rhs = self.last_rhs
                 else:
                     sub_timer = self.timer.start_sub_timer()
@@ -294,6 +705,7 @@ class EmbeddedButcherTableauTimeStepperBase(EmbeddedRungeKuttaTimeStepperBase):
                     sub_timer.stop().submit()
 
                     this_rhs = rhs(t + c*dt, sub_y)
+                    self.statistics.rhs_evaluations += 1
 
                 rhss.append(this_rhs)
 
@@ -307,14 +719,25 @@ class EmbeddedButcherTableauTimeStepperBase(EmbeddedRungeKuttaTimeStepperBase):
                 return self.get_linear_combiner(
                         len(args), self.last_rhs)(*args)
 
+            def finish_step(use_high_order):
+                # The last stage was evaluated at the limited high-order
+                # solution, which is exactly what is returned. In all
+                # other cases, the next step has to start from scratch.
+                if use_high_order and self.is_first_same_as_last():
+                    self.last_rhs = this_rhs
+                else:
+                    self.last_rhs = None
+
+                self.flop_counter.add(self.dof_count*flop_count[0])
+
             if not self.adaptive:
                 if self.use_high_order:
                     y = self.limiter(finish_solution(self.high_order_coeffs))
                 else:
                     y = self.limiter(finish_solution(self.low_order_coeffs))
 
-                self.last_rhs = this_rhs
-                self.flop_counter.add(self.dof_count*flop_count[0])
+                self.statistics.accepted_steps += 1
+                finish_step(self.use_high_order)
                 return y
             else:
                 # {{{ step size adaptation
@@ -330,14 +753,16 @@ class EmbeddedButcherTableauTimeStepperBase(EmbeddedRungeKuttaTimeStepperBase):
 
                 if not accept_step:
                     if reject_hook:
-                        y = reject_hook(dt, rel_err, t, y)
+                        new_y = reject_hook(dt, rel_err, t, y)
+                        if new_y is not y:
+                            self.last_rhs = None
+                        y = new_y
 
                     dt = next_dt
                     # ... and go back to top of loop
                 else:
                     # finish up
-                    self.last_rhs = this_rhs
-                    self.flop_counter.add(self.dof_count*flop_count[0])
+                    finish_step(True)
 
                     return self.limiter(high_order_end_y), t+dt, dt, next_dt
                 # }}}
@@ -440,6 +865,7 @@ class EmbeddedShuOsherFormTimeStepperBase(EmbeddedRungeKuttaTimeStepperBase):
             except KeyError:
                 result = rhs(t + time_fractions[i]*dt, row_values[i])
                 rhss[i] = result
+                self.statistics.rhs_evaluations += 1
 
                 try:
                     self.dof_count
@@ -476,6 +902,7 @@ class EmbeddedShuOsherFormTimeStepperBase(EmbeddedRungeKuttaTimeStepperBase):
 
             if not self.adaptive:
                 self.flop_counter.add(self.dof_count*flop_count)
+                self.statistics.accepted_steps += 1
 
                 if self.use_high_order:
                     assert abs(time_fractions[self.high_order_index] - 1) < 1e-15
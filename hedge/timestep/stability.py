@@ -59,57 +59,235 @@ def approximate_rk4_relative_imag_stability_region(
 
 
 
+# {{{ on-disk cache
+
+# bump this whenever the results computed below change
+_CACHE_VERSION = 1
+
+
+
+
+def get_stability_cache_dir():
+    """Return the directory in which computed stability regions are
+    stored, as given by the environment variable
+    :envvar:`HEDGE_STABILITY_CACHE_DIR`, defaulting to
+    :file:`~/.hedge/stability-cache`. Set the variable to an empty
+    string to disable the cache.
+    """
+    import os
+    result = os.environ.get("HEDGE_STABILITY_CACHE_DIR")
+    if result is None:
+        result = os.path.join(
+                os.path.expanduser("~"), ".hedge", "stability-cache")
+    return result
+
+
+
+
+def _disk_cached(key, compute):
+    """Return the result of *compute()*, looked up in or stored to the
+    on-disk cache under the string *key*.
+    """
+    import os
+    from cPickle import load, dump
+
+    cache_dir = get_stability_cache_dir()
+    if not cache_dir:
+        return compute()
+
+    from hashlib import md5
+    cache_file = os.path.join(cache_dir,
+            md5(key).hexdigest() + ".pickle")
+
+    try:
+        inf = open(cache_file, "rb")
+        try:
+            stored_key, result = load(inf)
+        finally:
+            inf.close()
+
+        if stored_key == key:
+            return result
+    except (IOError, EOFError, ValueError):
+        pass
+
+    result = compute()
+
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        # write to a temporary file, then rename, so that concurrent
+        # processes never see a partial entry
+        from tempfile import mkstemp
+        fd, temp_name = mkstemp(dir=cache_dir)
+        outf = os.fdopen(fd, "wb")
+        try:
+            dump((key, result), outf, protocol=2)
+        finally:
+            outf.close()
+        os.rename(temp_name, cache_file)
+    except (IOError, OSError), e:
+        from warnings import warn
+        warn("could not write stability region cache: %s" % e)
+
+    return result
+
+# }}}
+
+
+
+
+# {{{ vectorized stability test
+
+def is_stable(stepper_class, stepper_args, ks, step_count=20):
+    """For each complex eigenvalue in the array *ks*, find whether
+    *stepper_class* stays stable for ``y' = k y`` with unit time step.
+
+    All eigenvalues are advanced by a single stepper instance, as one
+    vector. A value counts as unstable once its magnitude exceeds 2
+    within *step_count* steps.
+
+    :returns: a boolean array of the same shape as *ks*.
+    """
+    ks = numpy.asarray(ks, dtype=numpy.complex128)
+    stepper = stepper_class(*stepper_args, **{"dtype": numpy.complex128})
+
+    flat_ks = ks.ravel()
+    y = numpy.ones_like(flat_ks)
+    stable = numpy.ones(flat_ks.shape, dtype=numpy.bool_)
+
+    err_settings = numpy.seterr(over="ignore", invalid="ignore")
+    try:
+        for i in range(step_count):
+            stable &= numpy.abs(y) <= 2
+
+            # keep diverged values from overflowing
+            y[~stable] = 0
+
+            y = stepper(y, i, 1, lambda t, y: flat_ks*y)
+    finally:
+        numpy.seterr(**err_settings)
+
+    return stable.reshape(ks.shape)
+
+
+
+
+def _find_boundary_magnitudes(stepper_class, stepper_args, angles,
+        prec, max_mag):
+    """Find, along each ray ``-prec + mag*exp(1j*angle)``, the magnitude
+    at which the stability region ends, to within *prec*.
+    """
+    angles = numpy.asarray(angles, dtype=numpy.float64)
+
+    def make_k(angle, mag):
+        return -prec + mag*numpy.exp(1j*angle)
+
+    # bracket the boundary on a geometric grid, all rays at once
+    from math import floor, log
+    mag_grid = 2.**numpy.arange(
+            floor(log(prec, 2)), log(max_mag, 2)+1)
+    grid_stable = is_stable(stepper_class, stepper_args,
+            make_k(angles[:, numpy.newaxis], mag_grid))
+
+    first_unstable = numpy.argmin(grid_stable, axis=1)
+    all_stable = grid_stable.all(axis=1)
+    none_stable = first_unstable == 0
+
+    stable_mag = numpy.where(none_stable,
+            0, mag_grid[numpy.maximum(first_unstable-1, 0)])
+    unstable_mag = mag_grid[first_unstable]
+
+    result = numpy.empty(len(angles))
+    result[all_stable] = mag_grid[-1]
+    result[none_stable & ~all_stable] = mag_grid[0]
+
+    # bisect all remaining rays at once
+    todo = ~all_stable & ~none_stable
+    stable_mag = stable_mag[todo]
+    unstable_mag = unstable_mag[todo]
+    todo_angles = angles[todo]
+
+    while len(todo_angles) and numpy.max(unstable_mag-stable_mag) > prec:
+        mid = (stable_mag+unstable_mag)/2
+        mid_stable = is_stable(stepper_class, stepper_args,
+                make_k(todo_angles, mid))
+        stable_mag = numpy.where(mid_stable, mid, stable_mag)
+        unstable_mag = numpy.where(mid_stable, unstable_mag, mid)
+
+    result[todo] = stable_mag
+    return result
+
+# }}}
+
+
+
+
+# {{{ stability regions
+
+def _get_stepper_cache_key(stepper_class, stepper_args, what):
+    return repr((_CACHE_VERSION,
+        stepper_class.__module__, stepper_class.__name__,
+        tuple(stepper_args), what))
+
+
+
+
+def compute_stability_region_boundary(stepper_class, stepper_args=(),
+        angle_count=65, prec=1e-5, max_mag=2**8):
+    """Compute the boundary of the stability region of *stepper_class*,
+    constructed with *stepper_args*, in the closed upper half of the complex
+    plane. Time steppers with real coefficients have stability regions
+    that are symmetric about the real axis.
+
+    :returns: a tuple *(angles, boundary)*, where *boundary* is an array
+      of complex numbers on the boundary of the stability region, one on
+      each ray from the origin with angle in *angles*, which are spaced
+      evenly in :math:`[0, \pi]`.
+
+    As in :func:`approximate_imag_stability_region`, a step counts as
+    stable if the solution of ``y' = k y`` grows by less than a factor of
+    two over twenty unit time steps, so rays pointing into the right half
+    plane stop just short of the origin.
+
+    Results are cached on disk, see :func:`get_stability_cache_dir`.
+    """
+    angles = numpy.linspace(0, numpy.pi, angle_count)
+
+    def compute():
+        return _find_boundary_magnitudes(
+                stepper_class, stepper_args, angles, prec, max_mag)
+
+    mags = _disk_cached(
+            _get_stepper_cache_key(stepper_class, stepper_args,
+                ("boundary", angle_count, prec, max_mag)),
+            compute)
+
+    return angles, -prec + mags*numpy.exp(1j*angles)
+
+
+
+
 @memoize
 def approximate_imag_stability_region(stepper_class, *stepper_args):
-    def stepper_maker():
-        return stepper_class(*stepper_args, **{"dtype": numpy.complex128})
+    """Return the extent of the stability region of *stepper_class*
+    along the imaginary axis.
 
+    Results are cached on disk, see :func:`get_stability_cache_dir`.
+    """
     prec = 1e-5
 
-    def is_stable(stepper, k):
-        y = 1
-        for i in range(20):
-            if abs(y) > 2:
-                return False
-            y = stepper(y, i, 1, lambda t, y: k*y)
-        return True
+    def compute():
+        mag, = _find_boundary_magnitudes(
+                stepper_class, stepper_args, [numpy.pi/2], prec, 2**8)
+        return abs(-prec + mag*1j)
 
-    def make_k(angle, mag):
-        from cmath import exp
-        return -prec+mag*exp(1j*angle)
-
-    def refine(angle, stable, unstable):
-        assert is_stable(stepper_maker(), make_k(angle, stable))
-        assert not is_stable(stepper_maker(), make_k(angle, unstable))
-        while abs(stable-unstable) > prec:
-            mid = (stable+unstable)/2
-            if is_stable(stepper_maker(), make_k(angle, mid)):
-                stable = mid
-            else:
-                unstable = mid
-        else:
-            return stable
-
-    def find_stable_k(angle):
-        mag = 1
-
-        if is_stable(stepper_maker(), make_k(angle, mag)):
-            mag *= 2
-            while is_stable(stepper_maker(), make_k(angle, mag)):
-                mag *= 2
-
-                if mag > 2**8:
-                    return mag
-            return refine(angle, mag/2, mag)
-        else:
-            mag /= 2
-            while not is_stable(stepper_maker(), make_k(angle, mag)):
-                mag /= 2
-
-                if mag < prec:
-                    return mag
-            return refine(angle, mag, mag*2)
-
-    from cmath import pi
-    angle = pi/2
-    return abs(make_k(angle, find_stable_k(angle)))
+    return _disk_cached(
+            _get_stepper_cache_key(stepper_class, stepper_args,
+                ("imag", prec)),
+            compute)
+
+# }}}
+
+# vim: foldmethod=marker
@@ -0,0 +1,172 @@
+"""Assembly of sparse matrices from matrix-free linear operators."""
+
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2007 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+
+
+
+import numpy
+from hedge.iterative import OperatorBase
+
+
+
+
+class BlockSparseMatrix(OperatorBase):
+    """A square matrix in block compressed sparse row (BSR) format, with one
+    block row and block column per element.
+
+    .. attribute:: blocks
+
+      An array of shape ``(block_count, block_size, block_size)``.
+
+    .. attribute:: block_col_indices
+
+      The block column of each entry in :attr:`blocks`.
+
+    .. attribute:: block_row_starts
+
+      An array of length ``block_row_count+1``. The blocks of block
+      row *i* are ``blocks[block_row_starts[i]:block_row_starts[i+1]]``.
+
+    Instances can be applied to vectors like the operator they were
+    assembled from.
+    """
+
+    def __init__(self, blocks, block_col_indices, block_row_starts):
+        self.blocks = blocks
+        self.block_col_indices = block_col_indices
+        self.block_row_starts = block_row_starts
+
+    @property
+    def dtype(self):
+        return self.blocks.dtype
+
+    @property
+    def block_size(self):
+        return self.blocks.shape[1]
+
+    @property
+    def shape(self):
+        n = (len(self.block_row_starts)-1)*self.block_size
+        return n, n
+
+    def __call__(self, operand):
+        bs = self.block_size
+        products = numpy.einsum("kij,kj->ki", self.blocks,
+                operand.reshape(-1, bs)[self.block_col_indices])
+        return numpy.add.reduceat(
+                products, self.block_row_starts[:-1]).ravel()
+
+    def to_scipy(self):
+        """Return a :class:`scipy.sparse.bsr_matrix` with the same
+        entries, e.g. for direct factorization.
+        """
+        from scipy.sparse import bsr_matrix
+        return bsr_matrix(
+                (self.blocks, self.block_col_indices, self.block_row_starts),
+                shape=self.shape)
+
+    def save(self, outf):
+        """Write the matrix to the file name or file-like object *outf*,
+        for use with :meth:`load`.
+        """
+        numpy.savez(outf,
+                blocks=self.blocks,
+                block_col_indices=self.block_col_indices,
+                block_row_starts=self.block_row_starts)
+
+    @classmethod
+    def load(cls, inf):
+        data = numpy.load(inf)
+        return cls(data["blocks"], data["block_col_indices"],
+                data["block_row_starts"])
+
+
+
+
+def assemble_block_sparse(discr, operator, stencil_distance=2):
+    """Assemble the linear, matrix-free *operator* on *discr* into a
+    :class:`BlockSparseMatrix`.
+
+    :param stencil_distance: the number of faces across which *operator*
+      couples elements. First-order operators and IPDG couple face
+      neighbors (1), LDG also couples neighbors of neighbors (2).
+
+    Elements are probed by :func:`hedge.iterative.probe_colored_elements`
+    with any two elements of the same color more than
+    ``2*stencil_distance`` faces apart. Then no element receives
+    contributions from more than one probed element, and all columns
+    belonging to one color and one local node are recovered with one
+    application of *operator*. Blocks that come out exactly zero are
+    dropped.
+
+    Only serial discretizations with a single element group are supported.
+    """
+    if getattr(discr, "subdiscr", None) is not None:
+        raise NotImplementedError("sparse assembly of distributed operators")
+
+    eg, = discr.element_groups
+    el_count = len(eg.members)
+    el_size = eg.ranges.el_size
+    assert eg.ranges.start == 0
+
+    from hedge.iterative import probe_colored_elements
+    el_colors, probes = probe_colored_elements(discr, operator,
+            distance=2*stencil_distance)
+
+    # build the block sparsity pattern
+    from hedge.mesh.tools import get_graph_neighborhood
+    graph = discr.mesh.element_adjacency_graph()
+
+    block_row_starts = [0]
+    block_col_indices = []
+    for el_nr in xrange(el_count):
+        row_cols = get_graph_neighborhood(graph, el_nr, stencil_distance)
+        row_cols.add(el_nr)
+        block_col_indices.extend(sorted(row_cols))
+        block_row_starts.append(len(block_col_indices))
+
+    block_row_starts = numpy.array(block_row_starts, dtype=numpy.intp)
+    block_col_indices = numpy.array(block_col_indices, dtype=numpy.intp)
+    block_rows = numpy.repeat(numpy.arange(el_count),
+            numpy.diff(block_row_starts))
+
+    blocks = numpy.zeros((len(block_col_indices), el_size, el_size),
+            dtype=operator.dtype)
+
+    for color, node, response in probes:
+        color_blocks, = numpy.nonzero(
+                el_colors[block_col_indices] == color)
+        blocks[color_blocks, :, node] = response.reshape(
+                el_count, el_size)[block_rows[color_blocks]]
+
+    # drop blocks that turned out to be zero, keeping the diagonal
+    keep = ((numpy.abs(blocks).reshape(len(blocks), -1).max(axis=1) != 0)
+            | (block_rows == block_col_indices))
+    block_row_starts = numpy.hstack([[0],
+        numpy.cumsum(numpy.bincount(block_rows[keep], minlength=el_count))])
+
+    return BlockSparseMatrix(
+            blocks[keep], block_col_indices[keep], block_row_starts)
@@ -1,4 +1,4 @@
-"""Flop counting."""
+"""Flop and memory traffic counting."""
 
 from __future__ import division
 
@@ -28,16 +28,80 @@ THE SOFTWARE.
 
 
 
-def time_count_flop(func, timer, counter, flop_counter, flops, increment=1):
+import numpy
+
+
+
+
+def time_count_flop(func, timer, counter, flop_counter, flops, increment=1,
+        byte_counter=None, byte_count=0, bandwidth=None):
+    """Wrap *func* so that each call is timed and counted, along with
+    *flops* floating point operations and, optionally, *byte_count* bytes
+    of memory traffic.
+
+    :param bandwidth: if not *None*, a
+      :class:`hedge.log.EffectiveBandwidth` that is fed the byte count
+      and the wall time of each call.
+    """
+    if bandwidth is not None:
+        from time import time
+
     def wrapped_f(*args, **kwargs):
         counter.add()
         flop_counter.add(flops)
+        if byte_counter is not None:
+            byte_counter.add(byte_count)
+
+        if bandwidth is not None:
+            start = time()
+
         sub_timer = timer.start_sub_timer()
         try:
             return func(*args, **kwargs)
         finally:
             sub_timer.stop().submit()
 
+            if bandwidth is not None:
+                bandwidth.add(byte_count, time()-start)
+
+    return wrapped_f
+
+
+
+
+def time_count_flux_lift(func, discr, get_counts):
+    """Wrap *func*, a kernel that gathers fluxes and lifts them in one
+    pass, so that each call is counted by the gather and lift counters
+    of *discr*. *get_counts* is called with the arguments of each call
+    and returns a tuple *(gather_flops, gather_bytes, lift_count,
+    lift_flops, lift_bytes)*.
+
+    Since the two stages cannot be timed separately, the whole call is
+    logged as gather time, and the bytes moved by both stages are fed to
+    the gather bandwidth.
+    """
+    from time import time
+
+    def wrapped_f(*args):
+        gather_flops, gather_bytes, lift_count, lift_flops, lift_bytes = \
+                get_counts(*args)
+
+        discr.gather_counter.add()
+        discr.gather_flop_counter.add(gather_flops)
+        discr.gather_byte_counter.add(gather_bytes)
+        discr.lift_counter.add(lift_count)
+        discr.lift_flop_counter.add(lift_flops)
+        discr.lift_byte_counter.add(lift_bytes)
+
+        start = time()
+        sub_timer = discr.gather_timer.start_sub_timer()
+        try:
+            return func(*args)
+        finally:
+            sub_timer.stop().submit()
+            discr.gather_bandwidth.add(
+                    gather_bytes + lift_bytes, time()-start)
+
     return wrapped_f
 
 
@@ -105,6 +169,25 @@ def lift_flops(fg):
 
 
 
+def face_group_gather_flops(fg, arg_count, flux_count):
+    """Like :func:`gather_flops`, but for gathering *flux_count* fluxes
+    that depend on *arg_count* vectors on the face group *fg* only.
+    """
+    return (
+            flux_count
+            * arg_count
+            * fg.face_length()
+            * fg.face_count
+            * fg.element_count()
+            * (1 # facejac-mul
+                + 2 * # int+ext
+                3 # const-mul, normal-mul, add
+                )
+            )
+
+
+
+
 def gather_flops(discr, quadrature_tag=None):
     result = 0
     for eg in discr.element_groups:
@@ -131,6 +214,186 @@ def gather_flops(discr, quadrature_tag=None):
 
 
 
+# byte counting ---------------------------------------------------------------
+# These model the minimal memory traffic of each kernel: every vector entry
+# is read or written exactly once, and each element-local matrix is read
+# once per kernel invocation (i.e. it is assumed to stay in cache).
+
+INDEX_BYTES = numpy.dtype(numpy.uint32).itemsize
+
+
+
+
+def diff_rst_bytes(discr, dtype):
+    itemsize = numpy.dtype(dtype).itemsize
+
+    result = 0
+    for eg in discr.element_groups:
+        ldis = eg.local_discretization
+        result += itemsize * (
+                2 # read field, write result
+                * ldis.node_count() * len(eg.members)
+                + ldis.node_count()**2 # matrix
+                )
+
+    return result
+
+
+
+
+def mass_bytes(discr, dtype):
+    itemsize = numpy.dtype(dtype).itemsize
+
+    result = 0
+    for eg in discr.element_groups:
+        ldis = eg.local_discretization
+        result += itemsize * (
+                2 # read field, write result
+                * ldis.node_count() * len(eg.members)
+                + ldis.node_count()**2 # matrix
+                + len(eg.members) # jacobian rescale
+                )
+
+    return result
+
+
+
+
+def lift_bytes(fg, dtype):
+    itemsize = numpy.dtype(dtype).itemsize
+    ldis = fg.ldis_loc
+    face_dofs = fg.face_length() * ldis.face_count()
+
+    return itemsize * (
+            face_dofs * fg.element_count() # read fluxes on faces
+            + ldis.node_count() * fg.element_count() # write result
+            + face_dofs * ldis.node_count() # matrix
+            + fg.element_count() # inverse jacobian
+            )
+
+
+
+
+def gather_bytes(discr, arg_count, flux_count, dtype, quadrature_tag=None):
+    """Model the memory traffic of gathering *flux_count* fluxes that
+    depend on *arg_count* volume or boundary vectors. Each face side is
+    counted once.
+    """
+    itemsize = numpy.dtype(dtype).itemsize
+
+    result = 0
+    for eg in discr.element_groups:
+        ldis = eg.local_discretization
+
+        if quadrature_tag is None:
+            fnc = ldis.face_node_count()
+        else:
+            fnc = eg.quadrature_info[quadrature_tag] \
+                    .ldis_quad_info.face_node_count()
+
+        face_count = ldis.face_count() * len(eg.members)
+
+        result += (
+                fnc * face_count * (
+                    2 * arg_count * itemsize # int+ext values
+                    + flux_count * itemsize # fluxes on faces
+                    + 2 * INDEX_BYTES # int+ext index lists
+                    )
+                + face_count * itemsize * (
+                    discr.dimensions # normal
+                    + 2 # face jacobian, h
+                    ))
+
+    return result
+
+
+
+
+def face_group_gather_bytes(fg, arg_count, dtype):
+    """Model the memory traffic of gathering fluxes that depend on
+    *arg_count* vectors on the face group *fg* in a kernel that lifts
+    them right away, i.e. without storing them on the faces. See
+    :func:`gather_bytes`.
+    """
+    itemsize = numpy.dtype(dtype).itemsize
+    face_count = fg.face_count * fg.element_count()
+
+    return (
+            fg.face_length() * face_count * (
+                2 * arg_count * itemsize # int+ext values
+                + 2 * INDEX_BYTES # int+ext index lists
+                )
+            + face_count * itemsize * (
+                fg.ldis_loc.dimensions # normal
+                + 2 # face jacobian, h
+                ))
+
+
+
+
+def fused_lift_bytes(fg, flux_count, dtype):
+    """Model the memory traffic of lifting *flux_count* fluxes on the
+    face group *fg* in a kernel that computes the fluxes itself. Unlike
+    :func:`lift_bytes`, no fluxes are read from face vectors, but each
+    result is updated in place.
+    """
+    itemsize = numpy.dtype(dtype).itemsize
+    ldis = fg.ldis_loc
+    face_dofs = fg.face_length() * ldis.face_count()
+
+    return itemsize * (
+            2 * flux_count * ldis.node_count() * fg.element_count() # update result
+            + face_dofs * ldis.node_count() # matrix
+            + fg.element_count() # inverse jacobian
+            )
+
+
+
+
+def vector_expr_bytes(vector_count, size, dtype):
+    return vector_count * size * numpy.dtype(dtype).itemsize
+
+
+
+
+# bandwidth calibration -------------------------------------------------------
+def measure_stream_bandwidth(size=2**22, dtype=numpy.float64, attempts=5):
+    """Return the best memory bandwidth (in bytes/s) observed in a
+    STREAM-like copy and triad loop over vectors of *size* entries.
+
+    This serves as the 'peak' against which the kernel bandwidths
+    logged by :class:`hedge.log.EffectiveBandwidth` may be compared.
+    """
+    from time import time
+
+    itemsize = numpy.dtype(dtype).itemsize
+    a = numpy.zeros(size, dtype=dtype)
+    b = numpy.ones(size, dtype=dtype)
+    c = numpy.ones(size, dtype=dtype)
+
+    result = 0
+    for i in range(attempts):
+        # copy: read b, write a
+        start = time()
+        a[:] = b
+        elapsed = time() - start
+        if elapsed:
+            result = max(result, 2*size*itemsize/elapsed)
+
+        # triad: a = b + 3*c, done by numpy in two sweeps, which move
+        # five vectors: read c, write a, then read a and b, write a
+        start = time()
+        numpy.multiply(c, 3, a)
+        a += b
+        elapsed = time() - start
+        if elapsed:
+            result = max(result, 5*size*itemsize/elapsed)
+
+    return result
+
+
+
+
 def count_dofs(vec):
     try:
         dtype = vec.dtype
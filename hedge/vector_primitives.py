@@ -38,15 +38,23 @@ class ObjectArrayLinearCombinationWrapper(object):
     def __init__(self, scalar_kernel):
         self.scalar_kernel = scalar_kernel
 
-    def __call__(self, *args):
+    def __call__(self, *args, **kwargs):
         from pytools import indices_in_shape, single_valued
 
+        out = kwargs.pop("out", None)
+
         oa_shape = single_valued(ary.shape for fac, ary in args)
-        result = numpy.zeros(oa_shape, dtype=object)
+        if out is None:
+            result = numpy.zeros(oa_shape, dtype=object)
+        else:
+            result = out
 
         for i in indices_in_shape(oa_shape):
             args_i = [(fac, ary[i]) for fac, ary in args]
-            result[i] = self.scalar_kernel(*args_i)
+            if out is None:
+                result[i] = self.scalar_kernel(*args_i)
+            else:
+                result[i] = self.scalar_kernel(*args_i, **{"out": out[i]})
 
         return result
 
@@ -57,8 +65,15 @@ class UnoptimizedLinearCombiner(object):
     def __init__(self, result_dtype, scalar_dtype):
         self.result_type = result_dtype.type
 
-    def __call__(self, *args):
-        return sum(self.result_type(fac)*vec for fac, vec in args)
+    def __call__(self, *args, **kwargs):
+        result = sum(self.result_type(fac)*vec for fac, vec in args)
+
+        out = kwargs.pop("out", None)
+        if out is None:
+            return result
+        else:
+            out[...] = result
+            return out
 
 
 
@@ -67,6 +82,8 @@ class NumpyLinearCombiner(object):
     def __init__(self, result_dtype, scalar_dtype, sample_vec, arg_count):
         self.result_dtype = result_dtype
         self.shape = sample_vec.shape
+        # preserves markers such as hedge.backends.jit.EnsembleArray
+        self.array_type = type(sample_vec)
 
         from codepy.elementwise import \
                 make_linear_comb_kernel_with_result_dtype
@@ -75,11 +92,22 @@ class NumpyLinearCombiner(object):
                 (scalar_dtype,)*arg_count,
                 (sample_vec.dtype,)*arg_count)
 
-    def __call__(self, *args):
-        result = numpy.empty(self.shape, self.result_dtype)
+    def __call__(self, *args, **kwargs):
+        # the kernel reads each entry of its arguments before writing that
+        # entry of the result, so *out* may be one of the arguments
+        result = kwargs.pop("out", None)
+        if result is None:
+            result = numpy.empty(self.shape, self.result_dtype) \
+                    .view(self.array_type)
+
+        # ensembles of vectors (see hedge.backends.jit) are combined in
+        # one kernel call
+        kernel_args = []
+        for fac, vec in args:
+            kernel_args.append(fac)
+            kernel_args.append(numpy.asarray(vec).reshape(-1))
 
-        from pytools import flatten
-        self.kernel(result, *tuple(flatten(args)))
+        self.kernel(numpy.asarray(result).reshape(-1), *kernel_args)
 
         return result
 
@@ -106,10 +134,12 @@ class CUDALinearCombiner:
         else:
             self.allocator = None
 
-    def __call__(self, *args):
+    def __call__(self, *args, **kwargs):
         import pycuda.gpuarray as gpuarray
-        result = gpuarray.empty(self.shape, self.result_dtype,
-                allocator=self.allocator)
+        result = kwargs.pop("out", None)
+        if result is None:
+            result = gpuarray.empty(self.shape, self.result_dtype,
+                    allocator=self.allocator)
 
         knl_args = []
         for fac, vec in args:
@@ -182,7 +212,9 @@ class VectorPrimitiveFactory(object):
           array composition, and dtypes.
         :returns: a function that accepts `arg_count` arguments
           *((factor0, vec0), (factor1, vec1), ...)* and returns
-          `factor0*vec0 + factor1*vec1`.
+          `factor0*vec0 + factor1*vec1`. If the keyword argument *out* is
+          given, the result is stored in that vector, which may also be
+          one of the arguments, instead of a newly allocated one.
         """
         from hedge.tools import is_obj_array
         sample_is_obj_array = is_obj_array(sample_vec)
@@ -219,7 +251,11 @@ class VectorPrimitiveFactory(object):
             sample_vec = sample_vec[0]
 
         if isinstance(sample_vec, numpy.ndarray) and sample_vec.dtype != object:
-            kernel = numpy.dot
+            if len(sample_vec.shape) > 1:
+                def kernel(a, b):
+                    return numpy.dot(a.reshape(-1), b.reshape(-1))
+            else:
+                kernel = numpy.dot
         else:
             kernel = self.make_special_inner_product(sample_vec)
 
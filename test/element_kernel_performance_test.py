@@ -0,0 +1,110 @@
+"""This benchmark compares the generic element-local kernels of the JIT
+backend (differentiation, lifting, elementwise linear operators) with
+the variants from :mod:`hedge.backends.jit.elwise`, which are specialized
+for the element size, for orders 1 to 8 in two and three dimensions.
+
+:class:`hedge.backends.jit.Executor` picks the faster variant on each
+machine at run time. Run this to see by how much.
+"""
+
+from __future__ import division
+
+
+
+
+def time_call(f, *args):
+    from time import time
+
+    f(*args) # compile, warm up caches
+
+    count = 0
+    start = time()
+    while True:
+        f(*args)
+        count += 1
+        elapsed = time() - start
+        if elapsed > 0.2:
+            return elapsed/count
+
+
+
+
+def builtin_elwise(discr):
+    from hedge._internal import perform_elwise_scaled_operator
+
+    def f(op, field, out):
+        for eg in discr.element_groups:
+            perform_elwise_scaled_operator(eg.ranges, eg.ranges,
+                    op.coefficients(eg), op.matrix(eg), field, out)
+
+    return f
+
+
+
+
+def bench_discr(discr):
+    from hedge.backends.jit.diff import JitDifferentiator
+    from hedge.backends.jit.lift import JitLifter
+    from hedge.backends.jit.elwise import JitElementwiseLinear
+    from hedge.optemplate import \
+            ReferenceDifferentiationOperator, MassOperator
+
+    field = discr.volume_zeros()
+    out = discr.volume_zeros()
+
+    diff_ops = [ReferenceDifferentiationOperator(i)
+            for i in range(discr.dimensions)]
+
+    fg = discr.face_groups[0]
+    import numpy
+    fof = numpy.zeros(fg.face_count*fg.face_length()*fg.element_count(),
+            dtype=discr.default_scalar_type)
+    lift_matrix = fg.ldis_loc.lifting_matrix()
+
+    result = []
+    for specialize in [False, True]:
+        result.append(time_call(
+            JitDifferentiator(discr, specialize=specialize),
+            diff_ops, field))
+        result.append(time_call(
+            JitLifter(discr, specialize=specialize),
+            fg, lift_matrix, fg.local_el_inverse_jacobians, fof, out))
+
+    elwise_times = [
+            time_call(f, MassOperator(), field, out)
+            for f in [builtin_elwise(discr), JitElementwiseLinear(discr)]]
+
+    generic_diff, generic_lift, spec_diff, spec_lift = result
+    return [
+            generic_diff/spec_diff,
+            generic_lift/spec_lift,
+            elwise_times[0]/elwise_times[1]]
+
+
+
+
+def main():
+    from hedge.backends.jit import Discretization
+    from hedge.mesh.generator import make_disk_mesh, make_box_mesh
+    from hedge.discretization.local import \
+            TriangleDiscretization, TetrahedronDiscretization
+
+    meshes = [
+            (2, make_disk_mesh(max_area=1e-3), TriangleDiscretization),
+            (3, make_box_mesh(max_volume=1e-3), TetrahedronDiscretization),
+            ]
+
+    print "speedup of specialized over generic kernels"
+    print "%3s %5s %6s %8s %8s %8s" % (
+            "dim", "order", "dofs", "diff", "lift", "elwise")
+
+    for dim, mesh, ldis_class in meshes:
+        for order in range(1, 9):
+            ldis = ldis_class(order)
+            discr = Discretization(mesh, ldis)
+            print "%3d %5d %6d %8.2f %8.2f %8.2f" % tuple(
+                    [dim, order, ldis.node_count()]
+                    + bench_discr(discr))
+
+if __name__ == "__main__":
+    main()
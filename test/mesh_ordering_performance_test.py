@@ -0,0 +1,62 @@
+"""This benchmark compares the throughput of a wave operator right-hand
+side under different element orderings: as generated, Cuthill-McKee on
+the element adjacency graph, and along Hilbert and Morton space-filling
+curves through the element centroids.
+
+The time needed to compute each ordering is shown as well, since
+Cuthill-McKee runs in pure Python.
+"""
+
+from __future__ import division
+
+
+
+
+def main():
+    from time import time
+    from hedge.mesh.generator import make_box_mesh
+    from hedge.backends.jit import Discretization
+    from hedge.models.wave import StrongWaveOperator
+    from hedge.mesh import TAG_ALL, TAG_NONE
+    from hedge.tools import join_fields
+
+    mesh = make_box_mesh(max_volume=2e-4)
+    print "%d elements" % len(mesh.elements)
+
+    op = StrongWaveOperator(-1, 3,
+            dirichlet_tag=TAG_NONE,
+            neumann_tag=TAG_NONE,
+            radiation_tag=TAG_ALL,
+            flux_type="upwind")
+
+    print "%-10s %12s %12s" % ("ordering", "t_order [s]", "rhs/s")
+
+    for method in [None, "cuthill", "hilbert", "morton"]:
+        start = time()
+        if method is None:
+            ordered_mesh = mesh
+        else:
+            ordered_mesh = mesh.reordered_by(method)
+        order_time = time() - start
+
+        discr = Discretization(ordered_mesh, order=3)
+
+        fields = join_fields(discr.volume_zeros(),
+                [discr.volume_zeros() for i in range(discr.dimensions)])
+
+        rhs = op.bind(discr)
+        rhs(0, fields) # compile, warm up caches
+
+        count = 0
+        start = time()
+        while time() - start < 5:
+            rhs(0, fields)
+            count += 1
+
+        print "%-10s %12.3f %12.2f" % (
+                method, order_time, count/(time() - start))
+
+        discr.close()
+
+if __name__ == "__main__":
+    main()
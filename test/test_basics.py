@@ -84,6 +84,74 @@ def test_ab_coefficients():
 
 
 
+def test_in_place_ab_matches_reference():
+    """Check that the in-place Adams-Bashforth updates give the same
+    results, bit for bit, as the straightforward formula."""
+    from operator import add
+    from hedge.timestep.ab import AdamsBashforthTimeStepper
+    from hedge.tools import join_fields
+
+    class ReferenceAdamsBashforthTimeStepper(AdamsBashforthTimeStepper):
+        def combine(self, y, dt):
+            return y + dt * reduce(add,
+                    (coeff * f
+                        for coeff, f in
+                        zip(self.coefficients, self.f_history)))
+
+    rng = numpy.random.RandomState(17)
+    mat = rng.randn(5, 5)
+
+    def rhs(t, y):
+        return join_fields(numpy.dot(mat, y[0]) + numpy.sin(t), -y[1:])
+
+    y0 = join_fields(rng.randn(5), rng.randn(5), rng.randn(5))
+
+    for order in [1, 3, 4]:
+        results = []
+        for stepper in [
+                ReferenceAdamsBashforthTimeStepper(order),
+                AdamsBashforthTimeStepper(order),
+                AdamsBashforthTimeStepper(order, update_in_place=True)]:
+            y = y0.copy()
+            for i in range(20):
+                y = stepper(y, i*0.01, 0.01, rhs)
+            results.append(y)
+
+        for result in results[1:]:
+            for res_i, ref_i in zip(result, results[0]):
+                assert (res_i == ref_i).all()
+
+    from hedge.timestep.multirate_ab import TwoRateAdamsBashforthTimeStepper
+    import hedge.timestep.multirate_ab as mrab
+
+    def make_rhs(fast_factor, slow_factor):
+        return lambda t, y_fast, y_slow: (
+                fast_factor*numpy.cos(t)*y_fast()
+                + slow_factor*y_slow())
+
+    rhss = (make_rhs(-2, 0), make_rhs(0, 1),
+            make_rhs(0.5, 0), make_rhs(0, -0.25))
+
+    results = []
+    real_ab_update = mrab.ab_update
+    try:
+        for ab_update in [lambda *args, **kwargs: None, real_ab_update]:
+            mrab.ab_update = ab_update
+
+            stepper = TwoRateAdamsBashforthTimeStepper("Fqsr", 0.05, 3, 3)
+            ys = [numpy.linspace(0, 1, 7), numpy.linspace(1, 2, 7)]
+            for i in range(10):
+                ys = stepper(ys, i*0.05, rhss)
+            results.append(ys)
+    finally:
+        mrab.ab_update = real_ab_update
+
+    for res_i, ref_i in zip(results[1], results[0]):
+        assert (res_i == ref_i).all()
+
+
+
+
 class MultirateTimesteperAccuracyChecker:
     """Check that the multirate timestepper has the advertised accuracy
     """
@@ -163,6 +231,64 @@ def test_multirate_timestep_accuracy():
 
 
 
+def test_lts_timestep_accuracy():
+    """Check that N-rate local time stepping has the advertised accuracy"""
+
+    from hedge.timestep.multirate_ab.lts import \
+            RateClass, RateClassification, \
+            LocalAdamsBashforthTimeStepper
+    from hedge.timestep.runge_kutta import LSRK4TimeStepper
+    from hedge.tools import EOCRecorder
+
+    # three coupled pairs of unknowns with stiffness ratios 1:4:16
+    class_count = 3
+    rng = numpy.random.RandomState(17)
+    a = 0.3*rng.randn(2*class_count, 2*class_count)
+    for i in range(2*class_count):
+        a[i, i] = -4**(i//2)
+
+    classification = RateClassification(
+            classes=[RateClass(
+                index=i,
+                element_numbers=numpy.array([2*i, 2*i+1]),
+                dof_indices=slice(2*i, 2*i+2),
+                element_ranges=None,
+                min_dt_factor=1/4**i)
+                for i in range(class_count)],
+            element_count=2*class_count)
+
+    def rhs(t, y, classes=None):
+        return numpy.dot(a, y)
+
+    y0 = numpy.ones(2*class_count)
+    final_t = 1
+
+    ref_stepper = LSRK4TimeStepper()
+    ref_steps = 2000
+    y_ref = y0
+    for i in range(ref_steps):
+        y_ref = ref_stepper(y_ref, i/ref_steps, 1/ref_steps, rhs)
+
+    for order in [2, 3]:
+        eocrec = EOCRecorder()
+        for step_count in [20, 40, 80]:
+            dt = final_t/step_count
+            stepper = LocalAdamsBashforthTimeStepper(order, classification,
+                    rhs_accepts_classes=True)
+
+            y = y0
+            for i in range(step_count):
+                y = stepper(y, i*dt, dt, rhs)
+
+            eocrec.add_data_point(1/dt, la.norm(y-y_ref))
+
+        assert eocrec.estimate_order_of_convergence()[0,1] > order*0.85
+        assert abs(stepper.get_speedup()
+                - classification.get_work_estimate()) < 1e-12
+
+
+
+
 @pytools.test.mark_test.long
 def test_timestep_accuracy():
     """Check that all timesteppers have the advertised accuracy"""
@@ -222,7 +348,9 @@ def test_timestep_accuracy():
             SSP2TimeStepper,
             SSP3TimeStepper,
             SSP23FewStageTimeStepper,
-            SSP23ManyStageTimeStepper)
+            SSP23ManyStageTimeStepper,
+            LowStorageSSP54TimeStepper,
+            LowStorageSSP104TimeStepper)
 
     from hedge.timestep.imex_rk import KennedyCarpenterIMEXARK4
     from hedge.timestep.ab import AdamsBashforthTimeStepper
@@ -241,6 +369,11 @@ def test_timestep_accuracy():
     verify_timestep_order(lambda: SSP23FewStageTimeStepper(True), 3)
     verify_timestep_order(lambda: SSP23FewStageTimeStepper(False), 2)
 
+    verify_timestep_order(LowStorageSSP54TimeStepper, 4)
+    verify_timestep_order(LowStorageSSP104TimeStepper, 4)
+    verify_timestep_order(
+            lambda: LowStorageSSP104TimeStepper(update_in_place=True), 4)
+
     verify_timestep_order(lambda: ODE45TimeStepper(True), 5, dtmul=2**5)
     verify_timestep_order(lambda: ODE45TimeStepper(False), 4)
     verify_timestep_order(lambda: ODE23TimeStepper(True), 3, dtmul=2**3)
@@ -320,6 +453,54 @@ def test_imex_timestep_accuracy():
 
 
 
+def test_newton_krylov_imex():
+    """Check the Jacobian-free Newton-Krylov implicit stage solver against
+    a direct solve for a stiff, nonlinear problem."""
+
+    from hedge.timestep.imex_rk import (KennedyCarpenterIMEXARK4,
+            NewtonKrylovImplicitSolver)
+
+    n = 20
+    rng = numpy.random.RandomState(3)
+    a = -numpy.diag(numpy.linspace(1, 1000, n)) + 0.1*rng.randn(n, n)
+
+    def rhs_stiff(t, y):
+        return numpy.dot(a, y) - y**3
+
+    def rhs_expl(t, y):
+        return numpy.sin(t)*numpy.ones(n)
+
+    nk_solver = NewtonKrylovImplicitSolver(rhs_stiff,
+            make_precon=lambda alpha: (lambda v: v/(1-alpha*numpy.diag(a))),
+            newton_tol=1e-12, krylov_tol=1e-8)
+
+    def rhs_impl_reference(t, y0, alpha):
+        # plain Newton with the exact Jacobian
+        k = rhs_stiff(t, y0)
+        for i in range(50):
+            y = y0 + alpha*k
+            residual = k - rhs_stiff(t, y)
+            jacobian = numpy.eye(n) - alpha*(a - numpy.diag(3*y**2))
+            k = k - la.solve(jacobian, residual)
+        return k
+
+    y_nk = y_ref = rng.randn(n)
+    stepper_nk = KennedyCarpenterIMEXARK4()
+    stepper_ref = KennedyCarpenterIMEXARK4()
+
+    t = 0
+    dt = 0.05
+    for i in range(20):
+        y_nk = stepper_nk(y_nk, t, dt, rhs_expl, nk_solver)
+        y_ref = stepper_ref(y_ref, t, dt, rhs_expl, rhs_impl_reference)
+        t += dt
+
+    assert la.norm(y_nk - y_ref) < 1e-8*la.norm(y_ref)
+    assert nk_solver.newton_iterations > 0
+
+
+
+
 def test_adaptive_timestep():
     class VanDerPolOscillator:
         def __init__(self, mu=30):
@@ -378,6 +559,96 @@ def test_adaptive_timestep():
 
 
 
+def test_step_size_controllers():
+    """Check that all step size controllers reach the requested tolerance
+    and that first-same-as-last reuse saves one rhs evaluation per step."""
+    def van_der_pol(t, y, mu=5):
+        return numpy.array([y[1], mu*(1-y[0]**2)*y[1] - y[0]])
+
+    from hedge.timestep.runge_kutta import (ODE45TimeStepper,
+            IntegralStepSizeController, PIStepSizeController,
+            PIDStepSizeController)
+
+    def integrate(stepper, final_time=10):
+        y = numpy.array([2, 0], dtype=numpy.float64)
+        t = 0
+        next_dt = 1e-4
+        while t < final_time:
+            y, t, taken_dt, next_dt = stepper(
+                    y, t, min(next_dt, final_time-t), van_der_pol)
+        return y
+
+    ref = integrate(ODE45TimeStepper(rtol=1e-11))
+
+    for controller in [
+            IntegralStepSizeController(),
+            PIStepSizeController(),
+            PIDStepSizeController()]:
+        stepper = ODE45TimeStepper(rtol=1e-6, controller=controller)
+        assert stepper.is_first_same_as_last()
+
+        y = integrate(stepper)
+        assert la.norm(y-ref)/la.norm(ref) < 1e-4
+
+        stats = stepper.statistics
+        attempts = stats.accepted_steps + stats.rejected_steps
+        stages = len(stepper.butcher_tableau)
+        assert stats.rhs_evaluations == attempts*(stages-1) + 1
+        assert stats.rhs_evaluations_saved == attempts - 1
+
+
+
+
+def test_stability_region():
+    import os
+    from tempfile import mkdtemp
+    from shutil import rmtree
+
+    cache_dir = mkdtemp()
+    old_cache_dir = os.environ.get("HEDGE_STABILITY_CACHE_DIR")
+    os.environ["HEDGE_STABILITY_CACHE_DIR"] = cache_dir
+
+    try:
+        from hedge.timestep.runge_kutta import LSRK4TimeStepper
+        from hedge.timestep.stability import (
+                is_stable,
+                approximate_imag_stability_region,
+                compute_stability_region_boundary)
+
+        # compare to the amplification factor of classical RK4
+        ks = numpy.linspace(-3, 0.5, 30)[:, numpy.newaxis] \
+                + 1j*numpy.linspace(0, 3, 30)
+        amp = abs(sum(ks**i/factorial for i, factorial in
+            enumerate([1, 1, 2, 6, 24])))
+        clear = abs(amp-1) > 0.05
+        assert (is_stable(LSRK4TimeStepper, (), ks)[clear]
+                == (amp < 1)[clear]).all()
+
+        # RK4 reaches 2*sqrt(2) along the imaginary axis
+        assert abs(approximate_imag_stability_region(LSRK4TimeStepper)
+                - 2*2**0.5) < 0.05
+
+        cache_entry_count = len(os.listdir(cache_dir))
+        angles, boundary = compute_stability_region_boundary(
+                LSRK4TimeStepper, angle_count=9)
+        assert len(os.listdir(cache_dir)) == cache_entry_count + 1
+        angles_2, boundary_2 = compute_stability_region_boundary(
+                LSRK4TimeStepper, angle_count=9)
+        assert (boundary == boundary_2).all()
+
+        # RK4 reaches about -2.79 along the negative real axis
+        assert abs(boundary[-1] + 2.79) < 0.05
+    finally:
+        if old_cache_dir is None:
+            del os.environ["HEDGE_STABILITY_CACHE_DIR"]
+        else:
+            os.environ["HEDGE_STABILITY_CACHE_DIR"] = old_cache_dir
+
+        rmtree(cache_dir)
+
+
+
+
 def test_face_vertex_order():
     """Verify that face_indices() emits face vertex indices in the right order"""
     from hedge.discretization.local import \
@@ -916,6 +1187,366 @@ def test_identify_affine_map():
 
 
 
+
+
+def test_execution_profile():
+    """Check that the execution profile aggregates and exports timings."""
+    from hedge.compiler import ExecutionProfile
+
+    profile = ExecutionProfile()
+    profile.start_run()
+
+    field = numpy.zeros(100)
+    profile.add_instruction("fast <- a+b", 0, 0.5, [("fast", field)])
+    profile.add_instruction("slow <- a*b", 0.5, 2, [("slow", field)])
+    profile.add_future("slow <- a*b", 2, 2.5, False, [])
+
+    report = profile.get_report().split("\n")
+    assert report[2].startswith("  1.5000")
+    assert "slow <- a*b" in report[3]
+    assert "fast <- a+b" in report[5]
+
+    slow_stats = profile.insn_stats["slow <- a*b"]
+    assert slow_stats.bytes == field.nbytes
+    assert slow_stats.future_wait_count == 1
+
+    trace = profile.get_chrome_trace()
+    assert len(trace["traceEvents"]) == 3
+    assert trace["traceEvents"][1]["dur"] == 1.5e6
+
+    from StringIO import StringIO
+    import json
+    outf = StringIO()
+    profile.write_chrome_trace(outf)
+    assert json.loads(outf.getvalue()) == trace
+
+
+
+
+
+def test_reduction_batch():
+    """Check that a reduction batch unpacks mixed reductions correctly."""
+    from hedge.discretization import ReductionBatch
+
+    class SumDiscretization:
+        def integral(self, volume_vector):
+            return numpy.sum(volume_vector, axis=-1)
+
+        def inner_product(self, a, b):
+            return numpy.dot(a, b)
+
+    batch = ReductionBatch(SumDiscretization())
+
+    vec = numpy.array([3., -4.])
+    integral = batch.integral(vec)
+    vec_integral = batch.integral(numpy.array([[1., 2.], [3., 4.]]))
+    l2_norm = batch.norm(vec)
+    max_norm = batch.norm(vec, numpy.Inf)
+    minimum = batch.add_min(-4.)
+    complex_sum = batch.add_sum(1+2j)
+
+    batch.execute()
+
+    assert integral() == -1
+    assert (vec_integral() == [3, 7]).all()
+    assert abs(l2_norm() - 5) < 1e-14
+    assert max_norm() == 4
+    assert minimum() == -4
+    assert complex_sum() == 1+2j
+
+    batch = ReductionBatch(SumDiscretization())
+    for add in [batch.add_max, batch.add_min]:
+        try:
+            add(1+2j)
+        except ValueError:
+            pass
+        else:
+            assert False, "complex max/min reduction not rejected"
+
+
+
+
+def test_log_reduction_batching():
+    """Check that batched log quantities only reduce when they are due
+    and never return values from an earlier tick."""
+    from hedge.discretization import ReductionBatch
+    from hedge.log import BatchedReductionQuantity
+
+    class CountingDiscretization:
+        def __init__(self):
+            self.batch_count = 0
+
+        def make_reduction_batch(self):
+            self.batch_count += 1
+            return ReductionBatch(self)
+
+    class TickQuantity(BatchedReductionQuantity):
+        def __init__(self, discr):
+            self.evaluations = 0
+            self.register_for_batching(discr)
+
+        def add_reductions(self, batch):
+            self.evaluations += 1
+            return batch.add_max(logmgr.tick_count)
+
+    class GatherDescriptor:
+        def __init__(self, quantity, interval):
+            self.quantity = quantity
+            self.interval = interval
+
+    class FakeLogManager:
+        tick_count = 0
+
+    discr = CountingDiscretization()
+    every_tick = TickQuantity(discr)
+    every_third_tick = TickQuantity(discr)
+
+    logmgr = FakeLogManager()
+
+    # without the descriptor lists, the intervals are unknown
+    try:
+        every_tick.reduction_batcher.attach(logmgr)
+    except TypeError:
+        pass
+    else:
+        assert False, "attach did not reject the log manager"
+
+    logmgr.before_gather_descriptors = [
+            GatherDescriptor(every_third_tick, 3),
+            GatherDescriptor(every_tick, 1)]
+    logmgr.after_gather_descriptors = []
+    every_tick.reduction_batcher.attach(logmgr)
+
+    for tick in range(7):
+        logmgr.tick_count = tick
+        for gd in logmgr.before_gather_descriptors:
+            if tick % gd.interval == 0:
+                assert gd.quantity() == tick
+
+    assert every_tick.evaluations == 7
+    assert every_third_tick.evaluations == 3
+    assert discr.batch_count == 7
+
+
+
+
+def test_optemplate_interning():
+    """Check that interning shares equal subexpressions of an op template,
+    and that node-caching mappers then map each of them only once."""
+    from hedge.optemplate import (Field, InverseMassOperator,
+            DifferentiationOperator, OpTemplateInterner,
+            IdentityMapper, NodeCachingMapperMixin)
+
+    def make_term():
+        return InverseMassOperator()(DifferentiationOperator(0)(Field("u")))
+
+    term_1 = make_term()
+    term_2 = make_term()
+    assert term_1 is not term_2
+    assert term_1 == term_2
+
+    interner = OpTemplateInterner()
+    optemplate = interner(term_1 + 2*term_2)
+    shared_term = optemplate.children[0]
+    assert optemplate.children[1].children[1] is shared_term
+    assert interner(make_term()) is shared_term
+
+    class BindingCounter(NodeCachingMapperMixin, IdentityMapper):
+        def __init__(self):
+            IdentityMapper.__init__(self)
+            self.binding_count = 0
+
+        def map_operator_binding(self, expr):
+            self.binding_count += 1
+            return IdentityMapper.map_operator_binding(self, expr)
+
+    counter = BindingCounter()
+    assert counter(optemplate) == optemplate
+    assert counter.binding_count == 2
+
+    # constants of different types compare equal, but must not be shared
+    from pymbolic.primitives import Quotient
+    int_quotient = interner(Quotient(1, 2)*Field("u"))
+    float_quotient = interner(Quotient(1.0, 2)*Field("u"))
+    assert int_quotient is not float_quotient
+    assert isinstance(float_quotient.children[0].numerator, float)
+
+    class QuotientCounter(NodeCachingMapperMixin, IdentityMapper):
+        def __init__(self):
+            IdentityMapper.__init__(self)
+            self.quotient_count = 0
+
+        def map_quotient(self, expr):
+            self.quotient_count += 1
+            return IdentityMapper.map_quotient(self, expr)
+
+    counter = QuotientCounter()
+    int_result = counter(int_quotient)
+    float_result = counter(float_quotient)
+    assert counter.quotient_count == 2
+    assert isinstance(float_result.children[0].numerator, float)
+    assert isinstance(int_result.children[0].numerator, int)
+
+
+
+
+def test_boundary_combiner_rank_boundaries():
+    """Check that the boundary combiner can keep rank boundary fluxes out
+    of the whole-domain flux, so that the rest need not wait for them."""
+    from hedge.flux import FluxScalarPlaceholder
+    from hedge.optemplate import (Field, BoundaryPair, get_flux_operator,
+            OperatorBinding, WholeDomainFluxOperator)
+    from hedge.optemplate.mappers import BoundaryCombiner, FluxCollector
+    from hedge.mesh import TAG_RANK_BOUNDARY
+
+    u = FluxScalarPlaceholder(0)
+    flux_op = get_flux_operator(u.int - u.ext)
+    field = Field("u")
+    optemplate = (flux_op(field)
+            + flux_op(BoundaryPair(field, Field("bc"), "outflow"))
+            + flux_op(BoundaryPair(
+                field, Field("from_rank_1"), TAG_RANK_BOUNDARY(1))))
+
+    class Mesh:
+        tag_to_boundary = {"outflow": [0]}
+
+    combined = BoundaryCombiner(Mesh(), combine_rank_boundaries=False)(
+            optemplate)
+
+    wdfluxes = []
+    rank_fluxes = []
+    for flux in FluxCollector()(combined):
+        if isinstance(flux, WholeDomainFluxOperator):
+            wdfluxes.append(flux)
+        else:
+            assert isinstance(flux, OperatorBinding)
+            rank_fluxes.append(flux)
+
+    wdflux, = wdfluxes
+    assert len(wdflux.interiors) == 1
+    assert [bi.bpair.tag for bi in wdflux.boundaries] == ["outflow"]
+
+    rank_flux, = rank_fluxes
+    assert rank_flux.field.tag == TAG_RANK_BOUNDARY(1)
+
+
+
+
+def test_pipelined_cg():
+    """Check that pipelined CG agrees with standard CG."""
+
+    from hedge.iterative import (OperatorBase, DiagonalPreconditioner,
+            CGStateContainer, PipelinedCGStateContainer)
+
+    n = 100
+    rng = numpy.random.RandomState(5)
+    a = rng.randn(n, n)
+    mat = numpy.dot(a, a.T) + n*numpy.diag(rng.rand(n))
+
+    class MatrixOperator(OperatorBase):
+        dtype = numpy.float64
+        shape = (n, n)
+
+        def __call__(self, operand):
+            return numpy.dot(mat, operand)
+
+    b = rng.randn(n)
+
+    for precon in [None, DiagonalPreconditioner(1/numpy.diag(mat))]:
+        solutions = []
+        iterations = []
+        for cg_class in [CGStateContainer, PipelinedCGStateContainer]:
+            cg = cg_class(MatrixOperator(), precon)
+            cg.reset(b, numpy.zeros(n))
+            solutions.append(cg.run(tol=1e-10))
+            iterations.append(cg.iterations)
+
+        for x in solutions:
+            assert la.norm(numpy.dot(mat, x) - b) < 1e-8*la.norm(b)
+
+        assert abs(iterations[0] - iterations[1]) <= 5
+
+    for cg_class in [CGStateContainer, PipelinedCGStateContainer]:
+        cg = cg_class(MatrixOperator())
+        cg.reset(numpy.zeros(n), numpy.zeros(n))
+        assert la.norm(cg.run()) == 0
+        assert cg.iterations == 0
+
+
+
+
+def test_multi_rhs_cg():
+    """Check that lockstep multi-RHS CG solves each system."""
+
+    from hedge.iterative import (OperatorBase, DiagonalPreconditioner,
+            MultiRHSCGStateContainer)
+    from hedge.tools import make_obj_array
+
+    n = 80
+    rng = numpy.random.RandomState(7)
+    a = rng.randn(n, n)
+    mat = numpy.dot(a, a.T) + n*numpy.diag(rng.rand(n))
+
+    operand_counts = set()
+
+    class MatrixOperator(OperatorBase):
+        dtype = numpy.float64
+        shape = (n, n)
+
+        def __call__(self, operands):
+            operand_counts.add(len(operands))
+            return make_obj_array([numpy.dot(mat, x) for x in operands])
+
+    # include a zero and a rescaled right-hand side
+    b = rng.randn(n)
+    bs = make_obj_array([b, rng.randn(n), numpy.zeros(n), 1e3*b])
+
+    cg = MultiRHSCGStateContainer(MatrixOperator(),
+            DiagonalPreconditioner(1/numpy.diag(mat)))
+    cg.reset(bs)
+    xs = cg.run(tol=1e-10)
+
+    for x, b in zip(xs, bs):
+        assert la.norm(numpy.dot(mat, x) - b) <= 1e-8*la.norm(b)
+
+    assert cg.iterations[0] == cg.iterations[3]
+
+    # converged systems are padded, so the operator always sees all of them
+    assert operand_counts == set([len(bs)])
+
+
+
+
+def test_space_filling_curve_orders():
+    """Check that the Hilbert order steps between neighboring cells of a
+    grid, and that both curve orders renumber mesh elements."""
+    from hedge.mesh.tools import hilbert_order, morton_order
+
+    rng = numpy.random.RandomState(11)
+    for dim in [2, 3]:
+        n = 8
+        cells = numpy.array(numpy.meshgrid(*[numpy.arange(n)]*dim)) \
+                .reshape(dim, -1).T.astype(numpy.float64)
+        cells = cells[rng.permutation(len(cells))]
+
+        order = hilbert_order(cells, bits=3)
+        assert sorted(order) == range(len(cells))
+        steps = numpy.sum(numpy.abs(numpy.diff(cells[order], axis=0)), axis=1)
+        assert (steps == 1).all()
+
+        order = morton_order(cells, bits=3)
+        assert sorted(order) == range(len(cells))
+        assert (cells[order][:2**dim] < 2).all()
+
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(max_area=0.05)
+    for method in ["hilbert", "morton"]:
+        reordered = mesh.reordered_by(method)
+        assert len(reordered.elements) == len(mesh.elements)
+        assert len(reordered.interfaces) == len(mesh.interfaces)
+
+
+
 # main program ----------------------------------------------------------------
 if __name__ == "__main__":
     import sys
@@ -1019,6 +1019,850 @@ def test_elliptic():
 
 
 
+def test_elliptic_preconditioners():
+    """Check the block-Jacobi and p-multigrid preconditioners for CG."""
+
+    from hedge.mesh import TAG_ALL, TAG_NONE
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.1, faces=20)
+
+    from hedge.backends import CPURunContext
+    rcon = CPURunContext()
+
+    from hedge.data import ConstantGivenFunction
+    from hedge.models.poisson import PoissonOperator
+    op = PoissonOperator(2,
+            dirichlet_tag=TAG_ALL,
+            dirichlet_bc=ConstantGivenFunction(0),
+            neumann_tag=TAG_NONE)
+
+    orders = [4, 2, 1]
+    discrs = [rcon.make_discretization(mesh, order=order,
+        debug=discr_class.noninteractive_debug_flags())
+        for order in orders]
+    neg_ops = [-op.bind(discr) for discr in discrs]
+    discr = discrs[0]
+
+    from hedge.iterative import (extract_element_blocks,
+            BlockJacobiPreconditioner, PMultigridPreconditioner,
+            CGStateContainer)
+
+    # compare extracted blocks against a dense matrix
+    from hedge.tools import unit_vector
+    coarse_discr = discrs[-1]
+    n = len(coarse_discr)
+    mat = numpy.zeros((n, n))
+    for j in range(n):
+        mat[:, j] = neg_ops[-1](unit_vector(n, j))
+
+    eg_blocks, = extract_element_blocks(coarse_discr, neg_ops[-1])
+    eg, = coarse_discr.element_groups
+    for i_el, el_slice in enumerate(eg.ranges):
+        assert la.norm(eg_blocks[i_el] - mat[el_slice, el_slice]) < 1e-10
+
+    rhs = neg_ops[0].sub_op.prepare_rhs(
+            discr.interpolate_volume_function(lambda x, el: 1))
+
+    def solve(precon):
+        cg = CGStateContainer(neg_ops[0], precon,
+                dot=discr.nodewise_dot_product)
+        cg.reset(rhs, discr.volume_zeros())
+        return cg.run(tol=1e-10), cg.iterations
+
+    sol, plain_its = solve(None)
+    sol_bj, bj_its = solve(
+            BlockJacobiPreconditioner(discr, neg_ops[0]))
+    sol_mg, mg_its = solve(
+            PMultigridPreconditioner(discrs, neg_ops))
+
+    assert bj_its < plain_its
+    assert mg_its < bj_its
+    for other_sol in [sol_bj, sol_mg]:
+        assert discr.norm(other_sol-sol) < 1e-6*discr.norm(sol)
+
+    for d in discrs:
+        d.close()
+
+
+
+
+def test_block_sparse_assembly():
+    """Check assembled elliptic operators against their matrix-free form."""
+
+    from hedge.mesh import TAG_ALL, TAG_NONE
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.1, faces=20)
+
+    from hedge.backends import CPURunContext
+    rcon = CPURunContext()
+    discr = rcon.make_discretization(mesh, order=2,
+            debug=discr_class.noninteractive_debug_flags())
+
+    from hedge.data import ConstantGivenFunction
+    from hedge.models.poisson import PoissonOperator
+    from hedge.second_order import LDGSecondDerivative, IPDGSecondDerivative
+    from hedge.tools.assembly import assemble_block_sparse
+
+    for scheme, stencil_distance in [
+            (LDGSecondDerivative(), 2),
+            (IPDGSecondDerivative(), 1)]:
+        bound_op = PoissonOperator(2,
+                dirichlet_tag=TAG_ALL,
+                dirichlet_bc=ConstantGivenFunction(0),
+                neumann_tag=TAG_NONE,
+                scheme=scheme).bind(discr)
+
+        mat = assemble_block_sparse(discr, bound_op,
+                stencil_distance=stencil_distance)
+
+        for i in range(5):
+            x = numpy.random.randn(len(discr))
+            op_result = bound_op(x)
+            assert la.norm(mat(x) - op_result) < 1e-10*la.norm(op_result)
+
+    discr.close()
+
+
+
+
+def test_poisson_multi_rhs():
+    """Check applying and solving the Poisson operator for multiple
+    right-hand sides at once."""
+
+    from hedge.mesh import TAG_ALL, TAG_NONE
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.1, faces=20)
+
+    from hedge.backends import CPURunContext
+    rcon = CPURunContext()
+    discr = rcon.make_discretization(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+
+    from hedge.data import ConstantGivenFunction
+    from hedge.models.poisson import PoissonOperator
+    bound_op = PoissonOperator(2,
+            dirichlet_tag=TAG_ALL,
+            dirichlet_bc=ConstantGivenFunction(0),
+            neumann_tag=TAG_NONE).bind(discr)
+
+    from hedge.tools import make_obj_array
+    us = make_obj_array([numpy.random.randn(len(discr)) for i in range(3)])
+    block_result = bound_op(us)
+    for u, result in zip(us, block_result):
+        assert la.norm(result - bound_op(u)) < 1e-12*la.norm(result)
+
+    bs = make_obj_array([
+        bound_op.prepare_rhs(discr.interpolate_volume_function(
+            lambda x, el: x[0]**i))
+        for i in range(3)])
+
+    from hedge.iterative import parallel_cg, parallel_multi_rhs_cg
+    xs = parallel_multi_rhs_cg(rcon, -bound_op, -bs, tol=1e-10,
+            dot=discr.nodewise_dot_product)
+    for x, b in zip(xs, bs):
+        x_single = parallel_cg(rcon, -bound_op, -b, tol=1e-10,
+                dot=discr.nodewise_dot_product)
+        assert discr.norm(x - x_single) < 1e-7*discr.norm(x_single)
+
+    discr.close()
+
+
+
+
+def test_ensemble_execution():
+    """Check that evaluating an operator on an ensemble of states matches
+    evaluating it on each member."""
+
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.05)
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+
+    from hedge.models.em import TEMaxwellOperator
+    op = TEMaxwellOperator(epsilon=1, mu=1, flux_type=1)
+    rhs = op.bind(discr)
+
+    from hedge.tools import join_fields
+    from hedge.backends.jit import make_ensemble, EnsembleArray
+    member_count = 4
+    w = make_ensemble([
+        join_fields(*[numpy.random.randn(len(discr)) for i in range(3)])
+        for m in range(member_count)])
+
+    def member(w, i):
+        return join_fields(*[w_j[i] for w_j in w])
+
+    rhs_ensemble = rhs(0, w)
+    for r_ens in rhs_ensemble:
+        assert isinstance(r_ens, EnsembleArray)
+
+    for i in range(member_count):
+        rhs_member = rhs(0, member(w, i))
+        for r_ens, r_mem in zip(rhs_ensemble, rhs_member):
+            assert la.norm(r_ens[i] - r_mem) < 1e-12*la.norm(r_mem)
+
+    from hedge.timestep.runge_kutta import LSRK4TimeStepper
+    stepper = LSRK4TimeStepper()
+    stepper_0 = LSRK4TimeStepper()
+    w_0 = member(w, 0)
+    dt = 1e-3
+    for step in range(3):
+        w = stepper(w, step*dt, dt, rhs)
+        w_0 = stepper_0(w_0, step*dt, dt, rhs)
+
+    for w_j, w_0_j in zip(w, w_0):
+        assert isinstance(w_j, EnsembleArray)
+        assert la.norm(w_j[0] - w_0_j) < 1e-12*la.norm(w_0_j)
+
+    discr.close()
+
+
+
+
+def test_probe_sampler():
+    """Check batched point interpolation and the probe time series
+    output against single-point evaluation."""
+
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.05)
+    discr = discr_class(mesh, order=4,
+            debug=discr_class.noninteractive_debug_flags())
+
+    from hedge.probe import ProbeSampler, make_line_points, read_probe_data
+    points = make_line_points([-0.3, -0.1], [0.3, 0.2], 7)
+
+    from hedge.tools import join_fields
+    fields = join_fields(
+            discr.interpolate_volume_function(lambda x, el: x[0]**2*x[1]),
+            discr.interpolate_volume_function(lambda x, el: 1-x[1]))
+
+    interp = discr.get_point_interpolator(points)
+    values = interp(fields)
+    assert values.shape == (2, len(points))
+
+    for i, point in enumerate(points):
+        assert la.norm(values[:, i]
+                - discr.get_point_evaluator(point)(fields)) < 1e-12
+        assert abs(values[0, i] - point[0]**2*point[1]) < 1e-12
+
+    import os
+    from tempfile import mkdtemp
+    from shutil import rmtree
+    temp_dir = mkdtemp()
+    try:
+        filename = os.path.join(temp_dir, "probes.dat")
+        sampler = ProbeSampler(discr, points, filename, buffer_size=3)
+        for step in range(5):
+            sampler(0.1*step, step*fields)
+        sampler.close()
+
+        read_points, times, read_values = read_probe_data(filename)
+        assert (read_points == points).all()
+        assert la.norm(times - 0.1*numpy.arange(5)) < 1e-15
+        assert read_values.shape == (5, 2, len(points))
+        assert la.norm(read_values[3] - 3*values) < 1e-12
+    finally:
+        rmtree(temp_dir)
+
+    discr.close()
+
+
+
+
+def test_bind_specialization():
+    """Check that specializing an operator against zero and
+    time-independent inputs and empty boundaries leaves its result
+    unchanged."""
+
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.05)
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+
+    from hedge.data import make_tdep_constant, make_tdep_given
+    from hedge.models.wave import StrongWaveOperator
+    from hedge.mesh import TAG_ALL, TAG_NONE
+    op = StrongWaveOperator(-1, discr.dimensions,
+            source_f=make_tdep_given(lambda x, el: x[0]),
+            dirichlet_tag=TAG_ALL,
+            dirichlet_bc_f=make_tdep_constant(0),
+            neumann_tag=TAG_NONE,
+            radiation_tag=TAG_NONE)
+
+    from hedge.models import BindSpecializer
+    specializer = BindSpecializer(discr)
+    specializer.add_boundary_data("dir_bc_u", op.dirichlet_bc_f,
+            TAG_ALL, prune_zero=True)
+    specializer.add_volume_data("source_u", op.source_f, prune_zero=True)
+    specializer.compile(op.op_template())
+
+    report = specializer.get_report()
+    assert "dir_bc_u: identically zero" in report
+    assert "source_u: time-independent" in report
+    assert ("boundary '%s': empty" % TAG_NONE) in report
+    assert set(specializer.get_data(0.5)) == set(["source_u"])
+
+    from hedge.tools import join_fields
+    w = join_fields(*[
+        discr.interpolate_volume_function(
+            lambda x, el, i=i: numpy.sin((i+1)*x[0]+x[1]))
+        for i in range(discr.dimensions+1)])
+
+    rhs = op.bind(discr)
+    ref_op = discr.compile(op.op_template())
+    ref_result = ref_op(w=w,
+            dir_bc_u=op.dirichlet_bc_f.boundary_interpolant(
+                0.5, discr, TAG_ALL),
+            source_u=op.source_f.volume_interpolant(0.5, discr))
+
+    for rhs_i, ref_i in zip(rhs(0.5, w), ref_result):
+        assert la.norm(rhs_i - ref_i) < 1e-12*la.norm(ref_i)
+
+    discr.close()
+
+
+
+
+def test_fused_flux_lift():
+    """Check that the fused flux gather-and-lift kernels, with and without
+    interior and boundary fluxes combined into one kernel, give the same
+    result as gathering and lifting in separate stages."""
+
+    def boundary_tagger(vertices, el, face_nr, all_v):
+        if el.face_normals[face_nr][0] > 0:
+            return ["pec"]
+        else:
+            return ["absorb"]
+
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.05,
+            boundary_tagger=boundary_tagger)
+
+    from hedge.models.em import TEMaxwellOperator
+    op = TEMaxwellOperator(epsilon=1, mu=1, flux_type=0.5,
+            pec_tag="pec", absorb_tag="absorb")
+
+    results = []
+    for extra_flags in [
+            [],
+            ["jit_no_whole_domain_flux"],
+            ["jit_no_fused_flux_lift"]]:
+        discr = discr_class(mesh, order=4,
+                debug=discr_class.noninteractive_debug_flags()
+                | set(extra_flags))
+
+        from hedge.tools import join_fields, count_subset
+        fields = join_fields(*[
+            discr.interpolate_volume_function(
+                lambda x, el, i=i: numpy.sin((i+1)*x[0]+x[1]))
+            for i in range(count_subset(op.get_eh_subset()))])
+
+        results.append(op.bind(discr)(0, fields))
+        discr.close()
+
+    two_stage_result = results[-1]
+    for fused_result in results[:-1]:
+        for fused_i, two_stage_i in zip(fused_result, two_stage_result):
+            assert la.norm(fused_i - two_stage_i) < 1e-12*la.norm(two_stage_i)
+
+
+
+
+def test_flux_instrumentation():
+    """Check that instrumented runs count the work of gathering and
+    lifting fluxes, whether or not the two are fused into one kernel."""
+
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.05)
+
+    from hedge.models.em import TEMaxwellOperator
+    op = TEMaxwellOperator(epsilon=1, mu=1, flux_type=1)
+
+    for extra_flags in [
+            [],
+            ["jit_no_whole_domain_flux"],
+            ["jit_no_fused_flux_lift"]]:
+        discr = discr_class(mesh, order=3,
+                debug=discr_class.noninteractive_debug_flags()
+                | set(extra_flags))
+
+        from pytools.log import LogManager
+        logmgr = LogManager(None, "w")
+        discr.add_instrumentation(logmgr, calibrate_bandwidth=False)
+
+        from hedge.tools import join_fields
+        fields = join_fields(*[
+            discr.interpolate_volume_function(
+                lambda x, el, i=i: numpy.sin((i+1)*x[0]+x[1]))
+            for i in range(3)])
+
+        op.bind(discr)(0, fields)
+
+        for counter in [
+                discr.gather_counter,
+                discr.gather_flop_counter,
+                discr.gather_byte_counter,
+                discr.lift_counter,
+                discr.lift_flop_counter,
+                discr.lift_byte_counter]:
+            assert counter.events > 0, (extra_flags, counter.name)
+
+        logmgr.close()
+        discr.close()
+
+
+
+
+def test_operator_execution_profile():
+    """Check that running a bound operator with the ``profile_op_code``
+    debug flag records each instruction of both the dynamic and the
+    static schedule."""
+
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.05)
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags()
+            | set(["profile_op_code"]))
+
+    from hedge.models.em import TEMaxwellOperator
+    op = TEMaxwellOperator(epsilon=1, mu=1, flux_type=1)
+    rhs = op.bind(discr)
+    profile = discr.execution_profiles[-1]
+
+    from hedge.tools import join_fields
+    fields = join_fields(*[
+        discr.interpolate_volume_function(
+            lambda x, el, i=i: numpy.sin((i+1)*x[0]+x[1]))
+        for i in range(3)])
+
+    # the first run schedules dynamically, the second one replays
+    # the recorded schedule
+    rhs(0, fields)
+    rhs(0, fields)
+    assert profile.run_count == 2
+
+    from hedge.compiler import Assign
+    report = profile.get_report().split("\n")
+    assert profile.insn_stats
+    for insn, stats in profile.insn_stats.iteritems():
+        assert stats.count == 2
+        assert stats.time >= 0
+
+        for insn_line in str(insn).split("\n"):
+            assert "    " + insn_line in report
+
+        if isinstance(insn, Assign):
+            for name, expr in zip(insn.names, insn.exprs):
+                assert [line for line in report
+                        if name in line and str(expr) in line]
+
+    trace = profile.get_chrome_trace()
+    events = trace["traceEvents"]
+    assert len(events) == sum(
+            stats.count + stats.future_count
+            for stats in profile.insn_stats.itervalues())
+    for event in events:
+        assert event["ph"] == "X"
+        assert event["pid"] == 0
+        assert event["dur"] >= 0
+
+    labels = set(event["name"] for event in events)
+    for insn in profile.insn_stats:
+        assert profile.get_label(insn) in labels
+
+    from StringIO import StringIO
+    import json
+    outf = StringIO()
+    profile.write_chrome_trace(outf)
+    assert json.loads(outf.getvalue()) == trace
+
+    discr.close()
+
+
+
+
+def test_assignment_aggregation():
+    """Check that assignment aggregation on a multi-field operator gives
+    the instruction stream of a direct, uncached greedy aggregation."""
+
+    from hedge.mesh.generator import make_disk_mesh
+    mesh = make_disk_mesh(r=0.5, max_area=0.05)
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+
+    from pymbolic.primitives import Variable
+    from hedge.compiler import Assign
+    from hedge.tools import is_zero
+    from hedge.backends.jit.compiler import OperatorCompiler
+
+    class ReferenceCompiler(OperatorCompiler):
+        def aggregate_assignments(self, instructions, result):
+            origins_map = dict(
+                    (assignee, insn)
+                    for insn in instructions
+                    for assignee in insn.get_assignees())
+
+            def get_origins(insn):
+                return set(origins_map[dep.name]
+                        for dep in insn.get_dependencies()
+                        if isinstance(dep, Variable)
+                        and dep.name in origins_map)
+
+            def get_indirect_origins(insn):
+                result = set()
+                stack = [origin
+                        for dep_origin in get_origins(insn)
+                        for origin in get_origins(dep_origin)]
+                while stack:
+                    origin = stack.pop()
+                    if origin not in result:
+                        result.add(origin)
+                        stack.extend(get_origins(origin))
+                return result
+
+            def get_var_assignees(insn):
+                return set(Variable(name) for name in insn.get_assignees())
+
+            assigns = [insn for insn in instructions
+                    if isinstance(insn, Assign)]
+            other_insns = [insn for insn in instructions
+                    if not isinstance(insn, Assign)]
+            processed = [ass for ass in assigns if ass.flop_count() == 0]
+            unprocessed = [ass for ass in assigns if ass.flop_count() != 0]
+
+            i = 0
+            while i < len(unprocessed):
+                if [expr for expr in unprocessed[i].exprs if is_zero(expr)]:
+                    processed.append(unprocessed.pop())
+                else:
+                    i += 1
+
+            while unprocessed:
+                my_assign = unprocessed.pop()
+                my_deps = my_assign.get_dependencies()
+
+                for i, other_assign in enumerate(unprocessed):
+                    other_deps = other_assign.get_dependencies()
+                    if other_assign.priority != my_assign.priority:
+                        continue
+                    if not (my_deps & other_deps
+                            or my_deps & get_var_assignees(other_assign)
+                            or other_deps & get_var_assignees(my_assign)):
+                        continue
+
+                    if (len(set(my_assign.get_assignees())
+                            | set(other_assign.get_assignees()))
+                            + len(my_assign.get_dependencies(each_vector=True)
+                                | other_assign.get_dependencies(
+                                    each_vector=True))
+                            > self.max_vectors_in_batch_expr):
+                        continue
+
+                    if (my_assign in get_indirect_origins(other_assign)
+                            or other_assign in get_indirect_origins(my_assign)):
+                        continue
+
+                    names = my_assign.names + other_assign.names
+                    merged = Assign(
+                            names=names,
+                            exprs=my_assign.exprs + other_assign.exprs,
+                            _dependencies=(my_deps | other_deps)
+                                - set(Variable(name) for name in names),
+                            dep_mapper_factory=self.dep_mapper_factory,
+                            priority=max(my_assign.priority,
+                                other_assign.priority))
+                    del unprocessed[i]
+                    unprocessed.append(merged)
+                    for name in names:
+                        origins_map[name] = merged
+                    break
+                else:
+                    processed.append(my_assign)
+
+            self.reference_assignees = [
+                    sorted(ass.names) for ass in processed]
+            self.reference_other_insns = other_insns
+
+            self.aggregated = OperatorCompiler.aggregate_assignments(
+                    self, instructions, result)
+            return self.aggregated
+
+    from hedge.models.em import TEMaxwellOperator
+    op = TEMaxwellOperator(epsilon=1, mu=1, flux_type=1)
+
+    from hedge.optemplate import process_optemplate
+    compiler = ReferenceCompiler(discr)
+    compiler(process_optemplate(op.op_template(), mesh=discr.mesh))
+
+    assign_count = len(compiler.reference_assignees)
+    assert [len(names) for names in compiler.reference_assignees
+            if len(names) > 1]
+    assert ([sorted(insn.names)
+            for insn in compiler.aggregated[:assign_count]]
+            == compiler.reference_assignees)
+    assert (compiler.aggregated[assign_count:]
+            == compiler.reference_other_insns)
+
+    discr.close()
+
+
+
+
+def test_specialized_element_kernels():
+    """Check that the element kernels specialized for the element size
+    agree with the generic ones."""
+    from hedge.mesh.generator import make_disk_mesh
+    from hedge.discretization.local import TriangleDiscretization
+    from hedge.backends.jit.diff import JitDifferentiator
+    from hedge.backends.jit.lift import JitLifter
+    from hedge.backends.jit.elwise import JitElementwiseLinear
+    from hedge.optemplate import \
+            ReferenceDifferentiationOperator, MassOperator
+    from hedge._internal import perform_elwise_scaled_operator
+
+    mesh = make_disk_mesh(r=0.5, max_area=0.05)
+
+    # at order 7, the differentiation matrices exceed the unroll limit
+    for order in [1, 3, 7]:
+        discr = discr_class(mesh, TriangleDiscretization(order),
+                debug=discr_class.noninteractive_debug_flags())
+
+        field = numpy.random.randn(len(discr))
+
+        # differentiation
+        diff_ops = [ReferenceDifferentiationOperator(i)
+                for i in range(discr.dimensions)]
+        generic = JitDifferentiator(discr)(diff_ops, field)
+        specialized = JitDifferentiator(discr, specialize=True)(
+                diff_ops, field)
+        for g, s in zip(generic, specialized):
+            assert la.norm(g - s) < 1e-12*la.norm(g)
+
+        # lifting
+        fg = discr.face_groups[0]
+        fof = numpy.random.randn(
+                fg.face_count*fg.face_length()*fg.element_count())
+        for scaling in [None, fg.local_el_inverse_jacobians]:
+            generic = discr.volume_zeros()
+            specialized = discr.volume_zeros()
+            JitLifter(discr)(fg, fg.ldis_loc.lifting_matrix(),
+                    scaling, fof, generic)
+            JitLifter(discr, specialize=True)(fg,
+                    fg.ldis_loc.lifting_matrix(), scaling, fof, specialized)
+            assert la.norm(generic - specialized) < 1e-12*la.norm(generic)
+
+        # elementwise linear operators
+        generic = discr.volume_zeros()
+        specialized = discr.volume_zeros()
+        for eg in discr.element_groups:
+            perform_elwise_scaled_operator(eg.ranges, eg.ranges,
+                    MassOperator.coefficients(eg), MassOperator.matrix(eg),
+                    field, generic)
+        JitElementwiseLinear(discr)(MassOperator(), field, specialized)
+        assert la.norm(generic - specialized) < 1e-12*la.norm(generic)
+
+        discr.close()
+
+
+
+
+def test_cfl_timestep():
+    """Check the elementwise CFL time step against a loop over the elements,
+    for both nodal wave speeds and their elementwise maximum."""
+    from hedge.mesh.generator import make_disk_mesh
+    from hedge.optemplate import Field, ElementwiseMaxOperator
+
+    mesh = make_disk_mesh(r=0.5, max_area=0.02)
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+
+    speed = discr.interpolate_volume_function(
+            lambda x, el: 1 + 5*x[0]**2)
+    el_max_speed = discr.compile(ElementwiseMaxOperator()(Field("c")))(
+            c=speed)
+
+    geometric_factors = discr.element_dt_geometric_factors()
+
+    for diffusivity in [0, 0.1]:
+        ref_dt = numpy.inf
+        for eg in discr.element_groups:
+            ng_factor = eg.local_discretization.dt_non_geometric_factor()
+            for el, el_slice in zip(eg.members, eg.ranges):
+                factor = ng_factor*geometric_factors[el.id]
+                ref_dt = min(ref_dt, factor/(
+                    numpy.max(speed[el_slice])
+                    + diffusivity/factor))
+
+        for speed_field in [speed, el_max_speed]:
+            dt = discr.cfl_timestep(speed_field, diffusivity)
+            assert abs(dt - ref_dt) < 1e-13*ref_dt
+
+    # with constant speed, this reduces to the global estimate
+    dt = discr.cfl_timestep(2*discr.volume_zeros()+2)
+    global_dt = (discr.dt_non_geometric_factor()
+            * discr.dt_geometric_factor() / 2)
+    assert abs(dt - global_dt) < 1e-13*global_dt
+
+    discr.close()
+
+
+
+
+def test_lts_class_restricted_rhs():
+    """Check that evaluating an operator on some rate classes only
+    reproduces the full right-hand side there, at less work."""
+    from hedge.mesh.generator import make_disk_mesh
+    from hedge.models.advection import StrongAdvectionOperator
+    from hedge.data import TimeDependentGivenFunction
+    from hedge.timestep.multirate_ab.lts import \
+            bin_elements_by_rate, ClassRestrictedRHS
+
+    v = numpy.array([0.27, 0.1])
+
+    def boundary_tagger(vertices, el, face_nr, all_v):
+        if numpy.dot(el.face_normals[face_nr], v) < 0:
+            return ["inflow"]
+        else:
+            return ["outflow"]
+
+    mesh = make_disk_mesh(r=0.5, max_area=0.01,
+            boundary_tagger=boundary_tagger)
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+
+    op = StrongAdvectionOperator(v,
+            inflow_u=TimeDependentGivenFunction(
+                lambda x, el, t: numpy.sin(x[0]-t)))
+
+    # the largest tenth of the elements go into class 0
+    factors = discr.element_dt_geometric_factors()
+    classification = bin_elements_by_rate(discr, max_class_count=2,
+            reference_dt_factor=numpy.percentile(factors, 90))
+    assert classification.class_count == 2
+
+    rhs = ClassRestrictedRHS(discr, classification, op.bind)
+
+    u = discr.interpolate_volume_function(
+            lambda x, el: numpy.sin(3*x[0])*numpy.cos(2*x[1]))
+    full = op.bind(discr)(0.1, u)
+
+    for classes in [
+            classification.classes[:1],
+            classification.classes[1:],
+            classification.classes]:
+        restricted = rhs(0.1, u, classes)
+        for rc in classes:
+            assert (la.norm(restricted[rc.dof_indices] - full[rc.dof_indices])
+                    < 1e-12*la.norm(full))
+
+    assert (rhs.get_element_count(classification.classes[:1])
+            < classification.element_count)
+
+    discr.close()
+
+
+
+
+def test_lts_class_restricted_second_order_rhs():
+    """Check that evaluating a second-order operator on some rate classes
+    only reproduces the full right-hand side there if two layers of
+    neighbors are included."""
+    from hedge.mesh.generator import make_disk_mesh
+    from hedge.models.diffusion import DiffusionOperator
+    from hedge.timestep.multirate_ab.lts import \
+            bin_elements_by_rate, ClassRestrictedRHS
+
+    mesh = make_disk_mesh(r=0.5, max_area=0.01,
+            boundary_tagger=lambda vertices, el, face_nr, all_v:
+                ["dirichlet"])
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+
+    op = DiffusionOperator(discr.dimensions)
+
+    factors = discr.element_dt_geometric_factors()
+    classification = bin_elements_by_rate(discr, max_class_count=2,
+            reference_dt_factor=numpy.percentile(factors, 90))
+    assert classification.class_count == 2
+
+    u = discr.interpolate_volume_function(
+            lambda x, el: numpy.sin(3*x[0])*numpy.cos(2*x[1]))
+    full = op.bind(discr)(0, u)
+
+    def get_error(halo_depth, rc):
+        rhs = ClassRestrictedRHS(discr, classification, op.bind,
+                halo_depth=halo_depth)
+        restricted = rhs(0, u, [rc])
+        return la.norm(restricted[rc.dof_indices] - full[rc.dof_indices])
+
+    for rc in classification.classes:
+        assert get_error(2, rc) < 1e-12*la.norm(full)
+
+    # one layer misses the neighbors of neighbors
+    assert get_error(1, classification.classes[0]) > 1e-8*la.norm(full)
+
+    discr.close()
+
+
+
+
+def test_newton_krylov_imex_diffusion():
+    """Check the Jacobian-free Newton-Krylov implicit stage solver, driving
+    a DG diffusion operator, against solving the implicit stages directly
+    with the assembled operator matrix."""
+    from hedge.mesh.generator import make_disk_mesh
+    from hedge.models.diffusion import DiffusionOperator
+    from hedge.timestep.imex_rk import (KennedyCarpenterIMEXARK4,
+            NewtonKrylovImplicitSolver)
+
+    mesh = make_disk_mesh(r=0.5, max_area=0.1,
+            boundary_tagger=lambda vertices, el, face_nr, all_v:
+                ["dirichlet"])
+    discr = discr_class(mesh, order=3,
+            debug=discr_class.noninteractive_debug_flags())
+
+    rhs_impl = DiffusionOperator(discr.dimensions).bind(discr)
+
+    # with homogeneous boundary conditions, the operator is linear
+    n = len(discr)
+    matrix = numpy.empty((n, n))
+    for i in range(n):
+        unit = discr.volume_zeros()
+        unit[i] = 1
+        matrix[:, i] = rhs_impl(0, unit)
+
+    def rhs_impl_reference(t, y0, alpha):
+        return la.solve(numpy.eye(n) - alpha*matrix, numpy.dot(matrix, y0))
+
+    source = discr.interpolate_volume_function(
+            lambda x, el: numpy.cos(3*x[0]))
+
+    def rhs_expl(t, y):
+        return numpy.sin(t)*source
+
+    nk_solver = NewtonKrylovImplicitSolver(rhs_impl,
+            newton_tol=1e-10, krylov_tol=1e-10, gmres_restart=n)
+
+    y_nk = y_ref = discr.interpolate_volume_function(
+            lambda x, el: numpy.exp(-10*numpy.dot(x, x)))
+    stepper_nk = KennedyCarpenterIMEXARK4()
+    stepper_ref = KennedyCarpenterIMEXARK4()
+
+    t = 0
+    dt = 0.01
+    for i in range(10):
+        y_nk = stepper_nk(y_nk, t, dt, rhs_expl, nk_solver)
+        y_ref = stepper_ref(y_ref, t, dt, rhs_expl, rhs_impl_reference)
+        t += dt
+
+    assert la.norm(y_nk - y_ref) < 1e-7*la.norm(y_ref)
+    assert nk_solver.krylov_iterations > 0
+
+    discr.close()
+
+
+
+
 def test_projection():
     """Test whether projection between different orders works"""
 